@@ -0,0 +1,201 @@
+"""Асинхронный режим API: ASGI-приложение и async-точка входа поверх обработчиков index.py"""
+import asyncio
+import base64
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+import asyncpg
+import psycopg2.pool
+
+import index
+import privacy
+from router import Router
+
+ASYNC_POOL_SIZE = int(os.environ.get('ASYNC_POOL_SIZE', '10'))
+SYNC_WORKERS = int(os.environ.get('SYNC_WORKERS', '8'))
+
+pool = None
+sync_pool = None
+sync_executor = ThreadPoolExecutor(max_workers=SYNC_WORKERS)
+
+async def init_connection(conn):
+    for kind in ('json', 'jsonb'):
+        await conn.set_type_codec(kind, encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+async def startup():
+    global pool, sync_pool
+    if pool is None:
+        pool = await asyncpg.create_pool(os.environ['DATABASE_URL'], min_size=1, max_size=ASYNC_POOL_SIZE, init=init_connection)
+    if sync_pool is None:
+        sync_pool = psycopg2.pool.ThreadedConnectionPool(1, SYNC_WORKERS, os.environ['DATABASE_URL'])
+
+async def shutdown():
+    global pool, sync_pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+    if sync_pool is not None:
+        sync_pool.closeall()
+        sync_pool = None
+
+async def fetch(query):
+    async with pool.acquire() as conn:
+        return [dict(r) for r in await conn.fetch(query)]
+
+async def fetchrow(query):
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(query)
+        return dict(row) if row else None
+
+async def fetchval(query):
+    async with pool.acquire() as conn:
+        return await conn.fetchval(query)
+
+async def get_profile(params, user_id):
+    username = params.get('username', '').replace("'", "''")
+    user = await fetchrow("SELECT id, username, display_name, bio, avatar_url, is_private, is_verified, is_artist_verified, is_blocked, is_admin, role, links, %s, avatars, followers_count, following_count, created_at FROM users WHERE username = '%s'" % (', '.join(privacy.SETTINGS), username))
+    if not user or (user['is_blocked'] and (not user_id or user_id != user['id'])):
+        return index.resp(404, {'error': 'Аккаунт не найден или был удалён'})
+    index.with_privacy(user)
+    target = user['id']
+    posts_query = """
+        SELECT p.*, u.username, u.display_name, u.avatar_url, u.is_verified, u.is_artist_verified
+        FROM posts p JOIN users u ON p.user_id = u.id
+        WHERE p.user_id = %s AND p.is_removed = FALSE%s ORDER BY p.created_at DESC LIMIT 50
+    """ % (target, index.not_held_clause('p', user_id))
+    private = user['is_private'] and user_id != target
+    tasks = [
+        fetchval("SELECT COUNT(*) FROM posts WHERE user_id = %s AND is_removed = FALSE" % target),
+        fetchval("SELECT status FROM follows WHERE follower_id = %s AND following_id = %s" % (user_id, target)) if user_id else asyncio.sleep(0),
+        fetchval("SELECT id FROM user_blocks WHERE blocker_id = %s AND blocked_id = %s" % (user_id, target)) if user_id else asyncio.sleep(0),
+        asyncio.sleep(0) if private else fetch(posts_query),
+    ]
+    posts_count, follow_status, block_id, posts = await asyncio.gather(*tasks)
+    user['posts_count'] = posts_count
+    if user_id:
+        user['follow_status'] = follow_status or 'none'
+        user['is_blocked_by_me'] = block_id is not None
+    can_see = not private or follow_status == 'active'
+    if private and can_see:
+        posts = await fetch(posts_query)
+    user['can_see_posts'] = can_see
+    return index.resp(200, {'profile': user, 'posts': posts if can_see else []})
+
+async def admin_stats(params, user_id):
+    if not user_id:
+        return index.resp(401, {'error': 'Не авторизован'})
+    if not await fetchval("SELECT is_admin FROM users WHERE id = %s" % int(user_id)):
+        return index.resp(403, {'error': 'Нет прав'})
+    users, posts, reports, verifications, appeals = await asyncio.gather(
+        fetchval("SELECT COUNT(*) FROM users WHERE is_blocked = FALSE"),
+        fetchval("SELECT COUNT(*) FROM posts WHERE is_removed = FALSE"),
+        fetchval("SELECT COUNT(*) FROM reports WHERE status = 'pending'"),
+        fetchval("SELECT COUNT(*) FROM verification_requests WHERE status = 'pending'"),
+        fetchval("SELECT COUNT(*) FROM appeals WHERE status = 'pending'"),
+    )
+    return index.resp(200, {'users': users, 'posts': posts, 'reports': reports, 'verifications': verifications, 'appeals': appeals})
+
+async def get_sync_state(params, user_id):
+    """Long-poll без занятого потока и соединения: между опросами соединение возвращается в пул"""
+    if not user_id:
+        return index.resp(401, {'error': 'Не авторизован'})
+    since = int(params.get('since', 0))
+    deadline = time.time() + min(int(params.get('wait', 0)), index.SYNC_MAX_WAIT)
+    while True:
+        state = await fetchrow("SELECT version, last_notification_id, unread_notifications FROM sync_state WHERE user_id = %s" % int(user_id))
+        state = state or {'version': 0, 'last_notification_id': 0, 'unread_notifications': 0}
+        if state['version'] > since or time.time() >= deadline:
+            break
+        await asyncio.sleep(index.SYNC_POLL_INTERVAL)
+    conversations = []
+    if state['version'] > since:
+        other_clause = " AND other_id = %s" % int(params['user_id']) if params.get('user_id') else ""
+        conversations = await fetch("SELECT other_id as user_id, last_message_id, unread_count, version FROM conversation_state WHERE user_id = %s AND version > %s%s" % (
+            int(user_id), since, other_clause))
+    return index.resp(200, {
+        'version': state['version'],
+        'changed': state['version'] > since,
+        'notifications': {'last_id': state['last_notification_id'], 'unread': state['unread_notifications']},
+        'conversations': conversations,
+    })
+
+async_router = Router()
+async_router.add('GET', '/profile', get_profile)
+async_router.add('GET', '/users/{username}/profile', get_profile)
+async_router.add('GET', '/users/{username}/posts', get_profile)
+async_router.add('GET', '/admin/stats', admin_stats)
+async_router.add('GET', '/sync/state', get_sync_state)
+
+def run_sync(event):
+    conn = sync_pool.getconn()
+    index.request_ctx.conn = index.SharedConnection(conn)
+    try:
+        return index.handler(event, None)
+    finally:
+        conn.rollback()
+        index.request_ctx.conn = None
+        sync_pool.putconn(conn)
+
+async def handle(event):
+    """Асинхронный аналог index.handler: горячие чтения идут через asyncpg, остальное — в пуле потоков"""
+    await startup()
+    method = event.get('httpMethod', 'GET')
+    fn, path_params = async_router.match(method, event.get('path', '/'))
+    if fn is None:
+        return await asyncio.get_running_loop().run_in_executor(sync_executor, run_sync, event)
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    params = dict(event.get('queryStringParameters') or {}, **path_params)
+    user_id = index.get_user_from_token(headers)
+    retry_after = index.check_rate(method, event.get('path', '/'), user_id, index.client_ip(event, headers))
+    if retry_after:
+        return index.too_many(retry_after)
+    try:
+        result = await fn(params, user_id)
+    except Exception as e:
+        result = index.resp(500, {'error': str(e)})
+    return index.negotiate(result, method, headers)
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+    raw = await read_body(receive)
+    headers = {k.decode('latin-1'): v.decode('latin-1') for k, v in scope['headers']}
+    binary = headers.get('content-type', '').startswith('multipart/')
+    event = {
+        'httpMethod': scope['method'],
+        'path': scope['path'],
+        'queryStringParameters': dict(parse_qsl(scope.get('query_string', b'').decode('latin-1'))),
+        'headers': headers,
+        'body': base64.b64encode(raw).decode('ascii') if binary else raw.decode('utf-8'),
+        'isBase64Encoded': binary,
+    }
+    result = await handle(event)
+    body = result.get('body') or ''
+    payload = base64.b64decode(body) if result.get('isBase64Encoded') else body.encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': result['statusCode'],
+        'headers': [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in result['headers'].items()],
+    })
+    await send({'type': 'http.response.body', 'body': payload})
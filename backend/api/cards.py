@@ -0,0 +1,48 @@
+"""Карточки пользователей: LRU-кэш в памяти процесса с пакетной догрузкой промахов"""
+import threading
+import time
+from collections import OrderedDict
+
+class CardCache:
+    def __init__(self, max_entries=50000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'loads': 0}
+
+    def get_many(self, ids, load):
+        """Возвращает {id: карточка}; промахи догружаются одним вызовом load(список id)"""
+        found, missing = {}, []
+        now = time.monotonic()
+        with self.lock:
+            for i in ids:
+                entry = self.entries.get(i)
+                if entry and entry[0] > now:
+                    self.entries.move_to_end(i)
+                    found[i] = entry[1]
+                else:
+                    missing.append(i)
+            self.stats['hits'] += len(found)
+            self.stats['misses'] += len(missing)
+        if not missing:
+            return found
+        loaded = load(missing)
+        with self.lock:
+            self.stats['loads'] += 1
+            for i, card in loaded.items():
+                self.entries[i] = (now + self.ttl, card)
+                self.entries.move_to_end(i)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        found.update(loaded)
+        return found
+
+    def invalidate(self, *ids):
+        with self.lock:
+            for i in ids:
+                self.entries.pop(i, None)
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries))
@@ -1,33 +1,367 @@
 """Главный API-эндпоинт платформы Buzzy — авторизация, посты, профили, сообщения, админ-панель"""
 import json
 import os
+import re
+from urllib.parse import parse_qsl, unquote
+import gzip
+import base64
 import hashlib
 import secrets
 import time
+import threading
 import psycopg2
 import psycopg2.extras
+from router import Router
+from singleflight import SingleFlight
+from ratelimit import RateLimiter, PostgresBuckets, RedisBuckets
+from cards import CardCache
+from spam import SpamFilter, HELD
+import privacy
 
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*',
     'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-    'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Authorization, If-None-Match, X-Read-After',
+    'Access-Control-Expose-Headers': 'ETag, X-Write-Token, Retry-After',
     'Access-Control-Max-Age': '86400',
     'Content-Type': 'application/json'
 }
 
 tokens = {}
 
+FOLLOWING_BOOST = 2.0
+COMMENTS_PAGE_SIZE = 20
+COMMENTS_PAGE_LIMIT = 50
+COMPRESS_MIN_BYTES = 1024
+SYNC_MAX_WAIT = 25
+SYNC_POLL_INTERVAL = 1
+BATCH_MAX_REQUESTS = 20
+BATCH_WORKERS = 4
+READ_COALESCE_TTL = 1.0
+WARM_CONN_MAX_AGE = 60
+REPLICA_POOL_SIZE = 4
+REPLICA_MAX_LAG = 5
+REPLICA_CHECK_INTERVAL = 2
+CARD_CACHE_SIZE = 50000
+MESSAGES_PAGE_SIZE = 200
+NOTIFICATIONS_WINDOW_DAYS = 90
+TAG_FEED_PAGE_SIZE = 20
+MAX_TAGS_PER_POST = 10
+MAX_MENTIONS_PER_POST = 10
+TRENDING_WINDOW_HOURS = 24
+TRENDING_LIMIT = 20
+TRENDING_CACHE_TTL = 60
+
+HASHTAG_RE = re.compile(r'(?<![\w#])#(\w{1,100})')
+MENTION_RE = re.compile(r'(?<![\w@])@([\w.]{3,50})')
+CARD_CACHE_TTL = 300
+
+CARD_FIELDS = {f: f for f in ('username', 'display_name', 'avatar_url', 'is_verified', 'is_artist_verified')}
+ORIGINAL_CARD = {'username': 'original_username', 'display_name': 'original_display_name', 'avatar_url': 'original_avatar', 'is_verified': 'original_verified'}
+SENDER_CARD = {'username': 'sender_username', 'display_name': 'sender_name', 'avatar_url': 'sender_avatar'}
+RECEIVER_CARD = {'username': 'receiver_username', 'display_name': 'receiver_name'}
+NOTIFICATION_CARD = {'username': 'username', 'display_name': 'display_name', 'avatar_url': 'avatar_url'}
+
+TABLE_MEDIA_TYPE = 'application/vnd.buzzy.table+json'
+USER_LIST_COLUMNS = ['id'] + list(CARD_FIELDS)
+FOLLOW_REQUEST_COLUMNS = ['id', 'user_id', 'created_at'] + list(CARD_FIELDS)
+CHAT_COLUMNS = ['other_id', 'id', 'content', 'created_at', 'sender_id', 'unread_count', 'is_read'] + list(CARD_FIELDS)
+NOTIFICATION_COLUMNS = ['id', 'from_user_id', 'type', 'post_id', 'comment_id', 'created_at', 'is_read'] + list(NOTIFICATION_CARD)
+REPORT_PROJECTION = {
+    'id': 'r.id', 'reporter_id': 'r.reporter_id', 'reported_user_id': 'r.reported_user_id', 'reported_post_id': 'r.reported_post_id',
+    'reason': 'r.reason', 'created_at': 'r.created_at', 'reporter_username': 'ru.username', 'reported_username': 'tu.username',
+    'post_content': 'p.content',
+}
+VERIFICATION_PROJECTION = {
+    'id': 'v.id', 'user_id': 'v.user_id', 'type': 'v.type', 'created_at': 'v.created_at',
+    'username': 'u.username', 'display_name': 'u.display_name', 'avatar_url': 'u.avatar_url',
+}
+APPEAL_PROJECTION = {
+    'id': 'a.id', 'user_id': 'a.user_id', 'reason': 'a.reason', 'created_at': 'a.created_at',
+    'username': 'u.username', 'display_name': 'u.display_name', 'avatar_url': 'u.avatar_url',
+}
+
+RATE_LIMITS = {
+    'auth': (0.2, 10),
+    'like': (2, 30),
+    'view': (5, 60),
+    'search': (1, 20),
+    'write': (2, 40),
+    'batch': (1, 10),
+    'read': (20, 200),
+}
+
+UNTRACKED_WRITES = {'/batch', '/posts/view'}
+
+RATE_CLASSES = {
+    '/auth/register': 'auth',
+    '/auth/login': 'auth',
+    '/search': 'search',
+    '/users/search': 'search',
+    '/batch': 'batch',
+}
+
+def load_config():
+    return {
+        'database_url': os.environ.get('DATABASE_URL', ''),
+        'prewarm': os.environ.get('DB_PREWARM', '1') == '1',
+        'replica_urls': [u.strip() for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if u.strip()],
+        'rate_limits': dict(RATE_LIMITS, **{k: tuple(v) for k, v in json.loads(os.environ.get('RATE_LIMITS') or '{}').items()}),
+        'rate_limit_backend': os.environ.get('RATE_LIMIT_BACKEND', 'memory'),
+        'redis_url': os.environ.get('REDIS_URL', 'redis://localhost:6379/0'),
+    }
+
+CONFIG = load_config()
+
+trending_cache = {}
+request_ctx = threading.local()
+batch_pool = None
+reads = SingleFlight(ttl=READ_COALESCE_TTL)
+user_cards = CardCache(max_entries=CARD_CACHE_SIZE, ttl=CARD_CACHE_TTL)
+username_ids = CardCache(max_entries=CARD_CACHE_SIZE, ttl=CARD_CACHE_TTL)
+spam_filter = SpamFilter()
+brotli = None
+brotli_checked = False
+warm = {'conn': None, 'at': 0, 'thread': None}
+replica_pools = {}
+replica_lags = {}
+replica_lock = threading.Lock()
+warm_lock = threading.Lock()
+replica_turn = [0]
+last_writes = {}
+
+def make_limiter():
+    shared = None
+    if CONFIG['rate_limit_backend'] == 'postgres':
+        shared = PostgresBuckets(CONFIG['database_url'])
+    elif CONFIG['rate_limit_backend'] == 'redis':
+        shared = RedisBuckets(CONFIG['redis_url'])
+    return RateLimiter(CONFIG['rate_limits'], shared)
+
+limiter = make_limiter()
+
+class SharedConnection:
+    """Соединение, общее для подзапросов /batch: close() не закрывает его"""
+    def __init__(self, conn):
+        self.conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return self.conn.cursor(*args, **kwargs)
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        pass
+
+class PooledConnection(SharedConnection):
+    """Соединение из пула реплики: close() возвращает его в пул"""
+    def __init__(self, conn, pool):
+        self.conn = conn
+        self.pool = pool
+
+    def close(self):
+        if self.conn is None:
+            return
+        conn, self.conn = self.conn, None
+        try:
+            conn.rollback()
+            self.pool.putconn(conn)
+        except Exception:
+            self.pool.putconn(conn, close=True)
+
 def get_db():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+    shared = getattr(request_ctx, 'conn', None)
+    if shared:
+        return shared
+    read_after = getattr(request_ctx, 'read_after', None)
+    if read_after is not None and CONFIG['replica_urls']:
+        conn = get_replica_conn(read_after)
+        if conn:
+            return conn
+    with warm_lock:
+        pending = warm['thread']
+        if pending:
+            pending.join()
+            warm['thread'] = None
+        conn, warm['conn'] = warm['conn'], None
+        warmed_at = warm['at']
+    if conn is not None:
+        if not conn.closed and time.time() - warmed_at < WARM_CONN_MAX_AGE:
+            return conn
+        conn.close()
+    return psycopg2.connect(CONFIG['database_url'])
+
+def run_write(query):
+    """Выполняет серверную функцию записи за одно обращение к БД (без отдельных BEGIN/COMMIT) и возвращает её строку"""
+    conn = get_db()
+    single = not isinstance(conn, SharedConnection)
+    if single:
+        conn.autocommit = True
+    try:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute(query)
+        row = cur.fetchone()
+        if not single:
+            conn.commit()
+    finally:
+        conn.close()
+    return row
+
+def prewarm_db():
+    """Открывает соединение в фоне при инициализации модуля, до первого запроса"""
+    def connect():
+        try:
+            warm['conn'] = psycopg2.connect(CONFIG['database_url'])
+            warm['at'] = time.time()
+        except Exception:
+            warm['conn'] = None
+    warm['thread'] = threading.Thread(target=connect, daemon=True)
+    warm['thread'].start()
+
+def get_replica_pool(url):
+    pool = replica_pools.get(url)
+    if pool is None:
+        import psycopg2.pool
+        with replica_lock:
+            pool = replica_pools.get(url)
+            if pool is None:
+                pool = replica_pools[url] = psycopg2.pool.ThreadedConnectionPool(0, REPLICA_POOL_SIZE, url)
+    return pool
+
+def replica_lag(url):
+    """Отставание реплики в секундах (кэшируется на REPLICA_CHECK_INTERVAL); None — реплика недоступна"""
+    checked = replica_lags.get(url)
+    if checked and time.time() - checked[1] < REPLICA_CHECK_INTERVAL:
+        return checked[0]
+    lag = None
+    try:
+        pool = get_replica_pool(url)
+        conn = pool.getconn()
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                       ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0) END
+            """)
+            lag = float(cur.fetchone()[0] or 0)
+            conn.rollback()
+            pool.putconn(conn)
+        except Exception:
+            pool.putconn(conn, close=True)
+            raise
+    except Exception:
+        lag = None
+    replica_lags[url] = (lag, time.time())
+    return lag
+
+def get_replica_conn(read_after):
+    """Соединение с репликой для чтения; None — идти на primary.
+    read_after — время последней записи пользователя: пока реплика могла её не догнать, читаем с primary"""
+    urls = CONFIG['replica_urls']
+    start = replica_turn[0] % len(urls)
+    replica_turn[0] += 1
+    for url in urls[start:] + urls[:start]:
+        lag = replica_lag(url)
+        if lag is None or lag > REPLICA_MAX_LAG:
+            continue
+        if read_after and time.time() - read_after <= lag + REPLICA_CHECK_INTERVAL:
+            continue
+        pool = get_replica_pool(url)
+        try:
+            return PooledConnection(pool.getconn(), pool)
+        except Exception:
+            continue
+    return None
+
+def read_after_for(user_id, headers):
+    try:
+        token = float(headers.get('x-read-after') or 0)
+    except ValueError:
+        token = 0
+    return max(token, last_writes.get(user_id, 0) if user_id else 0)
+
+def get_brotli():
+    global brotli, brotli_checked
+    if not brotli_checked:
+        brotli_checked = True
+        try:
+            import brotli as module
+            brotli = module
+        except ImportError:
+            brotli = None
+    return brotli
 
 def resp(status, body):
     return {'statusCode': status, 'headers': CORS_HEADERS, 'body': json.dumps(body, default=str, ensure_ascii=False)}
 
+def wants_table(params, headers):
+    return params.get('format') == 'table' or TABLE_MEDIA_TYPE in headers.get('accept', '')
+
+def list_resp(key, columns, rows, **extra):
+    """Ответ со списком: по запросу компактного формата — {columns, rows} с массивами значений, иначе массив объектов"""
+    if not getattr(request_ctx, 'table', False):
+        response = resp(200, dict(extra, **{key: rows}))
+        return dict(response, headers=dict(response['headers'], Vary='Accept'))
+    if rows and isinstance(rows[0], dict):
+        rows = [[r.get(c) for c in columns] for r in rows]
+    body = dict(extra, **{key: {'columns': columns, 'rows': rows}})
+    headers = dict(CORS_HEADERS, **{'Content-Type': TABLE_MEDIA_TYPE, 'Vary': 'Accept'})
+    return {'statusCode': 200, 'headers': headers, 'body': json.dumps(body, default=str, ensure_ascii=False, separators=(',', ':'))}
+
+def fetch_listing(cur, projection, default_select, query):
+    """Строки списка: в компактном формате кортежи только с полями projection, иначе словари с default_select"""
+    if getattr(request_ctx, 'table', False):
+        cur = cur.connection.cursor()
+        cur.execute(query % ', '.join(projection.values()))
+    else:
+        cur.execute(query % default_select)
+    return cur.fetchall()
+
+def negotiate(response, method, headers):
+    if response['statusCode'] != 200 or not response['body']:
+        return response
+    raw = response['body'].encode('utf-8')
+    out_headers = dict(response['headers'])
+    etag = None
+    if method == 'GET':
+        etag = hashlib.sha256(raw).hexdigest()[:32]
+        client_tags = [t.strip().strip('"').split('-')[0] for t in headers.get('if-none-match', '').split(',')]
+        if etag in client_tags:
+            out_headers['ETag'] = '"%s"' % etag
+            return {'statusCode': 304, 'headers': out_headers, 'body': ''}
+    encoding = pick_encoding(headers.get('accept-encoding', '')) if len(raw) >= COMPRESS_MIN_BYTES else None
+    if etag:
+        out_headers['ETag'] = '"%s-%s"' % (etag, encoding) if encoding else '"%s"' % etag
+    if not encoding:
+        return {'statusCode': 200, 'headers': out_headers, 'body': response['body']}
+    data = get_brotli().compress(raw, quality=5) if encoding == 'br' else gzip.compress(raw, compresslevel=6)
+    out_headers['Content-Encoding'] = encoding
+    out_headers['Vary'] = ', '.join(v for v in (out_headers.get('Vary'), 'Accept-Encoding') if v)
+    return {'statusCode': 200, 'headers': out_headers, 'body': base64.b64encode(data).decode('ascii'), 'isBase64Encoded': True}
+
+def pick_encoding(accept_encoding):
+    offered = {}
+    for part in accept_encoding.lower().split(','):
+        name, _, q = part.replace(' ', '').partition(';q=')
+        try:
+            offered[name] = float(q) if q else 1.0
+        except ValueError:
+            continue
+    if offered.get('br', 0) > 0 and get_brotli():
+        return 'br'
+    if offered.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
 def hash_pw(pw):
     return hashlib.sha256(pw.encode()).hexdigest()
 
 def get_user_from_token(headers):
-    token = headers.get('x-authorization', headers.get('Authorization', ''))
+    token = headers.get('x-authorization') or headers.get('authorization', '')
     token = token.replace('Bearer ', '')
     if token in tokens:
         return tokens[token]
@@ -41,136 +375,98 @@ def handler(event, context):
     method = event.get('httpMethod', 'GET')
     path = event.get('path', '/')
     params = event.get('queryStringParameters') or {}
+    headers = event.get('headers', {})
+    headers = {k.lower(): v for k, v in headers.items()} if headers else {}
+    user_id = get_user_from_token(headers)
+
+    ip = client_ip(event, headers)
+    retry_after = check_rate(method, path, user_id, ip)
+    if retry_after:
+        return too_many(retry_after)
+
+    if method == 'POST' and path in UPLOAD_ROUTES:
+        return negotiate(UPLOAD_ROUTES[path](event, headers, user_id), method, headers)
+
     body = {}
     if event.get('body'):
         try:
             body = json.loads(event['body'])
         except:
             body = {}
-
-    headers = event.get('headers', {})
-    headers = {k.lower(): v for k, v in headers.items()} if headers else {}
-    user_id = get_user_from_token(headers)
-
+    request_ctx.read_after = read_after_for(user_id, headers) if method == 'GET' or path == '/batch' else None
+    request_ctx.table = method == 'GET' and wants_table(params, headers)
+    request_ctx.client_ip = ip
+    request_ctx.wrote = False
     try:
-        if path == '/auth/register' and method == 'POST':
-            return register(body)
-        elif path == '/auth/login' and method == 'POST':
-            return login(body)
-        elif path == '/auth/me' and method == 'GET':
-            return get_me(user_id)
-        elif path == '/feed' and method == 'GET':
-            return get_feed(params, user_id)
-        elif path == '/posts' and method == 'POST':
-            return create_post(body, user_id)
-        elif path == '/posts/view' and method == 'POST':
-            return view_post(body)
-        elif path == '/posts/like' and method == 'POST':
-            return like_post(body, user_id)
-        elif path == '/posts/repost' and method == 'POST':
-            return repost(body, user_id)
-        elif path == '/posts/remove' and method == 'POST':
-            return remove_post(body, user_id)
-        elif path == '/post' and method == 'GET':
-            return get_post(params, user_id)
-        elif path == '/comments' and method == 'GET':
-            return get_comments(params, user_id)
-        elif path == '/comments' and method == 'POST':
-            return add_comment(body, user_id)
-        elif path == '/comments/like' and method == 'POST':
-            return like_comment(body, user_id)
-        elif path == '/comments/pin' and method == 'POST':
-            return pin_comment(body, user_id)
-        elif path == '/comments/remove' and method == 'POST':
-            return remove_comment(body, user_id)
-        elif path == '/profile' and method == 'GET':
-            return get_profile(params, user_id)
-        elif path == '/profile/update' and method == 'POST':
-            return update_profile(body, user_id)
-        elif path == '/profile/avatar' and method == 'POST':
-            return update_avatar(body, user_id)
-        elif path == '/profile/avatar/remove' and method == 'POST':
-            return remove_avatar(body, user_id)
-        elif path == '/follow' and method == 'POST':
-            return follow_user(body, user_id)
-        elif path == '/unfollow' and method == 'POST':
-            return unfollow_user(body, user_id)
-        elif path == '/follow/request' and method == 'POST':
-            return handle_follow_request(body, user_id)
-        elif path == '/followers' and method == 'GET':
-            return get_followers(params, user_id)
-        elif path == '/following' and method == 'GET':
-            return get_following(params, user_id)
-        elif path == '/friends' and method == 'GET':
-            return get_friends(params, user_id)
-        elif path == '/search' and method == 'GET':
-            return search_users(params)
-        elif path == '/messages' and method == 'GET':
-            return get_messages(params, user_id)
-        elif path == '/messages/chats' and method == 'GET':
-            return get_chats(user_id)
-        elif path == '/messages/send' and method == 'POST':
-            return send_message(body, user_id)
-        elif path == '/messages/read' and method == 'POST':
-            return mark_read(body, user_id)
-        elif path == '/messages/edit' and method == 'POST':
-            return edit_message(body, user_id)
-        elif path == '/messages/pin' and method == 'POST':
-            return pin_message(body, user_id)
-        elif path == '/messages/hide' and method == 'POST':
-            return hide_message(body, user_id)
-        elif path == '/notifications' and method == 'GET':
-            return get_notifications(user_id)
-        elif path == '/notifications/read' and method == 'POST':
-            return read_notifications(user_id)
-        elif path == '/stories' and method == 'GET':
-            return get_stories(params, user_id)
-        elif path == '/stories' and method == 'POST':
-            return create_story(body, user_id)
-        elif path == '/stories/view' and method == 'POST':
-            return view_story(body, user_id)
-        elif path == '/report' and method == 'POST':
-            return create_report(body, user_id)
-        elif path == '/verification/request' and method == 'POST':
-            return request_verification(body, user_id)
-        elif path == '/appeal' and method == 'POST':
-            return create_appeal(body, user_id)
-        elif path == '/block' and method == 'POST':
-            return block_user(body, user_id)
-        elif path == '/unblock' and method == 'POST':
-            return unblock_user(body, user_id)
-        elif path == '/user/likes' and method == 'GET':
-            return get_user_likes(params, user_id)
-        elif path == '/user/reposts' and method == 'GET':
-            return get_user_reposts(params, user_id)
-        elif path == '/admin/block' and method == 'POST':
-            return admin_block(body, user_id)
-        elif path == '/admin/reports' and method == 'GET':
-            return admin_reports(user_id)
-        elif path == '/admin/report/handle' and method == 'POST':
-            return admin_handle_report(body, user_id)
-        elif path == '/admin/verifications' and method == 'GET':
-            return admin_verifications(user_id)
-        elif path == '/admin/verify' and method == 'POST':
-            return admin_verify(body, user_id)
-        elif path == '/admin/appeals' and method == 'GET':
-            return admin_appeals(user_id)
-        elif path == '/admin/appeal/handle' and method == 'POST':
-            return admin_handle_appeal(body, user_id)
-        elif path == '/admin/releases' and method == 'POST':
-            return admin_add_release(body, user_id)
-        elif path == '/admin/stats' and method == 'GET':
-            return admin_stats(user_id)
-        elif path == '/releases' and method == 'GET':
-            return get_releases(params)
-        elif path == '/settings/theme' and method == 'POST':
-            return update_theme(body, user_id)
-        elif path == '/settings/privacy' and method == 'POST':
-            return update_privacy(body, user_id)
-        elif path == '/account/remove' and method == 'POST':
-            return remove_account(user_id)
-        else:
-            return resp(200, {'status': 'ok', 'version': '1.0'})
+        result = route(method, path, params, body, user_id)
+        wrote = is_write(method, path) or request_ctx.wrote
+    finally:
+        request_ctx.read_after = None
+        request_ctx.table = False
+        request_ctx.client_ip = None
+        request_ctx.wrote = False
+    if wrote and result['statusCode'] < 400:
+        result = dict(result, headers=dict(result['headers'], **{'X-Write-Token': remember_write(user_id)}))
+    return negotiate(result, method, headers)
+
+def is_write(method, path):
+    """Запрос, после которого чтения пользователя идут на primary: /batch — только если записал подзапрос,
+    просмотр поста пользователю перечитывать не нужно"""
+    return method != 'GET' and path not in UNTRACKED_WRITES
+
+def rate_class(method, path):
+    """Класс маршрута для лимитов: по точному пути, затем по последнему сегменту"""
+    known = RATE_CLASSES.get(path)
+    if known:
+        return known
+    if method != 'POST':
+        return 'read'
+    last = path.rstrip('/').rsplit('/', 1)[-1]
+    if last == 'like':
+        return 'like'
+    if last == 'view':
+        return 'view'
+    return 'write'
+
+def check_rate(method, path, user_id, ip):
+    """Списывает токен класса маршрута; 0 — запрос разрешён, иначе Retry-After"""
+    route_class = rate_class(method, path)
+    return limiter.check(route_class, ip if route_class == 'auth' or not user_id else 'u%s' % user_id)
+
+def too_many(retry_after):
+    return {'statusCode': 429, 'headers': dict(CORS_HEADERS, **{'Retry-After': str(retry_after)}),
+            'body': json.dumps({'error': 'Слишком много запросов', 'retry_after': retry_after}, ensure_ascii=False)}
+
+def client_ip(event, headers):
+    """sourceIp от платформы, иначе последний адрес X-Forwarded-For — его дописал доверенный прокси,
+    а всё, что левее, клиент присылает сам"""
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    if identity.get('sourceIp'):
+        return identity['sourceIp']
+    forwarded = headers.get('x-forwarded-for', '')
+    if forwarded:
+        return forwarded.split(',')[-1].strip()
+    return headers.get('x-real-ip') or 'unknown'
+
+def remember_write(user_id):
+    """Запоминает время записи пользователя для read-your-writes; клиент возвращает его в X-Read-After"""
+    now = time.time()
+    if user_id:
+        if len(last_writes) >= 10000:
+            for uid in [k for k, at in last_writes.items() if now - at > REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL]:
+                del last_writes[uid]
+        last_writes[user_id] = now
+    return '%.3f' % now
+
+def route(method, path, params, body, user_id):
+    fn, path_params = router.match(method, path)
+    if not fn:
+        return resp(200, {'status': 'ok', 'version': '1.0'})
+    if path_params:
+        params = dict(params, **path_params)
+        body = dict(body, **path_params)
+    try:
+        return fn(params, body, user_id)
     except Exception as e:
         return resp(500, {'error': str(e)})
 
@@ -226,64 +522,283 @@ def get_me(user_id):
         return resp(401, {'error': 'Не авторизован'})
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT id, username, email, display_name, bio, avatar_url, is_private, is_verified, is_artist_verified, is_admin, is_blocked, block_reason, role, theme, links, privacy_settings, avatars, created_at FROM users WHERE id = %s" % user_id)
+    cur.execute("SELECT id, username, email, display_name, bio, avatar_url, is_private, is_verified, is_artist_verified, is_admin, is_blocked, block_reason, role, theme, links, %s, avatars, created_at FROM users WHERE id = %s" % (', '.join(privacy.SETTINGS), user_id))
     user = cur.fetchone()
     conn.close()
     if not user:
         return resp(404, {'error': 'Пользователь не найден'})
-    return resp(200, {'user': user})
+    return resp(200, {'user': with_privacy(user)})
+
+def with_privacy(user):
+    user['privacy'] = {k: user.pop(k) for k in privacy.SETTINGS}
+    return user
 
 def get_feed(params, user_id):
+    if params.get('mode') == 'ranked':
+        return get_ranked_feed(params, user_id)
     page = int(params.get('page', '0'))
     limit = 20
     offset = page * limit
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    blocked_ids = get_blocked_ids(cur, user_id) if user_id else []
-    blocked_clause = ""
-    if blocked_ids:
-        blocked_clause = " AND p.user_id NOT IN (%s)" % ','.join(str(i) for i in blocked_ids)
+    blocked_clause = not_blocked_clause('p.user_id', user_id)
     cur.execute("""
-        SELECT p.*, u.username, u.display_name, u.avatar_url, u.is_verified, u.is_artist_verified,
-        op.content as original_content, op.media_urls as original_media,
-        ou.username as original_username, ou.display_name as original_display_name, ou.avatar_url as original_avatar, ou.is_verified as original_verified
+        SELECT p.*, op.content as original_content, op.media_urls as original_media, op.user_id as original_user_id
         FROM posts p
         JOIN users u ON p.user_id = u.id
         LEFT JOIN posts op ON p.original_post_id = op.id
-        LEFT JOIN users ou ON op.user_id = ou.id
-        WHERE p.is_removed = FALSE AND u.is_blocked = FALSE %s
+        WHERE p.is_removed = FALSE AND u.is_blocked = FALSE%s %s
         ORDER BY p.created_at DESC
         LIMIT %s OFFSET %s
-    """ % (blocked_clause, limit, offset))
-    posts = cur.fetchall()
-    if user_id:
-        post_ids = [p['id'] for p in posts]
-        if post_ids:
-            cur.execute("SELECT post_id FROM likes WHERE user_id = %s AND post_id IN (%s)" % (user_id, ','.join(str(i) for i in post_ids)))
-            liked = {r['post_id'] for r in cur.fetchall()}
-            for p in posts:
-                p['is_liked'] = p['id'] in liked
+    """ % (not_held_clause('p', user_id), blocked_clause, limit, offset))
+    posts = hydrate_users(cur, cur.fetchall())
+    hydrate_users(cur, posts, 'original_user_id', ORIGINAL_CARD)
+    mark_liked(cur, posts, user_id)
     conn.close()
     return resp(200, {'posts': posts})
 
+def get_ranked_feed(params, user_id):
+    page = int(params.get('page', '0'))
+    limit = 20
+    offset = page * limit
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    blocked_clause = not_blocked_clause('fc.user_id', user_id)
+    cur.execute("""
+        WITH ranked AS (
+            SELECT fc.post_id, fc.score * CASE WHEN f.id IS NULL THEN 1.0 ELSE %s END AS rank_score
+            FROM feed_candidates fc
+            LEFT JOIN follows f ON f.following_id = fc.user_id AND f.follower_id = %s AND f.status = 'active'
+            WHERE TRUE %s
+            ORDER BY rank_score DESC
+            LIMIT %s OFFSET %s
+        )
+        SELECT p.*, r.rank_score
+        FROM ranked r
+        JOIN posts p ON p.id = r.post_id
+        JOIN users u ON p.user_id = u.id
+        WHERE p.is_removed = FALSE AND u.is_blocked = FALSE
+        ORDER BY r.rank_score DESC
+    """ % (FOLLOWING_BOOST, user_id or 0, blocked_clause, limit, offset))
+    posts = hydrate_users(cur, cur.fetchall())
+    if not posts and page == 0:
+        conn.close()
+        return get_feed({'page': '0'}, user_id)
+    mark_liked(cur, posts, user_id)
+    conn.close()
+    return resp(200, {'posts': posts, 'mode': 'ranked'})
+
+def mark_liked(cur, posts, user_id):
+    if not user_id:
+        return
+    post_ids = [p['id'] for p in posts]
+    if post_ids:
+        cur.execute("SELECT post_id FROM likes WHERE user_id = %s AND post_id IN (%s)" % (user_id, ','.join(str(i) for i in post_ids)))
+        liked = {r['post_id'] for r in cur.fetchall()}
+        for p in posts:
+            p['is_liked'] = p['id'] in liked
+
+def load_cards(cur, ids):
+    card_cur = cur.connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    card_cur.execute("SELECT id, %s FROM users WHERE id = ANY('{%s}'::int[])" % (', '.join(CARD_FIELDS), ','.join(str(int(i)) for i in ids)))
+    return {r['id']: dict(r) for r in card_cur.fetchall()}
+
+def hydrate_users(cur, rows, key='user_id', fields=CARD_FIELDS):
+    """Подставляет в строки поля карточки пользователя rows[key]; промахи кэша — одним запросом"""
+    ids = {r[key] for r in rows if r.get(key)}
+    cards = user_cards.get_many(ids, lambda missing: load_cards(cur, missing)) if ids else {}
+    for r in rows:
+        card = cards.get(r.get(key)) or {}
+        for field, out in fields.items():
+            r[out] = card.get(field)
+    return rows
+
 def create_post(body, user_id):
     if not user_id:
         return resp(401, {'error': 'Не авторизован'})
     content = body.get('content', '').strip()
-    media_urls = body.get('media_urls', [])
+    media_urls = body.get('media_urls', body.get('media', []))
     if not content and not media_urls:
         return resp(400, {'error': 'Пост не может быть пустым'})
+    spam_state, checked = spam_filter.check(user_id, content) if content else (0, None)
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("INSERT INTO posts (user_id, content, media_urls) VALUES (%s, '%s', '%s') RETURNING *" % (user_id, content.replace("'", "''"), json.dumps(media_urls)))
+    media_thumbs = []
+    if media_urls:
+        import media
+        try:
+            media_urls, media_thumbs = resolve_media(cur, media_urls, user_id)
+        except media.UploadError as e:
+            conn.close()
+            return resp(400, {'error': str(e)})
+    cur.execute("INSERT INTO posts (user_id, content, media_urls, media_thumbs, spam_state) VALUES (%s, '%s', '%s', '%s', %s) RETURNING *" % (user_id, content.replace("'", "''"), json.dumps(media_urls).replace("'", "''"), json.dumps(media_thumbs).replace("'", "''"), spam_state))
     post = cur.fetchone()
+    if spam_state != HELD:
+        index_post_text(cur, post['id'], user_id, content)
     conn.commit()
-    cur.execute("SELECT username, display_name, avatar_url, is_verified, is_artist_verified FROM users WHERE id = %s" % user_id)
-    u = cur.fetchone()
-    post.update(u)
+    if checked:
+        spam_filter.record(checked)
+    hydrate_users(cur, [post])
     conn.close()
     return resp(200, {'post': post})
 
+def extract_tags(content):
+    tags, mentions = [], []
+    for m in HASHTAG_RE.finditer(content):
+        tag = m.group(1).lower()
+        if tag not in tags and len(tags) < MAX_TAGS_PER_POST:
+            tags.append(tag)
+    for m in MENTION_RE.finditer(content):
+        name = m.group(1).lower().rstrip('.')
+        if name not in mentions and len(mentions) < MAX_MENTIONS_PER_POST:
+            mentions.append(name)
+    return tags, mentions
+
+def sql_array(values):
+    return "ARRAY[%s]::varchar[]" % ','.join("'%s'" % v.replace("'", "''") for v in values)
+
+def index_post_text(cur, post_id, user_id, content):
+    """Раскладывает хэштеги и упоминания поста по индексам; уведомления об упоминаниях — одной вставкой"""
+    tags, mentions = extract_tags(content)
+    if tags:
+        cur.execute("""
+            WITH ins AS (
+                INSERT INTO post_tags (tag, post_id) SELECT t, %s FROM unnest(%s) t
+                ON CONFLICT DO NOTHING RETURNING tag
+            )
+            INSERT INTO tag_buckets (tag, bucket, uses) SELECT tag, date_trunc('hour', NOW()), 1 FROM ins
+            ON CONFLICT (tag, bucket) DO UPDATE SET uses = tag_buckets.uses + 1
+        """ % (post_id, sql_array(tags)))
+    if mentions:
+        cur.execute("""
+            WITH mentioned AS (
+                SELECT u.id FROM users u
+                WHERE u.username = ANY(%s) AND u.id <> %s AND u.is_blocked = FALSE%s
+            ), ins AS (
+                INSERT INTO post_mentions (user_id, post_id) SELECT id, %s FROM mentioned
+                ON CONFLICT DO NOTHING RETURNING user_id
+            )
+            INSERT INTO notifications (user_id, from_user_id, type, post_id) SELECT user_id, %s, 'mention', %s FROM ins
+        """ % (sql_array(mentions), user_id, not_blocked_clause('u.id', user_id), post_id, user_id, post_id))
+
+def get_tag_feed(params, user_id):
+    tag = unquote(params.get('tag', '')).lstrip('#').lower()
+    cursor = params.get('cursor')
+    after = " AND t.post_id < %s" % int(cursor) if cursor else ""
+    return tagged_posts("""
+        SELECT p.* FROM post_tags t JOIN posts p ON p.id = t.post_id JOIN users u ON u.id = p.user_id
+        WHERE t.tag = '%s'%s AND p.is_removed = FALSE AND u.is_blocked = FALSE%s%s
+        ORDER BY t.post_id DESC LIMIT %s
+    """ % (tag.replace("'", "''"), after, not_held_clause('p', user_id), not_blocked_clause('p.user_id', user_id), TAG_FEED_PAGE_SIZE + 1), user_id, {'tag': tag})
+
+def get_mentions(params, user_id):
+    if not user_id:
+        return resp(401, {'error': 'Не авторизован'})
+    cursor = params.get('cursor')
+    after = " AND m.post_id < %s" % int(cursor) if cursor else ""
+    return tagged_posts("""
+        SELECT p.* FROM post_mentions m JOIN posts p ON p.id = m.post_id JOIN users u ON u.id = p.user_id
+        WHERE m.user_id = %s%s AND p.is_removed = FALSE AND u.is_blocked = FALSE%s%s
+        ORDER BY m.post_id DESC LIMIT %s
+    """ % (int(user_id), after, not_held_clause('p', user_id), not_blocked_clause('p.user_id', user_id), TAG_FEED_PAGE_SIZE + 1), user_id, {})
+
+def tagged_posts(query, user_id, extra):
+    """Страница постов по ключу post_id: запрашивается на один больше, next_cursor — id последнего отданного"""
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.execute(query)
+    posts = cur.fetchall()
+    next_cursor = posts[TAG_FEED_PAGE_SIZE - 1]['id'] if len(posts) > TAG_FEED_PAGE_SIZE else None
+    posts = hydrate_users(cur, posts[:TAG_FEED_PAGE_SIZE])
+    mark_liked(cur, posts, user_id)
+    conn.close()
+    return resp(200, dict(extra, posts=posts, next_cursor=next_cursor))
+
+def get_trending_tags():
+    """Топ тегов за TRENDING_WINDOW_HOURS: сумма почасовых корзин tag_buckets, кэш на TRENDING_CACHE_TTL"""
+    cached = trending_cache.get('tags')
+    if cached and cached[0] > time.time():
+        return resp(200, {'tags': cached[1]})
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.execute("""
+        SELECT tag, SUM(uses)::int AS uses FROM tag_buckets
+        WHERE bucket > date_trunc('hour', NOW()) - INTERVAL '%s hours'
+        GROUP BY tag ORDER BY uses DESC, tag LIMIT %s
+    """ % (TRENDING_WINDOW_HOURS, TRENDING_LIMIT))
+    tags = cur.fetchall()
+    conn.close()
+    trending_cache['tags'] = (time.time() + TRENDING_CACHE_TTL, tags)
+    return resp(200, {'tags': tags})
+
+def upload_media(event, headers, user_id):
+    if not user_id:
+        return resp(401, {'error': 'Не авторизован'})
+    import media
+    try:
+        fields, files = media.parse_multipart(media.iter_event_body(event), media.boundary_from(headers.get('content-type', '')))
+    except media.UploadError as e:
+        return resp(400, {'error': str(e)})
+    try:
+        upload = next((f for name, f in files if name == 'file'), files[0][1] if files else None)
+        if not upload:
+            return resp(400, {'error': 'Файл не передан'})
+        if upload.content_type not in media.EXTENSIONS:
+            return resp(400, {'error': 'Неподдерживаемый тип файла'})
+        conn = get_db()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        result = save_media(cur, upload.file.name, upload.sha.hexdigest(), upload.content_type, upload.size, user_id)
+        conn.commit()
+        conn.close()
+        return resp(200, result)
+    finally:
+        for _, f in files:
+            f.discard()
+
+def upload_avatar(event, headers, user_id):
+    uploaded = upload_media(event, headers, user_id)
+    if uploaded['statusCode'] != 200:
+        return uploaded
+    avatar_url = json.loads(uploaded['body'])['url']
+    result = update_avatar({'avatar_url': avatar_url}, user_id)
+    return resp(200, dict(json.loads(result['body']), avatar_url=avatar_url))
+
+def save_media(cur, path, sha, content_type, size, user_id):
+    import media
+    cur.execute("SELECT sha256, url, thumb_url, thumbs FROM media_files WHERE sha256 = '%s'" % sha)
+    existing = cur.fetchone()
+    if existing:
+        return existing
+    url, thumbs = media.store_file(path, sha, content_type)
+    thumb_url = thumbs[min(thumbs)] if thumbs else url
+    cur.execute("INSERT INTO media_files (sha256, user_id, content_type, size_bytes, url, thumb_url, thumbs) VALUES ('%s', %s, '%s', %s, '%s', '%s', '%s') ON CONFLICT (sha256) DO NOTHING" % (
+        sha, user_id, content_type.replace("'", "''"), size, url.replace("'", "''"), thumb_url.replace("'", "''"), json.dumps(thumbs).replace("'", "''")))
+    return {'sha256': sha, 'url': url, 'thumb_url': thumb_url, 'thumbs': thumbs}
+
+def resolve_media(cur, media_urls, user_id):
+    import media
+    if not isinstance(media_urls, list):
+        raise media.UploadError('Некорректный список медиа')
+    urls, thumbs = [], {}
+    for item in media_urls:
+        if not isinstance(item, str):
+            raise media.UploadError('Некорректный адрес медиа')
+        if item.startswith('data:'):
+            path, sha, content_type = media.decode_data_url(item)
+            try:
+                stored = save_media(cur, path, sha, content_type, os.path.getsize(path), user_id)
+            finally:
+                os.unlink(path)
+            urls.append(stored['url'])
+            thumbs[stored['url']] = stored['thumb_url']
+        else:
+            urls.append(item)
+    known = [u for u in urls if u not in thumbs]
+    if known:
+        cur.execute("SELECT url, thumb_url FROM media_files WHERE url IN (%s)" % ','.join("'%s'" % u.replace("'", "''") for u in known))
+        thumbs.update({r['url']: r['thumb_url'] for r in cur.fetchall()})
+    return urls, [thumbs.get(u, u) for u in urls]
+
 def view_post(body):
     post_id = body.get('post_id')
     if post_id:
@@ -297,47 +812,16 @@ def view_post(body):
 def like_post(body, user_id):
     if not user_id:
         return resp(401, {'error': 'Не авторизован'})
-    post_id = body.get('post_id')
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT id FROM likes WHERE user_id = %s AND post_id = %s AND comment_id IS NULL" % (user_id, post_id))
-    existing = cur.fetchone()
-    if existing:
-        cur.execute("UPDATE likes SET post_id = NULL WHERE id = %s" % existing['id'])
-        cur.execute("UPDATE posts SET likes_count = GREATEST(likes_count - 1, 0) WHERE id = %s" % post_id)
-        liked = False
-    else:
-        cur.execute("INSERT INTO likes (user_id, post_id) VALUES (%s, %s)" % (user_id, post_id))
-        cur.execute("UPDATE posts SET likes_count = likes_count + 1 WHERE id = %s" % post_id)
-        cur.execute("SELECT user_id FROM posts WHERE id = %s" % post_id)
-        post_owner = cur.fetchone()
-        if post_owner and post_owner['user_id'] != user_id:
-            cur.execute("INSERT INTO notifications (user_id, from_user_id, type, post_id) VALUES (%s, %s, 'like', %s)" % (post_owner['user_id'], user_id, post_id))
-        liked = True
-    conn.commit()
-    cur.execute("SELECT likes_count FROM posts WHERE id = %s" % post_id)
-    cnt = cur.fetchone()
-    conn.close()
-    return resp(200, {'liked': liked, 'likes_count': cnt['likes_count']})
+    row = run_write("SELECT liked, likes_count FROM like_post_v1(%s, %s)" % (int(user_id), int(body.get('post_id'))))
+    return resp(200, {'liked': row['liked'], 'likes_count': row['likes_count'] or 0})
 
 def repost(body, user_id):
     if not user_id:
         return resp(401, {'error': 'Не авторизован'})
-    post_id = body.get('post_id')
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT * FROM posts WHERE id = %s" % post_id)
-    orig = cur.fetchone()
-    if not orig:
-        conn.close()
+    row = run_write("SELECT repost_v1(%s, %s) AS post" % (int(user_id), int(body.get('post_id'))))
+    if not row['post']:
         return resp(404, {'error': 'Пост не найден'})
-    real_id = orig['original_post_id'] if orig['is_repost'] else orig['id']
-    cur.execute("INSERT INTO posts (user_id, content, is_repost, original_post_id) VALUES (%s, '', TRUE, %s) RETURNING *" % (user_id, real_id))
-    post = cur.fetchone()
-    cur.execute("UPDATE posts SET reposts_count = reposts_count + 1 WHERE id = %s" % real_id)
-    conn.commit()
-    conn.close()
-    return resp(200, {'post': post})
+    return resp(200, {'post': row['post']})
 
 def remove_post(body, user_id):
     if not user_id:
@@ -361,44 +845,86 @@ def remove_post(body, user_id):
     return resp(200, {'ok': True})
 
 def get_post(params, user_id):
-    post_id = params.get('id')
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("""
-        SELECT p.*, u.username, u.display_name, u.avatar_url, u.is_verified, u.is_artist_verified
-        FROM posts p JOIN users u ON p.user_id = u.id
-        WHERE p.id = %s AND p.is_removed = FALSE
-    """ % post_id)
-    post = cur.fetchone()
-    if not post:
-        conn.close()
+    post_id = int(params.get('id'))
+    post = reads.do(('post', post_id), lambda: load_post(post_id))
+    if not post or (post['spam_state'] >= HELD and post['user_id'] != user_id):
         return resp(404, {'error': 'Пост не найден'})
     if user_id:
+        post = dict(post)
+        conn = get_db()
+        cur = conn.cursor()
         cur.execute("SELECT id FROM likes WHERE user_id = %s AND post_id = %s AND comment_id IS NULL" % (user_id, post_id))
         post['is_liked'] = cur.fetchone() is not None
-    conn.close()
+        conn.close()
     return resp(200, {'post': post})
 
-def get_comments(params, user_id):
-    post_id = params.get('post_id')
+def load_post(post_id):
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cur.execute("""
-        SELECT c.*, u.username, u.display_name, u.avatar_url, u.is_verified, u.is_artist_verified
-        FROM comments c JOIN users u ON c.user_id = u.id
-        WHERE c.post_id = %s AND c.is_removed = FALSE
-        ORDER BY c.is_pinned DESC, c.created_at ASC
+        SELECT p.* FROM posts p WHERE p.id = %s AND p.is_removed = FALSE
     """ % post_id)
-    comments = cur.fetchall()
-    if user_id:
-        cids = [c['id'] for c in comments]
-        if cids:
-            cur.execute("SELECT comment_id FROM likes WHERE user_id = %s AND comment_id IN (%s)" % (user_id, ','.join(str(i) for i in cids)))
-            liked = {r['comment_id'] for r in cur.fetchall()}
-            for c in comments:
-                c['is_liked'] = c['id'] in liked
+    post = cur.fetchone()
+    if post:
+        hydrate_users(cur, [post])
     conn.close()
-    return resp(200, {'comments': comments})
+    return post
+
+def get_comments(params, user_id):
+    post_id = int(params.get('post_id'))
+    sort = params.get('sort', 'time')
+    cursor = params.get('cursor')
+    limit = min(int(params.get('limit', COMMENTS_PAGE_SIZE)), COMMENTS_PAGE_LIMIT)
+    if sort == 'top':
+        order = "c.likes_count DESC, c.id DESC"
+        after = "(c.likes_count, c.id) < (SELECT likes_count, id FROM comments WHERE id = %s)"
+    else:
+        order = "c.created_at ASC, c.id ASC"
+        after = "(c.created_at, c.id) > (SELECT created_at, id FROM comments WHERE id = %s)"
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    pinned = []
+    if not cursor:
+        cur.execute(comments_query(user_id, "c.post_id = %s AND c.parent_id IS NULL AND c.is_pinned = TRUE" % post_id, order, COMMENTS_PAGE_LIMIT))
+        pinned = hydrate_users(cur, cur.fetchall())
+    where = "c.post_id = %s AND c.parent_id IS NULL AND c.is_pinned = FALSE" % post_id
+    if cursor:
+        where += " AND " + after % int(cursor)
+    cur.execute(comments_query(user_id, where, order, limit + 1))
+    comments = hydrate_users(cur, cur.fetchall())
+    conn.close()
+    next_cursor = comments[limit - 1]['id'] if len(comments) > limit else None
+    return resp(200, {'comments': pinned + comments[:limit], 'next_cursor': next_cursor})
+
+def get_comment_replies(params, user_id):
+    post_id = int(params.get('post_id'))
+    parent_id = int(params.get('parent_id'))
+    cursor = params.get('cursor')
+    limit = min(int(params.get('limit', COMMENTS_PAGE_SIZE)), COMMENTS_PAGE_LIMIT)
+    where = "c.post_id = %s AND c.parent_id = %s" % (post_id, parent_id)
+    if cursor:
+        where += " AND (c.created_at, c.id) > (SELECT created_at, id FROM comments WHERE id = %s)" % int(cursor)
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.execute(comments_query(user_id, where, "c.created_at ASC, c.id ASC", limit + 1))
+    replies = hydrate_users(cur, cur.fetchall())
+    conn.close()
+    next_cursor = replies[limit - 1]['id'] if len(replies) > limit else None
+    return resp(200, {'comments': replies[:limit], 'next_cursor': next_cursor})
+
+def comments_query(user_id, where, order, limit):
+    liked = "FALSE"
+    if user_id:
+        liked = "EXISTS (SELECT 1 FROM likes l WHERE l.user_id = %s AND l.comment_id = c.id)" % int(user_id)
+    return """
+        SELECT c.*,
+        (SELECT COUNT(*) FROM comments r WHERE r.post_id = c.post_id AND r.parent_id = c.id AND r.is_removed = FALSE) as replies_count,
+        %s as is_liked
+        FROM comments c
+        WHERE %s AND c.is_removed = FALSE%s%s
+        ORDER BY %s
+        LIMIT %s
+    """ % (liked, where, not_held_clause('c', user_id), not_blocked_clause('c.user_id', user_id), order, limit)
 
 def add_comment(body, user_id):
     if not user_id:
@@ -408,22 +934,11 @@ def add_comment(body, user_id):
     parent_id = body.get('parent_id')
     if not content:
         return resp(400, {'error': 'Комментарий пуст'})
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    parent_clause = "NULL" if not parent_id else str(parent_id)
-    cur.execute("INSERT INTO comments (post_id, user_id, parent_id, content) VALUES (%s, %s, %s, '%s') RETURNING *" % (post_id, user_id, parent_clause, content.replace("'", "''")))
-    comment = cur.fetchone()
-    cur.execute("UPDATE posts SET comments_count = comments_count + 1 WHERE id = %s" % post_id)
-    cur.execute("SELECT user_id FROM posts WHERE id = %s" % post_id)
-    owner = cur.fetchone()
-    if owner and owner['user_id'] != user_id:
-        cur.execute("INSERT INTO notifications (user_id, from_user_id, type, post_id, comment_id) VALUES (%s, %s, 'comment', %s, %s)" % (owner['user_id'], user_id, post_id, comment['id']))
-    conn.commit()
-    cur.execute("SELECT username, display_name, avatar_url, is_verified, is_artist_verified FROM users WHERE id = %s" % user_id)
-    u = cur.fetchone()
-    comment.update(u)
-    conn.close()
-    return resp(200, {'comment': comment})
+    parent_clause = "NULL" if not parent_id else str(int(parent_id))
+    spam_state, checked = spam_filter.check(user_id, content)
+    row = run_write("SELECT add_comment_v1(%s, %s, %s, '%s', %s::smallint) AS comment" % (int(user_id), int(post_id), parent_clause, content.replace("'", "''"), spam_state))
+    spam_filter.record(checked)
+    return resp(200, {'comment': row['comment']})
 
 def like_comment(body, user_id):
     if not user_id:
@@ -494,47 +1009,40 @@ def remove_comment(body, user_id):
 
 def get_profile(params, user_id):
     username = params.get('username', '')
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT id, username, display_name, bio, avatar_url, is_private, is_verified, is_artist_verified, is_blocked, is_admin, role, links, privacy_settings, avatars, created_at FROM users WHERE username = '%s'" % username)
-    user = cur.fetchone()
-    if not user:
-        conn.close()
+    shared = reads.do(('profile', username), lambda: load_profile(username))
+    if not shared or (shared['profile']['is_blocked'] and (not user_id or user_id != shared['profile']['id'])):
         return resp(404, {'error': 'Аккаунт не найден или был удалён'})
-    if user['is_blocked'] and (not user_id or user_id != user['id']):
-        conn.close()
-        return resp(404, {'error': 'Аккаунт не найден или был удалён'})
-    cur.execute("SELECT COUNT(*) as cnt FROM follows WHERE following_id = %s AND status = 'active'" % user['id'])
-    user['followers_count'] = cur.fetchone()['cnt']
-    cur.execute("SELECT COUNT(*) as cnt FROM follows WHERE follower_id = %s AND status = 'active'" % user['id'])
-    user['following_count'] = cur.fetchone()['cnt']
-    cur.execute("SELECT COUNT(*) as cnt FROM posts WHERE user_id = %s AND is_removed = FALSE" % user['id'])
-    user['posts_count'] = cur.fetchone()['cnt']
+    user = dict(shared['profile'])
+    follow_status = None
     if user_id:
+        conn = get_db()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         cur.execute("SELECT status FROM follows WHERE follower_id = %s AND following_id = %s" % (user_id, user['id']))
         f = cur.fetchone()
-        user['follow_status'] = f['status'] if f else 'none'
+        follow_status = f['status'] if f else 'none'
+        user['follow_status'] = follow_status
         cur.execute("SELECT id FROM user_blocks WHERE blocker_id = %s AND blocked_id = %s" % (user_id, user['id']))
         user['is_blocked_by_me'] = cur.fetchone() is not None
-    posts = []
-    can_see = True
-    if user['is_private'] and user_id != user['id']:
-        if user_id:
-            cur.execute("SELECT status FROM follows WHERE follower_id = %s AND following_id = %s AND status = 'active'" % (user_id, user['id']))
-            if not cur.fetchone():
-                can_see = False
-        else:
-            can_see = False
-    if can_see:
-        cur.execute("""
-            SELECT p.*, u.username, u.display_name, u.avatar_url, u.is_verified, u.is_artist_verified
-            FROM posts p JOIN users u ON p.user_id = u.id
-            WHERE p.user_id = %s AND p.is_removed = FALSE ORDER BY p.created_at DESC LIMIT 50
-        """ % user['id'])
-        posts = cur.fetchall()
+        conn.close()
+    can_see = not user['is_private'] or user_id == user['id'] or follow_status == 'active'
     user['can_see_posts'] = can_see
+    posts = shared['posts'] if user_id == user['id'] else [p for p in shared['posts'] if p['spam_state'] < HELD]
+    return resp(200, {'profile': user, 'posts': posts if can_see else []})
+
+def load_profile(username):
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.execute("SELECT id, username, display_name, bio, avatar_url, is_private, is_verified, is_artist_verified, is_blocked, is_admin, role, links, %s, avatars, followers_count, following_count, created_at FROM users WHERE username = '%s'" % (', '.join(privacy.SETTINGS), username.replace("'", "''")))
+    user = cur.fetchone()
+    if not user:
+        conn.close()
+        return None
+    cur.execute("SELECT COUNT(*) as cnt FROM posts WHERE user_id = %s AND is_removed = FALSE" % user['id'])
+    user['posts_count'] = cur.fetchone()['cnt']
+    cur.execute("SELECT p.* FROM posts p WHERE p.user_id = %s AND p.is_removed = FALSE ORDER BY p.created_at DESC LIMIT 50" % user['id'])
+    posts = hydrate_users(cur, cur.fetchall())
     conn.close()
-    return resp(200, {'profile': user, 'posts': posts})
+    return {'profile': with_privacy(user), 'posts': posts}
 
 def update_profile(body, user_id):
     if not user_id:
@@ -553,6 +1061,7 @@ def update_profile(body, user_id):
     if fields:
         cur.execute("UPDATE users SET %s, updated_at = NOW() WHERE id = %s" % (', '.join(fields), user_id))
         conn.commit()
+        user_cards.invalidate(user_id)
     conn.close()
     return resp(200, {'ok': True})
 
@@ -572,6 +1081,7 @@ def update_avatar(body, user_id):
     cur.execute("UPDATE users SET avatar_url = '%s', avatars = '%s' WHERE id = %s" % (avatar_url.replace("'", "''"), json.dumps(avatars).replace("'", "''"), user_id))
     conn.commit()
     conn.close()
+    user_cards.invalidate(user_id)
     return resp(200, {'ok': True, 'avatars': avatars})
 
 def remove_avatar(body, user_id):
@@ -591,6 +1101,7 @@ def remove_avatar(body, user_id):
     cur.execute("UPDATE users SET avatar_url = '%s', avatars = '%s' WHERE id = %s" % (new_main.replace("'", "''"), json.dumps(avatars).replace("'", "''"), user_id))
     conn.commit()
     conn.close()
+    user_cards.invalidate(user_id)
     return resp(200, {'ok': True, 'avatars': avatars, 'avatar_url': new_main})
 
 def follow_user(body, user_id):
@@ -599,27 +1110,10 @@ def follow_user(body, user_id):
     target_id = body.get('user_id')
     if user_id == target_id:
         return resp(400, {'error': 'Нельзя подписаться на себя'})
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT is_private FROM users WHERE id = %s" % target_id)
-    target = cur.fetchone()
-    if not target:
-        conn.close()
+    row = run_write("SELECT follow_user_v1(%s, %s) AS status" % (int(user_id), int(target_id)))
+    if not row['status']:
         return resp(404, {'error': 'Пользователь не найден'})
-    cur.execute("SELECT id, status FROM follows WHERE follower_id = %s AND following_id = %s" % (user_id, target_id))
-    existing = cur.fetchone()
-    if existing:
-        conn.close()
-        return resp(200, {'status': existing['status']})
-    status = 'pending' if target['is_private'] else 'active'
-    cur.execute("INSERT INTO follows (follower_id, following_id, status) VALUES (%s, %s, '%s')" % (user_id, target_id, status))
-    if status == 'pending':
-        cur.execute("INSERT INTO notifications (user_id, from_user_id, type) VALUES (%s, %s, 'follow_request')" % (target_id, user_id))
-    else:
-        cur.execute("INSERT INTO notifications (user_id, from_user_id, type) VALUES (%s, %s, 'follow')" % (target_id, user_id))
-    conn.commit()
-    conn.close()
-    return resp(200, {'status': status})
+    return resp(200, {'status': row['status']})
 
 def unfollow_user(body, user_id):
     if not user_id:
@@ -639,6 +1133,13 @@ def handle_follow_request(body, user_id):
     action = body.get('action')
     conn = get_db()
     cur = conn.cursor()
+    if body.get('request_id'):
+        cur.execute("SELECT follower_id FROM follows WHERE id = %s AND following_id = %s" % (int(body['request_id']), user_id))
+        row = cur.fetchone()
+        if not row:
+            conn.close()
+            return resp(404, {'error': 'Запрос не найден'})
+        from_id = row[0]
     if action == 'accept':
         cur.execute("UPDATE follows SET status = 'active' WHERE follower_id = %s AND following_id = %s AND status = 'pending'" % (from_id, user_id))
     else:
@@ -647,71 +1148,97 @@ def handle_follow_request(body, user_id):
     conn.close()
     return resp(200, {'ok': True})
 
-def get_followers(params, user_id):
-    target_id = params.get('user_id')
+def get_follow_requests(user_id):
+    if not user_id:
+        return resp(401, {'error': 'Не авторизован'})
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cur.execute("""
-        SELECT u.id, u.username, u.display_name, u.avatar_url, u.is_verified, u.is_artist_verified
-        FROM follows f JOIN users u ON f.follower_id = u.id
-        WHERE f.following_id = %s AND f.status = 'active'
-    """ % target_id)
+        SELECT f.id, f.follower_id as user_id, f.created_at
+        FROM follows f
+        WHERE f.following_id = %s AND f.status = 'pending'
+        ORDER BY f.created_at DESC
+    """ % user_id)
+    requests = hydrate_users(cur, cur.fetchall())
     conn.close()
-    return resp(200, {'users': cur.fetchall()})
+    return list_resp('requests', FOLLOW_REQUEST_COLUMNS, requests)
+
+def get_followers(params, user_id):
+    return guarded_user_list(params, user_id, 'show_followers', """
+        SELECT f.follower_id AS id FROM follows f
+        WHERE f.following_id = target.id AND f.status = 'active'
+    """)
 
 def get_following(params, user_id):
-    target_id = params.get('user_id')
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("""
-        SELECT u.id, u.username, u.display_name, u.avatar_url, u.is_verified, u.is_artist_verified
-        FROM follows f JOIN users u ON f.following_id = u.id
-        WHERE f.follower_id = %s AND f.status = 'active'
-    """ % target_id)
-    conn.close()
-    return resp(200, {'users': cur.fetchall()})
+    return guarded_user_list(params, user_id, 'show_following', """
+        SELECT f.following_id AS id FROM follows f
+        WHERE f.follower_id = target.id AND f.status = 'active'
+    """)
 
 def get_friends(params, user_id):
-    target_id = params.get('user_id')
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("""
-        SELECT u.id, u.username, u.display_name, u.avatar_url, u.is_verified, u.is_artist_verified
+    return guarded_user_list(params, user_id, 'show_friends', """
+        SELECT f1.following_id AS id
         FROM follows f1
         JOIN follows f2 ON f1.follower_id = f2.following_id AND f1.following_id = f2.follower_id
-        JOIN users u ON f1.following_id = u.id
-        WHERE f1.follower_id = %s AND f1.status = 'active' AND f2.status = 'active'
-    """ % target_id)
+        WHERE f1.follower_id = target.id AND f1.status = 'active' AND f2.status = 'active'
+    """)
+
+def guarded_user_list(params, user_id, setting, inner):
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    visible, rows = fetch_guarded(cur, setting, params.get('user_id'), user_id, inner)
+    users = hydrate_users(cur, [{'id': r['id']} for r in rows], key='id')
     conn.close()
-    return resp(200, {'users': cur.fetchall()})
+    return list_resp('users', USER_LIST_COLUMNS, users, hidden=not visible)
 
-def search_users(params):
+def fetch_guarded(cur, setting, target_id, user_id, inner):
+    """Проверка настройки приватности владельца и выборка inner одним запросом.
+    inner ссылается на target.id; при запрете он отсекается one-time фильтром и не выполняется. Возвращает (видно ли, строки)"""
+    cur.execute("""
+        WITH target AS (SELECT t.id, %s AS visible FROM users t WHERE t.id = %s)
+        SELECT target.visible AS privacy_visible, x.* FROM target
+        LEFT JOIN LATERAL (SELECT * FROM (%s) inner_rows WHERE target.visible) x ON TRUE
+    """ % (privacy.allows(setting, 't', user_id), int(target_id), inner))
+    rows = cur.fetchall()
+    visible = not rows or rows[0]['privacy_visible']
+    return visible, [r for r in rows if r.pop('privacy_visible') and r['id'] is not None]
+
+def search_users(params, user_id):
     q = params.get('q', '').strip()
     if not q:
         return resp(200, {'users': []})
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT id, username, display_name, avatar_url, is_verified, is_artist_verified, is_blocked FROM users WHERE (username ILIKE '%%%s%%' OR display_name ILIKE '%%%s%%') AND is_blocked = FALSE LIMIT 30" % (q.replace("'", "''"), q.replace("'", "''")))
+    cur.execute("SELECT id, username, display_name, avatar_url, is_verified, is_artist_verified, is_blocked FROM users WHERE (username ILIKE '%%%s%%' OR display_name ILIKE '%%%s%%') AND is_blocked = FALSE%s LIMIT 30" % (q.replace("'", "''"), q.replace("'", "''"), not_blocked_clause('id', user_id)))
     conn.close()
     return resp(200, {'users': cur.fetchall()})
 
 def get_messages(params, user_id):
     if not user_id:
         return resp(401, {'error': 'Не авторизован'})
-    other_id = params.get('user_id')
+    other_id = int(params.get('user_id'))
+    before = ""
+    if params.get('before'):
+        before = " AND m.created_at < '%s'" % params['before'].replace("'", "''")
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cur.execute("""
-        SELECT m.*, su.username as sender_username, su.display_name as sender_name, su.avatar_url as sender_avatar,
-        ru.username as receiver_username, ru.display_name as receiver_name
-        FROM messages m
-        JOIN users su ON m.sender_id = su.id
-        JOIN users ru ON m.receiver_id = ru.id
-        WHERE ((m.sender_id = %s AND m.receiver_id = %s AND m.hidden_by_sender = FALSE)
-            OR (m.sender_id = %s AND m.receiver_id = %s AND m.hidden_by_receiver = FALSE))
-        ORDER BY m.created_at ASC LIMIT 200
-    """ % (user_id, other_id, other_id, user_id))
-    msgs = cur.fetchall()
+        SELECT * FROM (
+            (SELECT m.* FROM messages m WHERE m.sender_id = %s AND m.receiver_id = %s AND m.hidden_by_sender = FALSE%s
+             ORDER BY m.created_at DESC LIMIT %s)
+            UNION ALL
+            (SELECT m.* FROM messages m WHERE m.sender_id = %s AND m.receiver_id = %s AND m.hidden_by_receiver = FALSE%s
+             ORDER BY m.created_at DESC LIMIT %s)
+        ) m ORDER BY m.created_at DESC LIMIT %s
+    """ % (user_id, other_id, before, MESSAGES_PAGE_SIZE, other_id, user_id, before, MESSAGES_PAGE_SIZE, MESSAGES_PAGE_SIZE))
+    msgs = hydrate_users(cur, cur.fetchall()[::-1], 'sender_id', SENDER_CARD)
+    hydrate_users(cur, msgs, 'receiver_id', RECEIVER_CARD)
+    if msgs:
+        cur.execute("SELECT user_id, read_message_id FROM conversation_state WHERE (user_id = %s AND other_id = %s) OR (user_id = %s AND other_id = %s)" % (
+            int(user_id), int(other_id), int(other_id), int(user_id)))
+        read_ids = {r['user_id']: r['read_message_id'] for r in cur.fetchall()}
+        for m in msgs:
+            m['is_read'] = m['id'] <= read_ids.get(m['receiver_id'], 0)
     conn.close()
     return resp(200, {'messages': msgs})
 
@@ -721,25 +1248,33 @@ def get_chats(user_id):
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cur.execute("""
-        SELECT DISTINCT ON (other_id) other_id, content, created_at, is_read, sender_id FROM (
-            SELECT receiver_id as other_id, content, created_at, is_read, sender_id FROM messages WHERE sender_id = %s AND hidden_by_sender = FALSE
-            UNION ALL
-            SELECT sender_id as other_id, content, created_at, is_read, sender_id FROM messages WHERE receiver_id = %s AND hidden_by_receiver = FALSE
-        ) sub ORDER BY other_id, created_at DESC
-    """ % (user_id, user_id))
+        SELECT cs.other_id, m.id, m.content, m.created_at, m.sender_id, cs.read_message_id,
+        COALESCE(peer.read_message_id, 0) AS peer_read_id,
+        (SELECT COUNT(*) FROM messages u WHERE u.receiver_id = cs.user_id AND u.sender_id = cs.other_id
+            AND u.id > cs.read_message_id AND u.created_at >= COALESCE(cs.read_message_at, '-infinity') AND u.hidden_by_receiver = FALSE) AS unread_count
+        FROM conversation_state cs
+        LEFT JOIN conversation_state peer ON peer.user_id = cs.other_id AND peer.other_id = cs.user_id
+        CROSS JOIN LATERAL (
+            SELECT m.id, m.content, m.created_at, m.sender_id FROM messages m
+            WHERE ((m.sender_id = cs.user_id AND m.receiver_id = cs.other_id AND m.hidden_by_sender = FALSE)
+                OR (m.sender_id = cs.other_id AND m.receiver_id = cs.user_id AND m.hidden_by_receiver = FALSE))
+            AND m.created_at <= cs.last_message_at
+            ORDER BY m.created_at DESC LIMIT 1
+        ) m
+        WHERE cs.user_id = %s%s
+    """ % (int(user_id), not_blocked_clause('cs.other_id', user_id)))
     chats = cur.fetchall()
     if chats:
-        uids = list(set(c['other_id'] for c in chats))
-        cur.execute("SELECT id, username, display_name, avatar_url, is_verified, is_artist_verified FROM users WHERE id IN (%s)" % ','.join(str(i) for i in uids))
-        users_map = {u['id']: u for u in cur.fetchall()}
+        users_map = user_cards.get_many({c['other_id'] for c in chats}, lambda missing: load_cards(cur, missing))
         for c in chats:
-            c['user'] = users_map.get(c['other_id'], {})
-        for c in chats:
-            cur.execute("SELECT COUNT(*) as cnt FROM messages WHERE sender_id = %s AND receiver_id = %s AND is_read = FALSE" % (c['other_id'], user_id))
-            c['unread_count'] = cur.fetchone()['cnt']
+            c['user'] = dict(users_map.get(c['other_id'], {}))
+            peer_read_id, read_id = c.pop('peer_read_id'), c.pop('read_message_id')
+            c['is_read'] = c['id'] <= (peer_read_id if c['sender_id'] == user_id else read_id)
     chats.sort(key=lambda x: x['created_at'], reverse=True)
     conn.close()
-    return resp(200, {'chats': chats})
+    if getattr(request_ctx, 'table', False):
+        chats = [dict(c.pop('user'), **c) for c in chats]
+    return list_resp('chats', CHAT_COLUMNS, chats)
 
 def send_message(body, user_id):
     if not user_id:
@@ -749,24 +1284,16 @@ def send_message(body, user_id):
     reply_to_id = body.get('reply_to_id')
     if not content:
         return resp(400, {'error': 'Сообщение пустое'})
-    conn = get_db()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT privacy_settings FROM users WHERE id = %s" % receiver_id)
-    receiver = cur.fetchone()
-    if receiver:
-        ps = receiver['privacy_settings']
-        if isinstance(ps, str):
-            ps = json.loads(ps)
-        if ps.get('allow_messages') == 'nobody':
-            conn.close()
-            return resp(403, {'error': 'Пользователь отключил сообщения'})
-    reply_clause = "NULL" if not reply_to_id else str(reply_to_id)
-    cur.execute("INSERT INTO messages (sender_id, receiver_id, content, reply_to_id) VALUES (%s, %s, '%s', %s) RETURNING *" % (user_id, receiver_id, content.replace("'", "''"), reply_clause))
-    msg = cur.fetchone()
-    cur.execute("INSERT INTO notifications (user_id, from_user_id, type) VALUES (%s, %s, 'message')" % (receiver_id, user_id))
-    conn.commit()
-    conn.close()
-    return resp(200, {'message': msg})
+    reply_clause = "NULL" if not reply_to_id else str(int(reply_to_id))
+    spam_state, checked = spam_filter.check(user_id, content)
+    row = run_write("SELECT send_message_v1(%s, %s, '%s', %s, %s::smallint) AS result" % (int(user_id), int(receiver_id), content.replace("'", "''"), reply_clause, spam_state))
+    result = row['result']
+    if result.get('error') == 'blocked':
+        return resp(403, {'error': 'Пользователь недоступен'})
+    if result.get('error') == 'disabled':
+        return resp(403, {'error': 'Пользователь ограничил входящие сообщения'})
+    spam_filter.record(checked)
+    return resp(200, {'message': result['message']})
 
 def mark_read(body, user_id):
     if not user_id:
@@ -774,7 +1301,14 @@ def mark_read(body, user_id):
     other_id = body.get('user_id')
     conn = get_db()
     cur = conn.cursor()
-    cur.execute("UPDATE messages SET is_read = TRUE WHERE sender_id = %s AND receiver_id = %s AND is_read = FALSE" % (other_id, user_id))
+    cur.execute("""
+        WITH c AS (
+            UPDATE conversation_state SET read_message_id = last_message_id, read_message_at = last_message_at,
+                unread_count = 0, version = nextval('sync_version_seq')
+            WHERE user_id = %s AND other_id = %s RETURNING version
+        )
+        SELECT sync_bump_user(%s, version) FROM c
+    """ % (int(user_id), int(other_id), int(user_id)))
     conn.commit()
     conn.close()
     return resp(200, {'ok': True})
@@ -827,11 +1361,14 @@ def get_notifications(user_id):
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cur.execute("""
-        SELECT n.*, u.username, u.display_name, u.avatar_url
-        FROM notifications n JOIN users u ON n.from_user_id = u.id
-        WHERE n.user_id = %s ORDER BY n.created_at DESC LIMIT 50
-    """ % user_id)
-    notifs = cur.fetchall()
+        SELECT n.*, COALESCE(s.notifications_read_id, 0) AS read_id
+        FROM notifications n
+        LEFT JOIN sync_state s ON s.user_id = n.user_id
+        WHERE n.user_id = %s AND n.created_at > NOW() - INTERVAL '%s days' ORDER BY n.created_at DESC LIMIT 50
+    """ % (user_id, NOTIFICATIONS_WINDOW_DAYS))
+    notifs = hydrate_users(cur, [n for n in cur.fetchall() if n['from_user_id']], 'from_user_id', NOTIFICATION_CARD)
+    for n in notifs:
+        n['is_read'] = n['id'] <= n.pop('read_id')
     cur.execute("SELECT id, follower_id FROM follows WHERE following_id = %s AND status = 'pending'" % user_id)
     pending = cur.fetchall()
     if pending:
@@ -841,30 +1378,63 @@ def get_notifications(user_id):
     else:
         pending_users = []
     conn.close()
-    return resp(200, {'notifications': notifs, 'pending_requests': pending_users})
+    return list_resp('notifications', NOTIFICATION_COLUMNS, notifs, pending_requests=pending_users)
 
 def read_notifications(user_id):
     if not user_id:
         return resp(401, {'error': 'Не авторизован'})
     conn = get_db()
     cur = conn.cursor()
-    cur.execute("UPDATE notifications SET is_read = TRUE WHERE user_id = %s" % user_id)
+    cur.execute("""
+        INSERT INTO sync_state (user_id, version) VALUES (%s, nextval('sync_version_seq'))
+        ON CONFLICT (user_id) DO UPDATE SET notifications_read_id = sync_state.last_notification_id,
+            unread_notifications = 0, version = EXCLUDED.version
+    """ % int(user_id))
     conn.commit()
     conn.close()
     return resp(200, {'ok': True})
 
+def get_sync_state(params, user_id):
+    if not user_id:
+        return resp(401, {'error': 'Не авторизован'})
+    since = int(params.get('since', 0))
+    deadline = time.time() + min(int(params.get('wait', 0)), SYNC_MAX_WAIT)
+    other_id = params.get('user_id')
+    while True:
+        conn = get_db()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute("SELECT version, last_notification_id, unread_notifications FROM sync_state WHERE user_id = %s" % user_id)
+        state = cur.fetchone() or {'version': 0, 'last_notification_id': 0, 'unread_notifications': 0}
+        if state['version'] > since or time.time() >= deadline:
+            break
+        conn.close()
+        time.sleep(SYNC_POLL_INTERVAL)
+    conversations = []
+    if state['version'] > since:
+        other_clause = " AND other_id = %s" % int(other_id) if other_id else ""
+        cur.execute("SELECT other_id as user_id, last_message_id, unread_count, version FROM conversation_state WHERE user_id = %s AND version > %s%s" % (user_id, since, other_clause))
+        conversations = cur.fetchall()
+    conn.close()
+    return resp(200, {
+        'version': state['version'],
+        'changed': state['version'] > since,
+        'notifications': {'last_id': state['last_notification_id'], 'unread': state['unread_notifications']},
+        'conversations': conversations,
+    })
+
 def get_stories(params, user_id):
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cur.execute("""
-        SELECT s.*, u.username, u.display_name, u.avatar_url, u.is_verified
-        FROM stories s JOIN users u ON s.user_id = u.id
-        WHERE s.expires_at > NOW()
+        SELECT s.* FROM stories s
+        WHERE s.expires_at > NOW()%s
         ORDER BY s.created_at DESC
-    """)
-    stories = cur.fetchall()
+    """ % not_blocked_clause('s.user_id', user_id))
+    stories = hydrate_users(cur, cur.fetchall())
     filtered = []
     for s in stories:
+        if s['user_id'] != user_id:
+            s.pop('views_count', None)
         if s['visibility'] == 'all':
             filtered.append(s)
         elif user_id:
@@ -900,7 +1470,12 @@ def view_story(body, user_id):
     story_id = body.get('story_id')
     conn = get_db()
     cur = conn.cursor()
-    cur.execute("INSERT INTO story_views (story_id, viewer_id) VALUES (%s, %s) ON CONFLICT DO NOTHING" % (story_id, user_id))
+    cur.execute("""
+        WITH v AS (
+            INSERT INTO story_views (story_id, viewer_id) VALUES (%s, %s) ON CONFLICT DO NOTHING RETURNING story_id
+        )
+        UPDATE stories SET views_count = views_count + 1 WHERE id IN (SELECT story_id FROM v)
+    """ % (story_id, user_id))
     conn.commit()
     conn.close()
     return resp(200, {'ok': True})
@@ -938,7 +1513,7 @@ def request_verification(body, user_id):
 def create_appeal(body, user_id):
     if not user_id:
         return resp(401, {'error': 'Не авторизован'})
-    reason = body.get('reason', '')
+    reason = body.get('reason', body.get('text', ''))
     conn = get_db()
     cur = conn.cursor()
     cur.execute("INSERT INTO appeals (user_id, reason) VALUES (%s, '%s')" % (user_id, reason.replace("'", "''")))
@@ -969,71 +1544,70 @@ def unblock_user(body, user_id):
     return resp(200, {'ok': True})
 
 def get_user_likes(params, user_id):
-    target_id = params.get('user_id')
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT privacy_settings FROM users WHERE id = %s" % target_id)
-    u = cur.fetchone()
-    ps = u['privacy_settings'] if u else {}
-    if isinstance(ps, str):
-        ps = json.loads(ps)
-    if ps.get('show_likes') == 'nobody' and int(target_id) != user_id:
-        conn.close()
-        return resp(200, {'posts': [], 'hidden': True})
-    cur.execute("""
-        SELECT p.*, u.username, u.display_name, u.avatar_url, u.is_verified
-        FROM likes l JOIN posts p ON l.post_id = p.id JOIN users u ON p.user_id = u.id
-        WHERE l.user_id = %s AND l.post_id IS NOT NULL AND p.is_removed = FALSE
+    visible, posts = fetch_guarded(cur, 'show_likes', params.get('user_id'), user_id, """
+        SELECT p.* FROM likes l JOIN posts p ON l.post_id = p.id
+        WHERE l.user_id = target.id AND l.post_id IS NOT NULL AND p.is_removed = FALSE%s
         ORDER BY l.created_at DESC LIMIT 50
-    """ % target_id)
-    posts = cur.fetchall()
+    """ % not_held_clause('p', user_id))
+    hydrate_users(cur, posts)
     conn.close()
-    return resp(200, {'posts': posts, 'hidden': False})
+    return resp(200, {'posts': posts, 'hidden': not visible})
 
 def get_user_reposts(params, user_id):
-    target_id = params.get('user_id')
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT privacy_settings FROM users WHERE id = %s" % target_id)
-    u = cur.fetchone()
-    ps = u['privacy_settings'] if u else {}
-    if isinstance(ps, str):
-        ps = json.loads(ps)
-    if ps.get('show_reposts') == 'nobody' and int(target_id) != user_id:
-        conn.close()
-        return resp(200, {'posts': [], 'hidden': True})
-    cur.execute("""
-        SELECT p.*, u.username, u.display_name, u.avatar_url, u.is_verified,
-        op.content as original_content, op.media_urls as original_media, ou.username as original_username
-        FROM posts p JOIN users u ON p.user_id = u.id
-        LEFT JOIN posts op ON p.original_post_id = op.id LEFT JOIN users ou ON op.user_id = ou.id
-        WHERE p.user_id = %s AND p.is_repost = TRUE AND p.is_removed = FALSE
+    visible, posts = fetch_guarded(cur, 'show_reposts', params.get('user_id'), user_id, """
+        SELECT p.*, op.content as original_content, op.media_urls as original_media, op.user_id as original_user_id
+        FROM posts p LEFT JOIN posts op ON p.original_post_id = op.id
+        WHERE p.user_id = target.id AND p.is_repost = TRUE AND p.is_removed = FALSE%s
         ORDER BY p.created_at DESC LIMIT 50
-    """ % target_id)
-    posts = cur.fetchall()
+    """ % not_held_clause('p', user_id))
+    hydrate_users(cur, posts)
+    hydrate_users(cur, posts, 'original_user_id', {'username': 'original_username'})
     conn.close()
-    return resp(200, {'posts': posts, 'hidden': False})
+    return resp(200, {'posts': posts, 'hidden': not visible})
 
-def get_blocked_ids(cur, user_id):
+def not_blocked_clause(column, user_id):
     if not user_id:
-        return []
-    cur.execute("SELECT blocked_id FROM user_blocks WHERE blocker_id = %s AND blocked_id IS NOT NULL" % user_id)
-    return [r['blocked_id'] for r in cur.fetchall()]
+        return ""
+    return """ AND NOT EXISTS (
+        SELECT 1 FROM user_blocks b
+        WHERE (b.blocker_id = %s AND b.blocked_id = %s) OR (b.blocker_id = %s AND b.blocked_id = %s)
+    )""" % (int(user_id), column, column, int(user_id))
+
+def not_held_clause(alias, user_id):
+    """Запись, задержанная фильтром спама, видна только автору"""
+    return " AND (%s.spam_state < %s OR %s.user_id = %s)" % (alias, HELD, alias, int(user_id or 0))
+
+def is_admin(cur, user_id):
+    memo = getattr(request_ctx, 'admin', None)
+    if memo is not None and user_id in memo:
+        return memo[user_id]
+    cur.execute("SELECT is_admin FROM users WHERE id = %s" % user_id)
+    row = cur.fetchone()
+    result = bool(row and row['is_admin'])
+    if memo is not None:
+        memo[user_id] = result
+    return result
 
 def admin_block(body, user_id):
     if not user_id:
         return resp(401, {'error': 'Не авторизован'})
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT is_admin FROM users WHERE id = %s" % user_id)
-    if not cur.fetchone()['is_admin']:
+    if not is_admin(cur, user_id):
         conn.close()
         return resp(403, {'error': 'Нет прав'})
     username = body.get('username', '').strip().lower()
     reason = body.get('reason', 'Нарушение правил сообщества')
-    cur.execute("UPDATE users SET is_blocked = TRUE, block_reason = '%s' WHERE username = '%s'" % (reason.replace("'", "''"), username))
+    cur.execute("UPDATE users SET is_blocked = TRUE, block_reason = '%s' WHERE username = '%s' RETURNING id" % (reason.replace("'", "''"), username.replace("'", "''")))
+    blocked = [r['id'] for r in cur.fetchall()]
     conn.commit()
     conn.close()
+    reads.forget(('profile', username))
+    user_cards.invalidate(*blocked)
     return resp(200, {'ok': True})
 
 def admin_reports(user_id):
@@ -1041,13 +1615,11 @@ def admin_reports(user_id):
         return resp(401, {'error': 'Не авторизован'})
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT is_admin FROM users WHERE id = %s" % user_id)
-    if not cur.fetchone()['is_admin']:
+    if not is_admin(cur, user_id):
         conn.close()
         return resp(403, {'error': 'Нет прав'})
-    cur.execute("""
-        SELECT r.*, ru.username as reporter_username,
-        tu.username as reported_username, p.content as post_content
+    reports = fetch_listing(cur, REPORT_PROJECTION, "r.*, ru.username as reporter_username, tu.username as reported_username, p.content as post_content", """
+        SELECT %s
         FROM reports r
         LEFT JOIN users ru ON r.reporter_id = ru.id
         LEFT JOIN users tu ON r.reported_user_id = tu.id
@@ -1056,15 +1628,14 @@ def admin_reports(user_id):
         ORDER BY r.created_at DESC
     """)
     conn.close()
-    return resp(200, {'reports': cur.fetchall()})
+    return list_resp('reports', list(REPORT_PROJECTION), reports)
 
 def admin_handle_report(body, user_id):
     if not user_id:
         return resp(401, {'error': 'Не авторизован'})
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT is_admin FROM users WHERE id = %s" % user_id)
-    if not cur.fetchone()['is_admin']:
+    if not is_admin(cur, user_id):
         conn.close()
         return resp(403, {'error': 'Нет прав'})
     report_id = body.get('report_id')
@@ -1086,26 +1657,24 @@ def admin_verifications(user_id):
         return resp(401, {'error': 'Не авторизован'})
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT is_admin FROM users WHERE id = %s" % user_id)
-    if not cur.fetchone()['is_admin']:
+    if not is_admin(cur, user_id):
         conn.close()
         return resp(403, {'error': 'Нет прав'})
-    cur.execute("""
-        SELECT v.*, u.username, u.display_name, u.avatar_url
+    verifications = fetch_listing(cur, VERIFICATION_PROJECTION, "v.*, u.username, u.display_name, u.avatar_url", """
+        SELECT %s
         FROM verification_requests v JOIN users u ON v.user_id = u.id
         WHERE v.status = 'pending'
         ORDER BY v.created_at DESC
     """)
     conn.close()
-    return resp(200, {'verifications': cur.fetchall()})
+    return list_resp('verifications', list(VERIFICATION_PROJECTION), verifications)
 
 def admin_verify(body, user_id):
     if not user_id:
         return resp(401, {'error': 'Не авторизован'})
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT is_admin FROM users WHERE id = %s" % user_id)
-    if not cur.fetchone()['is_admin']:
+    if not is_admin(cur, user_id):
         conn.close()
         return resp(403, {'error': 'Нет прав'})
     req_id = body.get('request_id')
@@ -1120,6 +1689,7 @@ def admin_verify(body, user_id):
     cur.execute("UPDATE verification_requests SET status = '%s' WHERE id = %s" % (action, req_id))
     conn.commit()
     conn.close()
+    user_cards.invalidate(req['user_id'])
     return resp(200, {'ok': True})
 
 def admin_appeals(user_id):
@@ -1127,26 +1697,24 @@ def admin_appeals(user_id):
         return resp(401, {'error': 'Не авторизован'})
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT is_admin FROM users WHERE id = %s" % user_id)
-    if not cur.fetchone()['is_admin']:
+    if not is_admin(cur, user_id):
         conn.close()
         return resp(403, {'error': 'Нет прав'})
-    cur.execute("""
-        SELECT a.*, u.username, u.display_name, u.avatar_url
+    appeals = fetch_listing(cur, APPEAL_PROJECTION, "a.*, u.username, u.display_name, u.avatar_url", """
+        SELECT %s
         FROM appeals a JOIN users u ON a.user_id = u.id
         WHERE a.status = 'pending'
         ORDER BY a.created_at DESC
     """)
     conn.close()
-    return resp(200, {'appeals': cur.fetchall()})
+    return list_resp('appeals', list(APPEAL_PROJECTION), appeals)
 
 def admin_handle_appeal(body, user_id):
     if not user_id:
         return resp(401, {'error': 'Не авторизован'})
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT is_admin FROM users WHERE id = %s" % user_id)
-    if not cur.fetchone()['is_admin']:
+    if not is_admin(cur, user_id):
         conn.close()
         return resp(403, {'error': 'Нет прав'})
     appeal_id = body.get('appeal_id')
@@ -1165,8 +1733,7 @@ def admin_add_release(body, user_id):
         return resp(401, {'error': 'Не авторизован'})
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT is_admin FROM users WHERE id = %s" % user_id)
-    if not cur.fetchone()['is_admin']:
+    if not is_admin(cur, user_id):
         conn.close()
         return resp(403, {'error': 'Нет прав'})
     username = body.get('username', '').strip()
@@ -1184,13 +1751,61 @@ def admin_add_release(body, user_id):
     conn.close()
     return resp(200, {'release': release})
 
+def admin_spam(user_id):
+    if not user_id:
+        return resp(401, {'error': 'Не авторизован'})
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    if not is_admin(cur, user_id):
+        conn.close()
+        return resp(403, {'error': 'Нет прав'})
+    cur.execute("""
+        (SELECT 'post' AS kind, id, user_id, content, spam_state, created_at FROM posts
+         WHERE spam_state > 0 AND is_removed = FALSE ORDER BY created_at DESC LIMIT 100)
+        UNION ALL
+        (SELECT 'comment' AS kind, id, user_id, content, spam_state, created_at FROM comments
+         WHERE spam_state > 0 AND is_removed = FALSE ORDER BY created_at DESC LIMIT 100)
+        UNION ALL
+        (SELECT 'message' AS kind, id, sender_id, content, spam_state, created_at FROM messages
+         WHERE spam_state > 0 ORDER BY created_at DESC LIMIT 100)
+        ORDER BY created_at DESC
+    """)
+    items = hydrate_users(cur, cur.fetchall())
+    conn.close()
+    return resp(200, {'items': items})
+
+def admin_release_spam(body, user_id):
+    if not user_id:
+        return resp(401, {'error': 'Не авторизован'})
+    table = {'post': 'posts', 'comment': 'comments', 'message': 'messages'}.get(body.get('kind'))
+    if not table:
+        return resp(400, {'error': 'Неизвестный тип'})
+    conn = get_db()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    if not is_admin(cur, user_id):
+        conn.close()
+        return resp(403, {'error': 'Нет прав'})
+    unhide = ", hidden_by_receiver = t.hidden_by_receiver AND old.spam_state < %s" % HELD if table == 'messages' else ""
+    cur.execute("""
+        UPDATE %s t SET spam_state = 0%s FROM (SELECT id, spam_state FROM %s WHERE id = %s) old
+        WHERE t.id = old.id RETURNING t.*, old.spam_state AS was_state
+    """ % (table, unhide, table, int(body.get('id'))))
+    row = cur.fetchone()
+    if row and row['was_state'] == HELD:
+        if table == 'posts' and row['content']:
+            index_post_text(cur, row['id'], row['user_id'], row['content'])
+        elif table == 'messages':
+            cur.execute("INSERT INTO notifications (user_id, from_user_id, type) VALUES (%s, %s, 'message')" % (row['receiver_id'], row['sender_id']))
+    conn.commit()
+    conn.close()
+    return resp(200, {'ok': True})
+
 def admin_stats(user_id):
     if not user_id:
         return resp(401, {'error': 'Не авторизован'})
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT is_admin FROM users WHERE id = %s" % user_id)
-    if not cur.fetchone()['is_admin']:
+    if not is_admin(cur, user_id):
         conn.close()
         return resp(403, {'error': 'Нет прав'})
     cur.execute("SELECT COUNT(*) as cnt FROM users WHERE is_blocked = FALSE")
@@ -1207,12 +1822,20 @@ def admin_stats(user_id):
     return resp(200, {'users': users_count, 'posts': posts_count, 'reports': reports_count, 'verifications': verif_count, 'appeals': appeals_count})
 
 def get_releases(params):
-    user_id = params.get('user_id')
+    user_id = int(params.get('user_id'))
+    return resp(200, {'releases': reads.do(('releases', user_id), lambda: load_releases(user_id))})
+
+def load_releases(user_id):
     conn = get_db()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cur.execute("SELECT * FROM releases WHERE user_id = %s ORDER BY created_at DESC" % user_id)
+    releases = cur.fetchall()
     conn.close()
-    return resp(200, {'releases': cur.fetchall()})
+    return releases
+
+def get_metrics():
+    return resp(200, {'singleflight': reads.metrics(), 'rate_limit': limiter.metrics(), 'user_cards': user_cards.metrics(),
+                      'username_ids': username_ids.metrics(), 'spam': spam_filter.metrics()})
 
 def update_theme(body, user_id):
     if not user_id:
@@ -1228,10 +1851,15 @@ def update_theme(body, user_id):
 def update_privacy(body, user_id):
     if not user_id:
         return resp(401, {'error': 'Не авторизован'})
-    settings = body.get('settings', {})
+    try:
+        settings = privacy.normalize(body.get('settings', {}))
+    except ValueError:
+        return resp(400, {'error': 'Недопустимое значение настройки'})
+    if not settings:
+        return resp(200, {'ok': True})
     conn = get_db()
     cur = conn.cursor()
-    cur.execute("UPDATE users SET privacy_settings = '%s' WHERE id = %s" % (json.dumps(settings).replace("'", "''"), user_id))
+    cur.execute("UPDATE users SET %s WHERE id = %s" % (', '.join("%s = '%s'" % kv for kv in settings.items()), int(user_id)))
     conn.commit()
     conn.close()
     return resp(200, {'ok': True})
@@ -1241,9 +1869,229 @@ def remove_account(user_id):
         return resp(401, {'error': 'Не авторизован'})
     conn = get_db()
     cur = conn.cursor()
-    cur.execute("UPDATE users SET is_blocked = TRUE, block_reason = 'Аккаунт удалён пользователем', username = username || '_removed_' || '%s' WHERE id = %s" % (int(time.time()), user_id))
+    cur.execute("""
+        UPDATE users u SET is_blocked = TRUE, block_reason = 'Аккаунт удалён пользователем', username = u.username || '_removed_' || '%s'
+        FROM users old WHERE u.id = old.id AND u.id = %s RETURNING old.username
+    """ % (int(time.time()), int(user_id)))
+    old_names = [r[0] for r in cur.fetchall()]
     conn.commit()
     conn.close()
     global tokens
     tokens = {k: v for k, v in tokens.items() if v != user_id}
+    username_ids.invalidate(*old_names)
+    user_cards.invalidate(user_id)
     return resp(200, {'ok': True})
+
+def run_batch(body, user_id):
+    requests = body.get('requests') or []
+    if not isinstance(requests, list) or not requests:
+        return resp(400, {'error': 'Пустой пакет'})
+    if len(requests) > BATCH_MAX_REQUESTS:
+        return resp(400, {'error': 'Слишком много запросов в пакете'})
+    for r in requests:
+        if r.get('path', '').split('?')[0] == '/batch' or r.get('path') in UPLOAD_ROUTES:
+            return resp(400, {'error': 'Недопустимый подзапрос'})
+    ip = getattr(request_ctx, 'client_ip', None) or 'unknown'
+    results, allowed = [None] * len(requests), []
+    for i, r in enumerate(requests):
+        retry_after = check_rate(r.get('method', 'GET').upper(), r.get('path', '/').split('?')[0], user_id, ip)
+        if retry_after:
+            results[i] = {'id': r.get('id'), 'status': 429, 'body': {'error': 'Слишком много запросов', 'retry_after': retry_after}}
+        else:
+            allowed.append(i)
+    admin_memo = {}
+    read_only = all(r.get('method', 'GET').upper() == 'GET' for r in requests)
+    read_after = getattr(request_ctx, 'read_after', None)
+    if body.get('parallel') and read_only:
+        import psycopg2.pool
+        from concurrent.futures import ThreadPoolExecutor
+        global batch_pool
+        if batch_pool is None:
+            batch_pool = psycopg2.pool.ThreadedConnectionPool(1, BATCH_WORKERS, CONFIG['database_url'])
+        with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+            done = list(executor.map(lambda i: run_pooled(requests[i], user_id, admin_memo, read_after), allowed))
+    else:
+        replica = get_replica_conn(read_after) if read_only and CONFIG['replica_urls'] else None
+        conn = replica.conn if replica else psycopg2.connect(CONFIG['database_url'])
+        try:
+            done = [run_shared(conn, requests[i], user_id, admin_memo) for i in allowed]
+        finally:
+            if replica:
+                replica.close()
+            else:
+                conn.close()
+    for i, result in zip(allowed, done):
+        results[i] = result
+        r = requests[i]
+        if result['status'] < 400 and is_write(r.get('method', 'GET').upper(), r.get('path', '/').split('?')[0]):
+            request_ctx.wrote = True
+    return resp(200, {'responses': results})
+
+def run_pooled(request, user_id, admin_memo, read_after=None):
+    """Параллельный пакет состоит только из GET: сначала реплика, если она догнала запись пользователя"""
+    replica = get_replica_conn(read_after) if CONFIG['replica_urls'] else None
+    if replica:
+        try:
+            return run_shared(replica.conn, request, user_id, admin_memo)
+        finally:
+            replica.close()
+    conn = batch_pool.getconn()
+    try:
+        return run_shared(conn, request, user_id, admin_memo)
+    finally:
+        batch_pool.putconn(conn)
+
+def run_shared(conn, request, user_id, admin_memo):
+    request_ctx.conn = SharedConnection(conn)
+    request_ctx.admin = admin_memo
+    try:
+        method = request.get('method', 'GET').upper()
+        path, _, query = request.get('path', '/').partition('?')
+        params = dict(parse_qsl(query), **(request.get('params') or {}))
+        result = route(method, path, params, request.get('body') or {}, user_id)
+    finally:
+        conn.rollback()
+        request_ctx.conn = None
+        request_ctx.admin = None
+    return {'id': request.get('id'), 'status': result['statusCode'], 'body': json.loads(result['body']) if result['body'] else None}
+
+def parse_action(value):
+    if value not in ('accept', 'reject'):
+        raise ValueError(value)
+    return value
+
+def user_ref(args):
+    """Подставляет user_id по username из пути /users/{username}/..."""
+    if 'username' not in args or 'user_id' in args:
+        return args
+    username = args['username']
+    found = username_ids.get_many([username], load_username_ids)
+    return dict(args, user_id=found.get(username, 0))
+
+def load_username_ids(usernames):
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute("SELECT username, id FROM users WHERE username IN (%s)" % ','.join("'%s'" % u.replace("'", "''") for u in usernames))
+    rows = cur.fetchall()
+    conn.close()
+    return dict(rows)
+
+router = Router(converters={'action': parse_action})
+
+router.add('POST', '/auth/register', lambda p, b, u: register(b))
+router.add('POST', '/auth/login', lambda p, b, u: login(b))
+router.add('GET', '/auth/me', lambda p, b, u: get_me(u))
+router.add('GET', '/feed', lambda p, b, u: get_feed(p, u))
+router.add('POST', '/posts', lambda p, b, u: create_post(b, u))
+router.add('POST', '/posts/view', lambda p, b, u: view_post(b))
+router.add('POST', '/posts/like', lambda p, b, u: like_post(b, u))
+router.add('POST', '/posts/repost', lambda p, b, u: repost(b, u))
+router.add('POST', '/posts/remove', lambda p, b, u: remove_post(b, u))
+router.add('GET', '/post', lambda p, b, u: get_post(p, u))
+router.add('GET', '/comments', lambda p, b, u: get_comments(p, u))
+router.add('GET', '/comments/replies', lambda p, b, u: get_comment_replies(p, u))
+router.add('POST', '/comments', lambda p, b, u: add_comment(b, u))
+router.add('POST', '/comments/like', lambda p, b, u: like_comment(b, u))
+router.add('POST', '/comments/pin', lambda p, b, u: pin_comment(b, u))
+router.add('POST', '/comments/remove', lambda p, b, u: remove_comment(b, u))
+router.add('GET', '/profile', lambda p, b, u: get_profile(p, u))
+router.add('POST', '/profile/update', lambda p, b, u: update_profile(b, u))
+router.add('POST', '/profile/avatar', lambda p, b, u: update_avatar(b, u))
+router.add('POST', '/profile/avatar/remove', lambda p, b, u: remove_avatar(b, u))
+router.add('POST', '/follow', lambda p, b, u: follow_user(b, u))
+router.add('POST', '/unfollow', lambda p, b, u: unfollow_user(b, u))
+router.add('POST', '/follow/request', lambda p, b, u: handle_follow_request(b, u))
+router.add('GET', '/followers', lambda p, b, u: get_followers(p, u))
+router.add('GET', '/following', lambda p, b, u: get_following(p, u))
+router.add('GET', '/friends', lambda p, b, u: get_friends(p, u))
+router.add('GET', '/search', lambda p, b, u: search_users(p, u))
+router.add('GET', '/messages', lambda p, b, u: get_messages(p, u))
+router.add('GET', '/messages/chats', lambda p, b, u: get_chats(u))
+router.add('POST', '/messages/send', lambda p, b, u: send_message(b, u))
+router.add('POST', '/messages/read', lambda p, b, u: mark_read(b, u))
+router.add('POST', '/messages/edit', lambda p, b, u: edit_message(b, u))
+router.add('POST', '/messages/pin', lambda p, b, u: pin_message(b, u))
+router.add('POST', '/messages/hide', lambda p, b, u: hide_message(b, u))
+router.add('GET', '/notifications', lambda p, b, u: get_notifications(u))
+router.add('POST', '/notifications/read', lambda p, b, u: read_notifications(u))
+router.add('GET', '/stories', lambda p, b, u: get_stories(p, u))
+router.add('POST', '/stories', lambda p, b, u: create_story(b, u))
+router.add('POST', '/stories/view', lambda p, b, u: view_story(b, u))
+router.add('POST', '/report', lambda p, b, u: create_report(b, u))
+router.add('POST', '/verification/request', lambda p, b, u: request_verification(b, u))
+router.add('POST', '/appeal', lambda p, b, u: create_appeal(b, u))
+router.add('POST', '/block', lambda p, b, u: block_user(b, u))
+router.add('POST', '/unblock', lambda p, b, u: unblock_user(b, u))
+router.add('GET', '/user/likes', lambda p, b, u: get_user_likes(p, u))
+router.add('GET', '/user/reposts', lambda p, b, u: get_user_reposts(p, u))
+router.add('POST', '/admin/block', lambda p, b, u: admin_block(b, u))
+router.add('GET', '/admin/reports', lambda p, b, u: admin_reports(u))
+router.add('POST', '/admin/report/handle', lambda p, b, u: admin_handle_report(b, u))
+router.add('GET', '/admin/verifications', lambda p, b, u: admin_verifications(u))
+router.add('POST', '/admin/verify', lambda p, b, u: admin_verify(b, u))
+router.add('GET', '/admin/appeals', lambda p, b, u: admin_appeals(u))
+router.add('POST', '/admin/appeal/handle', lambda p, b, u: admin_handle_appeal(b, u))
+router.add('POST', '/admin/releases', lambda p, b, u: admin_add_release(b, u))
+router.add('GET', '/admin/stats', lambda p, b, u: admin_stats(u))
+router.add('GET', '/admin/spam', lambda p, b, u: admin_spam(u))
+router.add('POST', '/admin/spam/release', lambda p, b, u: admin_release_spam(b, u))
+router.add('GET', '/releases', lambda p, b, u: get_releases(p))
+router.add('POST', '/settings/theme', lambda p, b, u: update_theme(b, u))
+router.add('POST', '/settings/privacy', lambda p, b, u: update_privacy(b, u))
+router.add('POST', '/account/remove', lambda p, b, u: remove_account(u))
+
+router.add('GET', '/posts/feed', lambda p, b, u: get_feed(p, u))
+router.add('POST', '/posts/create', lambda p, b, u: create_post(b, u))
+router.add('GET', '/posts/{id:int}', lambda p, b, u: get_post(p, u))
+router.add('POST', '/posts/{post_id:int}/view', lambda p, b, u: view_post(b))
+router.add('POST', '/posts/{post_id:int}/like', lambda p, b, u: like_post(b, u))
+router.add('POST', '/posts/{post_id:int}/repost', lambda p, b, u: repost(b, u))
+router.add('POST', '/posts/{post_id:int}/delete', lambda p, b, u: remove_post(b, u))
+router.add('POST', '/posts/{post_id:int}/report', lambda p, b, u: create_report(b, u))
+router.add('GET', '/posts/{post_id:int}/comments', lambda p, b, u: get_comments(p, u))
+router.add('POST', '/posts/{post_id:int}/comment', lambda p, b, u: add_comment(b, u))
+router.add('POST', '/comments/{comment_id:int}/like', lambda p, b, u: like_comment(b, u))
+router.add('POST', '/comments/{comment_id:int}/pin', lambda p, b, u: pin_comment(b, u))
+router.add('POST', '/comments/{comment_id:int}/delete', lambda p, b, u: remove_comment(b, u))
+router.add('GET', '/users/search', lambda p, b, u: search_users(p, u))
+router.add('POST', '/users/me/update', lambda p, b, u: update_profile(b, u))
+router.add('POST', '/users/me/theme', lambda p, b, u: update_theme(b, u))
+router.add('POST', '/users/me/privacy', lambda p, b, u: update_privacy({'settings': b.get('settings', b)}, u))
+router.add('POST', '/users/me/delete', lambda p, b, u: remove_account(u))
+router.add('GET', '/users/{username}/profile', lambda p, b, u: get_profile(p, u))
+router.add('GET', '/users/{username}/posts', lambda p, b, u: get_profile(p, u))
+router.add('GET', '/users/{username}/likes', lambda p, b, u: get_user_likes(user_ref(p), u))
+router.add('GET', '/users/{username}/reposts', lambda p, b, u: get_user_reposts(user_ref(p), u))
+router.add('GET', '/users/{username}/releases', lambda p, b, u: get_releases(user_ref(p)))
+router.add('GET', '/users/{username}/followers', lambda p, b, u: get_followers(user_ref(p), u))
+router.add('GET', '/users/{username}/following', lambda p, b, u: get_following(user_ref(p), u))
+router.add('GET', '/users/{username}/friends', lambda p, b, u: get_friends(user_ref(p), u))
+router.add('POST', '/users/{username}/follow', lambda p, b, u: follow_user(user_ref(b), u))
+router.add('POST', '/users/{username}/unfollow', lambda p, b, u: unfollow_user(user_ref(b), u))
+router.add('POST', '/users/{username}/block', lambda p, b, u: block_user(user_ref(b), u))
+router.add('POST', '/users/{username}/unblock', lambda p, b, u: unblock_user(user_ref(b), u))
+router.add('POST', '/users/{username}/report', lambda p, b, u: create_report(user_ref(b), u))
+router.add('GET', '/messages/{user_id:int}', lambda p, b, u: get_messages(p, u))
+router.add('POST', '/messages/{message_id:int}/pin', lambda p, b, u: pin_message(b, u))
+router.add('POST', '/notifications/read-all', lambda p, b, u: read_notifications(u))
+router.add('GET', '/metrics', lambda p, b, u: get_metrics())
+router.add('POST', '/batch', lambda p, b, u: run_batch(b, u))
+router.add('GET', '/sync/state', lambda p, b, u: get_sync_state(p, u))
+router.add('GET', '/follow-requests', lambda p, b, u: get_follow_requests(u))
+router.add('GET', '/tags/trending', lambda p, b, u: get_trending_tags())
+router.add('GET', '/tags/{tag}', lambda p, b, u: get_tag_feed(p, u))
+router.add('GET', '/mentions', lambda p, b, u: get_mentions(p, u))
+router.add('POST', '/follow-requests/{request_id:int}/{action:action}', lambda p, b, u: handle_follow_request(b, u))
+router.add('POST', '/admin/block-user', lambda p, b, u: admin_block(b, u))
+router.add('POST', '/admin/reports/{report_id:int}/{action:action}', lambda p, b, u: admin_handle_report(b, u))
+router.add('POST', '/admin/verifications/{request_id:int}/{action:action}', lambda p, b, u: admin_verify(b, u))
+router.add('POST', '/admin/appeals/{appeal_id:int}/{action:action}', lambda p, b, u: admin_handle_appeal(b, u))
+router.add('POST', '/admin/releases/add', lambda p, b, u: admin_add_release(b, u))
+
+UPLOAD_ROUTES = {
+    '/upload': upload_media,
+    '/users/me/avatar': upload_avatar,
+}
+
+if CONFIG['prewarm'] and CONFIG['database_url']:
+    prewarm_db()
@@ -0,0 +1,255 @@
+"""Загрузка медиа: потоковый разбор multipart, хранение по sha256, превью"""
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 64 * 1024
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+MAX_FIELD_BYTES = 64 * 1024
+MAX_HEADER_BYTES = 16 * 1024
+THUMB_SIZES = (160, 480)
+THUMB_WORKERS = 4
+
+EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'video/mp4': '.mp4',
+    'video/quicktime': '.mov',
+}
+
+thumb_pool = ThreadPoolExecutor(max_workers=THUMB_WORKERS)
+
+class UploadError(Exception):
+    pass
+
+class LocalStorage:
+    def __init__(self, root, base_url):
+        self.root = root
+        self.base_url = base_url.rstrip('/')
+
+    def exists(self, key):
+        return os.path.exists(os.path.join(self.root, key))
+
+    def save(self, key, path, content_type):
+        target = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target)
+
+    def url(self, key):
+        return '%s/%s' % (self.base_url, key)
+
+class S3Storage:
+    def __init__(self, bucket='files'):
+        import boto3
+        self.bucket = bucket
+        self.client = boto3.client(
+            's3',
+            endpoint_url='https://bucket.poehali.dev',
+            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
+        )
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except Exception:
+            return False
+
+    def save(self, key, path, content_type):
+        with open(path, 'rb') as f:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=f, ContentType=content_type)
+
+    def url(self, key):
+        return 'https://cdn.poehali.dev/projects/%s/bucket/%s' % (os.environ['AWS_ACCESS_KEY_ID'], key)
+
+storage = None
+
+def get_storage():
+    global storage
+    if storage is None:
+        if os.environ.get('MEDIA_STORAGE', 's3' if os.environ.get('AWS_ACCESS_KEY_ID') else 'local') == 's3':
+            storage = S3Storage()
+        else:
+            storage = LocalStorage(os.environ.get('MEDIA_ROOT', os.path.join(tempfile.gettempdir(), 'buzzy-media')),
+                                   os.environ.get('MEDIA_BASE_URL', '/media'))
+    return storage
+
+def boundary_from(content_type):
+    for part in content_type.split(';'):
+        name, _, value = part.strip().partition('=')
+        if name.lower() == 'boundary' and value:
+            return value.strip('"').encode('latin-1')
+    raise UploadError('Нет boundary в Content-Type')
+
+def iter_event_body(event):
+    body = event.get('body') or ''
+    if not event.get('isBase64Encoded'):
+        data = body.encode('utf-8') if isinstance(body, str) else body
+        for i in range(0, len(data), CHUNK_SIZE):
+            yield data[i:i + CHUNK_SIZE]
+        return
+    step = CHUNK_SIZE // 3 * 4
+    for i in range(0, len(body), step):
+        yield base64.b64decode(body[i:i + step])
+
+class FilePart:
+    def __init__(self, filename, content_type):
+        self.filename = filename
+        self.content_type = content_type
+        self.size = 0
+        self.sha = hashlib.sha256()
+        self.file = tempfile.NamedTemporaryFile(delete=False)
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > MAX_UPLOAD_BYTES:
+            raise UploadError('Файл слишком большой')
+        self.sha.update(data)
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+    def discard(self):
+        if os.path.exists(self.file.name):
+            os.unlink(self.file.name)
+
+class FieldPart:
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+        if len(self.data) > MAX_FIELD_BYTES:
+            raise UploadError('Поле формы слишком большое')
+
+    def close(self):
+        pass
+
+def parse_part_headers(raw):
+    headers = {}
+    for line in raw.decode('utf-8', 'replace').split('\r\n'):
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    disposition = {}
+    for item in headers.get('content-disposition', '').split(';')[1:]:
+        key, _, value = item.strip().partition('=')
+        disposition[key.lower()] = value.strip('"')
+    return disposition, headers.get('content-type', 'application/octet-stream')
+
+def parse_multipart(chunks, boundary):
+    """Разбирает multipart по мере поступления чанков, файлы пишет во временные файлы"""
+    delimiter = b'\r\n--' + boundary
+    buf = b'\r\n'
+    state = 'preamble'
+    fields, files = {}, []
+    part = None
+    chunks = iter(chunks)
+    try:
+        while True:
+            need_more = False
+            if state == 'preamble':
+                idx = buf.find(delimiter)
+                if idx < 0:
+                    buf = buf[-len(delimiter):]
+                    need_more = True
+                else:
+                    buf = buf[idx + len(delimiter):]
+                    state = 'delimiter'
+            elif state == 'delimiter':
+                if len(buf) < 2:
+                    need_more = True
+                elif buf[:2] == b'--':
+                    return fields, files
+                else:
+                    buf = buf[2:]
+                    state = 'headers'
+            elif state == 'headers':
+                idx = buf.find(b'\r\n\r\n')
+                if idx < 0:
+                    if len(buf) > MAX_HEADER_BYTES:
+                        raise UploadError('Слишком длинные заголовки части')
+                    need_more = True
+                else:
+                    disposition, content_type = parse_part_headers(buf[:idx])
+                    name = disposition.get('name', '')
+                    if 'filename' in disposition:
+                        part = FilePart(disposition['filename'], content_type)
+                        files.append((name, part))
+                    else:
+                        part = FieldPart()
+                        fields[name] = part
+                    buf = buf[idx + 4:]
+                    state = 'body'
+            else:
+                idx = buf.find(delimiter)
+                if idx >= 0:
+                    part.write(buf[:idx])
+                    part.close()
+                    buf = buf[idx + len(delimiter):]
+                    state = 'delimiter'
+                else:
+                    safe = len(buf) - len(delimiter) + 1
+                    if safe > 0:
+                        part.write(buf[:safe])
+                        buf = buf[safe:]
+                    need_more = True
+            if need_more:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    raise UploadError('Тело запроса оборвано')
+                buf += chunk
+    except Exception:
+        for _, f in files:
+            f.close()
+            f.discard()
+        raise
+
+def make_thumbnail(path, size):
+    from PIL import Image
+    with Image.open(path) as img:
+        img = img.convert('RGB')
+        img.thumbnail((size, size))
+        out = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
+        img.save(out, 'JPEG', quality=80, optimize=True)
+        out.close()
+        return out.name
+
+def store_file(path, sha, content_type):
+    """Сохраняет файл под ключом sha256 и строит превью в пуле потоков; возвращает (url, {размер: url})"""
+    backend = get_storage()
+    key = 'media/%s/%s%s' % (sha[:2], sha, EXTENSIONS.get(content_type, ''))
+    if not backend.exists(key):
+        backend.save(key, path, content_type)
+    thumbs = {}
+    if content_type.startswith('image/'):
+        futures = {size: thumb_pool.submit(make_thumbnail, path, size) for size in THUMB_SIZES}
+        for size, future in futures.items():
+            try:
+                thumb_path = future.result()
+            except Exception:
+                continue
+            thumb_key = 'thumbs/%s/%s_%s.jpg' % (sha[:2], sha, size)
+            backend.save(thumb_key, thumb_path, 'image/jpeg')
+            os.unlink(thumb_path)
+            thumbs[size] = backend.url(thumb_key)
+    return backend.url(key), thumbs
+
+def decode_data_url(data_url):
+    header, _, payload = data_url.partition(',')
+    content_type = header[5:].split(';')[0] or 'application/octet-stream'
+    if content_type not in EXTENSIONS:
+        raise UploadError('Неподдерживаемый тип файла')
+    raw = base64.b64decode(payload) if ';base64' in header else payload.encode('utf-8')
+    if len(raw) > MAX_UPLOAD_BYTES:
+        raise UploadError('Файл слишком большой')
+    out = tempfile.NamedTemporaryFile(delete=False)
+    out.write(raw)
+    out.close()
+    return out.name, hashlib.sha256(raw).hexdigest(), content_type
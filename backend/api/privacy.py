@@ -0,0 +1,44 @@
+"""Настройки приватности: типизированные колонки users и их компиляция в SQL-предикаты основного запроса"""
+
+AUDIENCES = ('all', 'followers', 'mutual', 'nobody')
+
+SETTINGS = ('show_likes', 'show_reposts', 'show_followers', 'show_following', 'show_friends', 'allow_messages')
+
+KEY_ALIASES = {
+    'who_sees_likes': 'show_likes',
+    'who_sees_reposts': 'show_reposts',
+    'who_sees_followers': 'show_followers',
+    'who_sees_following': 'show_following',
+    'who_sees_friends': 'show_friends',
+    'who_can_message': 'allow_messages',
+}
+
+VALUE_ALIASES = {'everyone': 'all', 'friends': 'mutual'}
+
+def normalize(settings):
+    """{колонка: аудитория} только для известных ключей; неизвестное значение — ValueError"""
+    out = {}
+    for key, value in (settings or {}).items():
+        column = KEY_ALIASES.get(key, key)
+        if column not in SETTINGS:
+            continue
+        value = VALUE_ALIASES.get(value, value)
+        if value not in AUDIENCES:
+            raise ValueError(value)
+        out[column] = value
+    return out
+
+def follows_sql(follower, following):
+    return "EXISTS (SELECT 1 FROM follows pf WHERE pf.follower_id = %s AND pf.following_id = %s AND pf.status = 'active')" % (follower, following)
+
+def allows(setting, alias, viewer):
+    """Предикат «зритель видит данные владельца alias по настройке setting»: отношение self / follower / mutual / none
+    разворачивается в условия на follows, которые проверяются только для аудиторий followers и mutual"""
+    if setting not in SETTINGS:
+        raise ValueError(setting)
+    column, owner = '%s.%s' % (alias, setting), '%s.id' % alias
+    if not viewer:
+        return "(%s = 'all')" % column
+    viewer = int(viewer)
+    return "(%s = %s OR %s = 'all' OR (%s = 'followers' AND %s) OR (%s = 'mutual' AND %s AND %s))" % (
+        owner, viewer, column, column, follows_sql(viewer, owner), column, follows_sql(viewer, owner), follows_sql(owner, viewer))
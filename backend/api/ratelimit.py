@@ -0,0 +1,122 @@
+"""Ограничение частоты запросов: token bucket в памяти и необязательное общее хранилище (Postgres или Redis)"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+REDIS_SCRIPT = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 't') or ARGV[2])
+local at = tonumber(redis.call('HGET', KEYS[1], 'a') or ARGV[3])
+tokens = math.min(tonumber(ARGV[2]), tokens + (tonumber(ARGV[3]) - at) * tonumber(ARGV[1]))
+local allowed = 0
+if tokens >= tonumber(ARGV[4]) then
+    tokens = tokens - tonumber(ARGV[4])
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 't', tokens, 'a', ARGV[3])
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[2]) / tonumber(ARGV[1])) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+class MemoryBuckets:
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def take(self, key, rate, burst, cost=1):
+        """Списывает cost токенов; возвращает (разрешено, через сколько секунд повторить)"""
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) >= self.max_entries:
+                    self.prune(now)
+                bucket = self.buckets[key] = [burst, now, rate, burst]
+            else:
+                self.buckets.move_to_end(key)
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= cost:
+                bucket[0] = tokens - cost
+                return True, 0
+            bucket[0] = tokens
+            return False, (cost - tokens) / rate
+
+    def prune(self, now):
+        """Удаляет заполненные корзины, затем самые давно использованные — до 90% ёмкости;
+        сброс всей таблицы снял бы лимит со всех клиентов сразу"""
+        for key in [k for k, (tokens, at, rate, burst) in self.buckets.items() if tokens + (now - at) * rate >= burst]:
+            del self.buckets[key]
+        while len(self.buckets) >= self.max_entries * 0.9:
+            self.buckets.popitem(last=False)
+
+class PostgresBuckets:
+    """Общие корзины в UNLOGGED-таблице rate_limit_buckets; отдельное соединение, не из запроса"""
+    def __init__(self, database_url):
+        self.database_url = database_url
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def take(self, key, rate, burst, cost=1):
+        import psycopg2
+        refill = "LEAST(%s, b.tokens + EXTRACT(EPOCH FROM NOW() - b.updated_at) * %s)" % (float(burst), float(rate))
+        with self.lock:
+            if self.conn is None or self.conn.closed:
+                self.conn = psycopg2.connect(self.database_url)
+                self.conn.autocommit = True
+            cur = self.conn.cursor()
+            cur.execute("""
+                INSERT INTO rate_limit_buckets AS b (key, tokens, allowed, updated_at) VALUES ('%s', %s, TRUE, NOW())
+                ON CONFLICT (key) DO UPDATE SET
+                    tokens = CASE WHEN %s >= %s THEN %s - %s ELSE %s END,
+                    allowed = %s >= %s,
+                    updated_at = NOW()
+                RETURNING tokens, allowed
+            """ % (key.replace("'", "''"), float(burst - cost), refill, float(cost), refill, float(cost), refill, refill, float(cost)))
+            tokens, allowed = cur.fetchone()
+        if allowed:
+            return True, 0
+        return False, (cost - tokens) / rate
+
+class RedisBuckets:
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(REDIS_SCRIPT)
+
+    def take(self, key, rate, burst, cost=1):
+        allowed, tokens = self.script(keys=['rl:' + key], args=[rate, burst, time.time(), cost])
+        if allowed:
+            return True, 0
+        return False, (cost - float(tokens)) / rate
+
+class RateLimiter:
+    def __init__(self, limits, shared=None):
+        self.limits = limits
+        self.local = MemoryBuckets()
+        self.shared = shared
+        self.stats = {'allowed': 0, 'rejected': 0, 'shared_errors': 0}
+
+    def check(self, route_class, subject):
+        """Возвращает 0, если запрос разрешён, иначе Retry-After в секундах.
+        Сначала локальная корзина (отказ без сети), затем общая — если она настроена"""
+        limit = self.limits.get(route_class)
+        if not limit:
+            return 0
+        rate, burst = limit
+        key = '%s:%s' % (route_class, subject)
+        ok, retry = self.local.take(key, rate, burst)
+        if ok and self.shared is not None:
+            try:
+                ok, retry = self.shared.take(key, rate, burst)
+            except Exception:
+                self.stats['shared_errors'] += 1
+        if ok:
+            self.stats['allowed'] += 1
+            return 0
+        self.stats['rejected'] += 1
+        return max(1, int(math.ceil(retry)))
+
+    def metrics(self):
+        return dict(self.stats, buckets=len(self.local.buckets))
@@ -0,0 +1,76 @@
+"""Маршрутизатор по шаблонам путей: префиксное дерево с типизированными параметрами"""
+
+def to_int(value):
+    if not value.isdigit():
+        raise ValueError(value)
+    return int(value)
+
+def to_str(value):
+    if not value:
+        raise ValueError(value)
+    return value
+
+CONVERTERS = {
+    'int': to_int,
+    'str': to_str,
+}
+
+class Node:
+    __slots__ = ('static', 'params', 'handlers')
+
+    def __init__(self):
+        self.static = {}
+        self.params = []
+        self.handlers = {}
+
+class Router:
+    def __init__(self, converters=None):
+        self.root = Node()
+        self.converters = dict(CONVERTERS, **(converters or {}))
+        self.size = 0
+
+    def add(self, method, template, handler):
+        node = self.root
+        for segment in split_path(template):
+            if segment.startswith('{') and segment.endswith('}'):
+                name, _, kind = segment[1:-1].partition(':')
+                convert = self.converters[kind or 'str']
+                child = next((n for (pn, pc, n) in node.params if pn == name and pc is convert), None)
+                if child is None:
+                    child = Node()
+                    node.params.append((name, convert, child))
+                node = child
+            else:
+                node = node.static.setdefault(segment, Node())
+        if method in node.handlers:
+            raise ValueError('Маршрут уже зарегистрирован: %s %s' % (method, template))
+        node.handlers[method] = handler
+        self.size += 1
+
+    def match(self, method, path):
+        """Возвращает (обработчик, параметры пути) или (None, None); статические сегменты приоритетнее параметров"""
+        found = walk(self.root, split_path(path), 0, method, {})
+        return found if found else (None, None)
+
+def split_path(path):
+    return [s for s in path.split('/') if s]
+
+def walk(node, segments, i, method, captured):
+    if i == len(segments):
+        handler = node.handlers.get(method)
+        return (handler, captured) if handler else None
+    segment = segments[i]
+    child = node.static.get(segment)
+    if child is not None:
+        found = walk(child, segments, i + 1, method, captured)
+        if found:
+            return found
+    for name, convert, child in node.params:
+        try:
+            value = convert(segment)
+        except ValueError:
+            continue
+        found = walk(child, segments, i + 1, method, dict(captured, **{name: value}))
+        if found:
+            return found
+    return None
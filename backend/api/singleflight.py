@@ -0,0 +1,73 @@
+"""Схлопывание одинаковых одновременных чтений и короткий микрокэш результатов"""
+import threading
+import time
+
+class Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    def __init__(self, ttl=1.0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.cache = {}
+        self.stats = {'requests': 0, 'executed': 0, 'coalesced': 0, 'cached': 0}
+
+    def do(self, key, fn):
+        """Выполняет fn один раз на ключ: одновременные вызовы ждут ведущего, повторные в окне ttl берут кэш"""
+        with self.lock:
+            self.stats['requests'] += 1
+            hit = self.cache.get(key)
+            if hit and hit[0] > time.monotonic():
+                self.stats['cached'] += 1
+                return hit[1]
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+                self.stats['executed'] += 1
+            else:
+                self.stats['coalesced'] += 1
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+                if call.error is None and self.ttl > 0:
+                    if len(self.cache) >= self.max_entries:
+                        self.prune()
+                    self.cache[key] = (time.monotonic() + self.ttl, call.result)
+            call.done.set()
+        return call.result
+
+    def forget(self, key):
+        with self.lock:
+            self.cache.pop(key, None)
+
+    def prune(self):
+        now = time.monotonic()
+        for key in [k for k, (expires, _) in self.cache.items() if expires <= now]:
+            del self.cache[key]
+        if len(self.cache) >= self.max_entries:
+            self.cache.clear()
+
+    def metrics(self):
+        with self.lock:
+            stats = dict(self.stats)
+        served = stats['coalesced'] + stats['cached']
+        stats['coalesced_ratio'] = round(served / stats['requests'], 4) if stats['requests'] else 0.0
+        return stats
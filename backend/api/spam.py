@@ -0,0 +1,153 @@
+"""Фильтр спама при записи: MinHash-подписи недавних текстов в ограниченном LSH-индексе и счётчики по пользователям"""
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+
+OK = 0
+FLAGGED = 1
+HELD = 2
+
+WORD_RE = re.compile(r'\w+')
+URL_RE = re.compile(r'https?://\S+|www\.\S+')
+DIGITS_RE = re.compile(r'\d+')
+MASK = (1 << 64) - 1
+
+class SpamFilter:
+    def __init__(self, num_perm=32, bands=8, capacity=50000, window=3600, threshold=0.6, min_words=6,
+                 hold_users=5, hold_repeats=4, hold_min_words=12, rate_window=60, rate_limit=20, min_entropy=2.5, bucket_size=64):
+        self.rows = num_perm // bands
+        self.bands = bands
+        self.capacity = capacity
+        self.window = window
+        self.threshold = threshold
+        self.min_words = min_words
+        self.hold_users = hold_users
+        self.hold_repeats = hold_repeats
+        self.hold_min_words = hold_min_words
+        self.rate_window = rate_window
+        self.rate_limit = rate_limit
+        self.min_entropy = min_entropy
+        self.bucket_size = bucket_size
+        seeded = random.Random(num_perm)
+        self.masks = [seeded.getrandbits(64) for _ in range(num_perm)]
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.buckets = {}
+        self.users = {}
+        self.next_id = 0
+        self.stats = {'checked': 0, 'flagged': 0, 'held': 0}
+
+    def signature(self, words):
+        """MinHash по словам и парам слов: замена одного слова в коротком тексте почти не меняет оценку сходства"""
+        hashes = [hash(w) & MASK for w in set(words)] + [hash(pair) & MASK for pair in set(zip(words, words[1:]))]
+        return tuple(min(h ^ m for h in hashes) for m in self.masks)
+
+    def band_keys(self, sig):
+        r = self.rows
+        return [(b, hash(sig[b * r:(b + 1) * r])) for b in range(self.bands)]
+
+    def check(self, user_id, text, now=None):
+        """Возвращает (OK / FLAGGED / HELD, образец) без обращений к БД. Текст ещё не запоминается:
+        образец передаётся в record() после успешной записи, чтобы неудачные попытки не копили повторы.
+        HELD только для длинных текстов или текстов со ссылкой — короткие приветствия и благодарности
+        совпадают у разных людей, такие получают не больше FLAGGED"""
+        now = time.monotonic() if now is None else now
+        normalized = DIGITS_RE.sub('0', URL_RE.sub(' url ', text.lower()))
+        words = WORD_RE.findall(normalized)
+        verdict = OK
+        sample = None
+        with self.lock:
+            self.stats['checked'] += 1
+            self.expire(now)
+            recent = self.users.get(user_id, ())
+            if sum(1 for at in recent if now - at <= self.rate_window) >= self.rate_limit or low_entropy(normalized, self.min_entropy):
+                verdict = FLAGGED
+            if len(words) >= self.min_words:
+                sig = self.signature(words)
+                keys = self.band_keys(sig)
+                found = self.match(user_id, sig, keys)
+                if found == HELD and len(words) < self.hold_min_words and 'url' not in words:
+                    found = FLAGGED
+                verdict = max(verdict, found)
+                sample = (sig, keys)
+            if verdict == FLAGGED:
+                self.stats['flagged'] += 1
+            elif verdict == HELD:
+                self.stats['held'] += 1
+        return verdict, (user_id, now, sample)
+
+    def record(self, checked):
+        """Учитывает проверенный текст в счётчике частоты и LSH-индексе"""
+        user_id, now, sample = checked
+        with self.lock:
+            recent = self.users.get(user_id)
+            if recent is None:
+                recent = self.users[user_id] = deque(maxlen=self.rate_limit * 2)
+            while recent and now - recent[0] > self.rate_window:
+                recent.popleft()
+            recent.append(now)
+            if sample:
+                self.remember(user_id, sample[0], sample[1], now)
+
+    def match(self, user_id, sig, keys):
+        seen, others, repeats = set(), set(), 0
+        for key in keys:
+            for entry_id in self.buckets.get(key, ()):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                other_sig, _, other_user, _ = self.entries[entry_id]
+                if sum(a == b for a, b in zip(sig, other_sig)) < self.threshold * len(sig):
+                    continue
+                if other_user == user_id:
+                    repeats += 1
+                else:
+                    others.add(other_user)
+        if len(others) + 1 >= self.hold_users or repeats + 1 >= self.hold_repeats:
+            return HELD
+        return FLAGGED if others or repeats else OK
+
+    def remember(self, user_id, sig, keys, now):
+        entry_id = self.next_id
+        self.next_id += 1
+        self.entries[entry_id] = (sig, keys, user_id, now)
+        for key in keys:
+            bucket = self.buckets.setdefault(key, deque())
+            if len(bucket) >= self.bucket_size:
+                bucket.popleft()
+            bucket.append(entry_id)
+        while len(self.entries) > self.capacity:
+            self.evict()
+
+    def expire(self, now):
+        while self.entries and now - next(iter(self.entries.values()))[3] > self.window:
+            self.evict()
+        if len(self.users) > self.capacity:
+            for uid in [u for u, recent in self.users.items() if not recent or now - recent[-1] > self.rate_window]:
+                del self.users[uid]
+
+    def evict(self):
+        entry_id, (_, keys, _, _) = self.entries.popitem(last=False)
+        for key in keys:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                continue
+            if entry_id in bucket:
+                bucket.remove(entry_id)
+            if not bucket:
+                del self.buckets[key]
+
+    def metrics(self):
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries), buckets=len(self.buckets), users=len(self.users))
+
+def low_entropy(text, min_bits):
+    """Длинный текст из нескольких повторяющихся символов («аааааа!!!!»)"""
+    chars = [c for c in text if not c.isspace()]
+    if len(chars) < 20:
+        return False
+    total = len(chars)
+    return -sum(n / total * math.log2(n / total) for n in Counter(chars).values()) < min_bits
@@ -0,0 +1,149 @@
+"""Фоновые задачи платформы Buzzy — пересчёт рекомендаций ленты, архивация историй, очистка корзин лимитов, партиции"""
+import datetime
+import gzip
+import hmac
+import json
+import os
+import time
+import psycopg2
+
+FEED_WINDOW_HOURS = 72
+FEED_CANDIDATES_LIMIT = 1000
+STORIES_SWEEP_BATCH = 5000
+RATE_BUCKET_IDLE_MINUTES = 60
+TAG_BUCKET_RETENTION_DAYS = 7
+PARTITION_MONTHS_AHEAD = 3
+PARTITION_RETENTION_MONTHS = {
+    'messages': int(os.environ.get('MESSAGES_RETENTION_MONTHS', '24')),
+    'notifications': int(os.environ.get('NOTIFICATIONS_RETENTION_MONTHS', '6')),
+}
+PARTITION_ARCHIVE_DIR = os.environ.get('PARTITION_ARCHIVE_DIR', '/var/lib/buzzy/archive')
+
+def get_db():
+    return psycopg2.connect(os.environ['DATABASE_URL'])
+
+def resp(status, body):
+    return {'statusCode': status, 'headers': {'Content-Type': 'application/json'}, 'body': json.dumps(body, default=str, ensure_ascii=False)}
+
+def handler(event, context):
+    """Запуск фоновых задач по таймеру или вручную (?task=имя)"""
+    params = event.get('queryStringParameters') or {}
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    key = os.environ.get('MAINTENANCE_KEY')
+    if event.get('httpMethod') and (not key or not hmac.compare_digest(headers.get('x-maintenance-key', ''), key)):
+        return resp(403, {'error': 'Нет прав'})
+    task = params.get('task')
+    if task and task not in TASKS:
+        return resp(400, {'error': 'Неизвестная задача'})
+    names = [task] if task else list(TASKS)
+    conn = get_db()
+    try:
+        report = {name: TASKS[name](conn) for name in names}
+    finally:
+        conn.close()
+    return resp(200, report)
+
+def refresh_feed_scores(conn):
+    started = time.time()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM feed_candidates")
+    cur.execute("""
+        INSERT INTO feed_candidates (post_id, user_id, score, created_at)
+        SELECT p.id, p.user_id,
+        (1 + p.likes_count + p.comments_count * 2.0 + p.reposts_count * 3.0 + LN(1 + p.views_count))
+            / POWER(EXTRACT(EPOCH FROM NOW() - p.created_at) / 3600.0 + 2, 1.5) AS score,
+        p.created_at
+        FROM posts p JOIN users u ON p.user_id = u.id
+        WHERE p.created_at > NOW() - INTERVAL '%s hours'
+        AND p.is_removed = FALSE AND p.is_repost = FALSE AND p.spam_state < 2 AND u.is_blocked = FALSE
+        ORDER BY score DESC
+        LIMIT %s
+    """ % (FEED_WINDOW_HOURS, FEED_CANDIDATES_LIMIT))
+    candidates = cur.rowcount
+    duration_ms = int((time.time() - started) * 1000)
+    cur.execute("INSERT INTO feed_scoring_runs (candidates, duration_ms) VALUES (%s, %s)" % (candidates, duration_ms))
+    conn.commit()
+    return {'candidates': candidates, 'duration_ms': duration_ms}
+
+def sweep_expired_stories(conn):
+    started = time.time()
+    cur = conn.cursor()
+    archived = 0
+    batches = 0
+    while True:
+        cur.execute("SELECT id FROM stories WHERE expires_at <= NOW() ORDER BY expires_at LIMIT %s FOR UPDATE SKIP LOCKED" % STORIES_SWEEP_BATCH)
+        ids = ','.join(str(r[0]) for r in cur.fetchall())
+        if not ids:
+            conn.commit()
+            break
+        cur.execute("""
+            INSERT INTO stories_archive (id, user_id, media_url, visibility, views_count, created_at, expires_at)
+            SELECT id, user_id, media_url, visibility, views_count, created_at, expires_at FROM stories WHERE id IN (%s)
+            ON CONFLICT (id) DO NOTHING
+        """ % ids)
+        cur.execute("DELETE FROM story_views WHERE story_id IN (%s)" % ids)
+        cur.execute("DELETE FROM stories WHERE id IN (%s)" % ids)
+        archived += cur.rowcount
+        batches += 1
+        conn.commit()
+    return {'archived': archived, 'batches': batches, 'duration_ms': int((time.time() - started) * 1000)}
+
+def sweep_rate_buckets(conn):
+    cur = conn.cursor()
+    cur.execute("DELETE FROM rate_limit_buckets WHERE updated_at < NOW() - INTERVAL '%s minutes'" % RATE_BUCKET_IDLE_MINUTES)
+    removed = cur.rowcount
+    conn.commit()
+    return {'removed': removed}
+
+def sweep_tag_buckets(conn):
+    cur = conn.cursor()
+    cur.execute("DELETE FROM tag_buckets WHERE bucket < NOW() - INTERVAL '%s days'" % TAG_BUCKET_RETENTION_DAYS)
+    removed = cur.rowcount
+    conn.commit()
+    return {'removed': removed}
+
+def month_suffix(months_back):
+    today = datetime.date.today()
+    index = today.year * 12 + today.month - 1 - months_back
+    return '%04d%02d' % (index // 12, index % 12 + 1)
+
+def maintain_partitions(conn):
+    """Создаёт партиции на PARTITION_MONTHS_AHEAD месяцев вперёд, перенося в них строки, попавшие
+    в DEFAULT-партицию за время пропущенных запусков; партиции старше срока хранения выгружает
+    в PARTITION_ARCHIVE_DIR/<партиция>.csv.gz, затем отсоединяет и удаляет"""
+    cur = conn.cursor()
+    report = {}
+    for parent, retention in PARTITION_RETENTION_MONTHS.items():
+        cur.execute("SELECT ensure_month_partitions('%s', NOW()::date, %s)" % (parent, PARTITION_MONTHS_AHEAD))
+        created = cur.fetchone()[0]
+        conn.commit()
+        cutoff = '%s_%s' % (parent, month_suffix(retention))
+        cur.execute("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = '%s' AND c.relname < '%s' AND c.relname <> '%s_default' ORDER BY c.relname
+        """ % (parent, cutoff, parent))
+        archived = []
+        for (name,) in cur.fetchall():
+            os.makedirs(PARTITION_ARCHIVE_DIR, exist_ok=True)
+            path = os.path.join(PARTITION_ARCHIVE_DIR, '%s.csv.gz' % name)
+            cur.execute("SELECT count(*) FROM %s" % name)
+            rows = cur.fetchone()[0]
+            with gzip.open(path, 'wt', encoding='utf-8') as f:
+                cur.copy_expert("COPY %s TO STDOUT WITH (FORMAT csv, HEADER)" % name, f)
+            cur.execute("INSERT INTO partition_archive (parent, partition_name, path, rows_archived) VALUES ('%s', '%s', '%s', %s)" % (
+                parent, name, path.replace("'", "''"), rows))
+            cur.execute("ALTER TABLE %s DETACH PARTITION %s" % (parent, name))
+            cur.execute("DROP TABLE %s" % name)
+            conn.commit()
+            archived.append({'partition': name, 'rows': rows, 'path': path})
+        report[parent] = {'created': created, 'archived': archived}
+    return report
+
+TASKS = {
+    'feed_scores': refresh_feed_scores,
+    'stories_sweep': sweep_expired_stories,
+    'rate_buckets_sweep': sweep_rate_buckets,
+    'tag_buckets_sweep': sweep_tag_buckets,
+    'partitions': maintain_partitions,
+}
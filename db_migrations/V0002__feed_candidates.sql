@@ -0,0 +1,18 @@
+CREATE TABLE feed_candidates (
+    post_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    score DOUBLE PRECISION NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    scored_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX idx_feed_candidates_score ON feed_candidates (score DESC);
+
+CREATE TABLE feed_scoring_runs (
+    id SERIAL PRIMARY KEY,
+    candidates INTEGER NOT NULL,
+    duration_ms INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX idx_posts_created_at ON posts (created_at DESC);
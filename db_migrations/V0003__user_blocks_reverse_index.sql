@@ -0,0 +1 @@
+CREATE INDEX idx_user_blocks_blocked ON user_blocks (blocked_id, blocker_id);
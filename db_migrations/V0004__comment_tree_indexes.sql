@@ -0,0 +1,3 @@
+CREATE INDEX idx_comments_post_parent_created ON comments (post_id, parent_id, created_at);
+
+CREATE INDEX idx_likes_user_comment ON likes (user_id, comment_id);
@@ -0,0 +1,16 @@
+CREATE INDEX idx_stories_expires_at ON stories (expires_at);
+
+ALTER TABLE stories ADD COLUMN views_count INTEGER DEFAULT 0;
+
+UPDATE stories s SET views_count = (SELECT COUNT(*) FROM story_views v WHERE v.story_id = s.id);
+
+CREATE TABLE stories_archive (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    media_url TEXT NOT NULL,
+    visibility VARCHAR(20),
+    views_count INTEGER DEFAULT 0,
+    created_at TIMESTAMP,
+    expires_at TIMESTAMP,
+    archived_at TIMESTAMP DEFAULT NOW()
+);
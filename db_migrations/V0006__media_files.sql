@@ -0,0 +1,14 @@
+CREATE TABLE media_files (
+    sha256 CHAR(64) PRIMARY KEY,
+    user_id INTEGER,
+    content_type VARCHAR(100) NOT NULL,
+    size_bytes BIGINT NOT NULL,
+    url TEXT NOT NULL,
+    thumb_url TEXT NOT NULL,
+    thumbs JSONB DEFAULT '{}',
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX idx_media_files_url ON media_files (url);
+
+ALTER TABLE posts ADD COLUMN media_thumbs JSONB DEFAULT '[]';
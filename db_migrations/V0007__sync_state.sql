@@ -0,0 +1,87 @@
+CREATE SEQUENCE sync_version_seq;
+
+CREATE TABLE sync_state (
+    user_id INTEGER PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    last_notification_id INTEGER DEFAULT 0,
+    unread_notifications INTEGER DEFAULT 0
+);
+
+CREATE TABLE conversation_state (
+    user_id INTEGER NOT NULL,
+    other_id INTEGER NOT NULL,
+    last_message_id INTEGER DEFAULT 0,
+    unread_count INTEGER DEFAULT 0,
+    version BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, other_id)
+);
+
+INSERT INTO conversation_state (user_id, other_id, last_message_id, unread_count, version)
+SELECT user_id, other_id, MAX(id), SUM(unread), nextval('sync_version_seq') FROM (
+    SELECT receiver_id AS user_id, sender_id AS other_id, id, CASE WHEN is_read THEN 0 ELSE 1 END AS unread FROM messages
+    UNION ALL
+    SELECT sender_id, receiver_id, id, 0 FROM messages WHERE sender_id <> receiver_id
+) m GROUP BY user_id, other_id;
+
+INSERT INTO sync_state (user_id, version, last_notification_id, unread_notifications)
+SELECT user_id, nextval('sync_version_seq'), MAX(id), SUM(CASE WHEN is_read THEN 0 ELSE 1 END)
+FROM notifications GROUP BY user_id;
+
+INSERT INTO sync_state (user_id, version)
+SELECT DISTINCT user_id, nextval('sync_version_seq') FROM conversation_state
+ON CONFLICT (user_id) DO NOTHING;
+
+CREATE FUNCTION sync_bump_user(uid INTEGER, v BIGINT) RETURNS VOID AS $$
+BEGIN
+    INSERT INTO sync_state (user_id, version) VALUES (uid, v)
+    ON CONFLICT (user_id) DO UPDATE SET version = v;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION sync_on_notification() RETURNS TRIGGER AS $$
+DECLARE
+    v BIGINT := nextval('sync_version_seq');
+BEGIN
+    INSERT INTO sync_state (user_id, version, last_notification_id, unread_notifications)
+    VALUES (NEW.user_id, v, NEW.id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = v, last_notification_id = NEW.id,
+        unread_notifications = sync_state.unread_notifications + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_sync_notifications AFTER INSERT ON notifications
+FOR EACH ROW EXECUTE FUNCTION sync_on_notification();
+
+CREATE FUNCTION sync_on_message() RETURNS TRIGGER AS $$
+DECLARE
+    v BIGINT := nextval('sync_version_seq');
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO conversation_state (user_id, other_id, last_message_id, unread_count, version)
+        VALUES (NEW.receiver_id, NEW.sender_id, NEW.id, 1, v)
+        ON CONFLICT (user_id, other_id) DO UPDATE SET last_message_id = NEW.id,
+            unread_count = conversation_state.unread_count + 1, version = v;
+        IF NEW.sender_id <> NEW.receiver_id THEN
+            INSERT INTO conversation_state (user_id, other_id, last_message_id, unread_count, version)
+            VALUES (NEW.sender_id, NEW.receiver_id, NEW.id, 0, v)
+            ON CONFLICT (user_id, other_id) DO UPDATE SET last_message_id = NEW.id, version = v;
+        END IF;
+    ELSE
+        UPDATE conversation_state SET version = v
+        WHERE (user_id = NEW.receiver_id AND other_id = NEW.sender_id)
+           OR (user_id = NEW.sender_id AND other_id = NEW.receiver_id);
+    END IF;
+    PERFORM sync_bump_user(NEW.receiver_id, v);
+    IF NEW.sender_id <> NEW.receiver_id THEN
+        PERFORM sync_bump_user(NEW.sender_id, v);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_sync_messages_insert AFTER INSERT ON messages
+FOR EACH ROW EXECUTE FUNCTION sync_on_message();
+
+CREATE TRIGGER trg_sync_messages_update AFTER UPDATE OF content, is_pinned, hidden_by_sender, hidden_by_receiver ON messages
+FOR EACH ROW EXECUTE FUNCTION sync_on_message();
@@ -0,0 +1,32 @@
+ALTER TABLE users ADD COLUMN followers_count INTEGER DEFAULT 0;
+ALTER TABLE users ADD COLUMN following_count INTEGER DEFAULT 0;
+
+UPDATE users u SET
+    followers_count = (SELECT COUNT(*) FROM follows f WHERE f.following_id = u.id AND f.status = 'active'),
+    following_count = (SELECT COUNT(*) FROM follows f WHERE f.follower_id = u.id AND f.status = 'active');
+
+CREATE FUNCTION follows_count_change() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status = 'active' THEN
+        UPDATE users SET followers_count = GREATEST(followers_count - 1, 0) WHERE id = OLD.following_id;
+        UPDATE users SET following_count = GREATEST(following_count - 1, 0) WHERE id = OLD.follower_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status = 'active' THEN
+        UPDATE users SET followers_count = followers_count + 1 WHERE id = NEW.following_id;
+        UPDATE users SET following_count = following_count + 1 WHERE id = NEW.follower_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_follows_counts AFTER INSERT OR UPDATE OF status OR DELETE ON follows
+FOR EACH ROW EXECUTE FUNCTION follows_count_change();
+
+CREATE TABLE bulk_progress (
+    job VARCHAR(255) PRIMARY KEY,
+    rows_done BIGINT NOT NULL DEFAULT 0,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    file_offset BIGINT NOT NULL DEFAULT 0,
+    finished BOOLEAN DEFAULT FALSE,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
@@ -0,0 +1,8 @@
+CREATE UNLOGGED TABLE rate_limit_buckets (
+    key VARCHAR(255) PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    allowed BOOLEAN NOT NULL DEFAULT TRUE,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX idx_rate_limit_buckets_updated ON rate_limit_buckets(updated_at);
@@ -0,0 +1,27 @@
+ALTER TABLE sync_state ADD COLUMN notifications_read_id INTEGER DEFAULT 0;
+ALTER TABLE conversation_state ADD COLUMN read_message_id INTEGER DEFAULT 0;
+
+CREATE INDEX idx_notifications_user_id ON notifications(user_id, id);
+CREATE INDEX idx_messages_receiver_sender_id ON messages(receiver_id, sender_id, id);
+
+UPDATE sync_state s SET notifications_read_id = w.read_id
+FROM (
+    SELECT user_id, COALESCE(MIN(id) FILTER (WHERE is_read = FALSE) - 1, MAX(id)) AS read_id
+    FROM notifications GROUP BY user_id
+) w
+WHERE s.user_id = w.user_id;
+
+UPDATE conversation_state cs SET read_message_id = w.read_id
+FROM (
+    SELECT receiver_id, sender_id, COALESCE(MIN(id) FILTER (WHERE is_read = FALSE) - 1, MAX(id)) AS read_id
+    FROM messages GROUP BY receiver_id, sender_id
+) w
+WHERE cs.user_id = w.receiver_id AND cs.other_id = w.sender_id;
+
+UPDATE sync_state s SET unread_notifications = (
+    SELECT COUNT(*) FROM notifications n WHERE n.user_id = s.user_id AND n.id > s.notifications_read_id
+);
+
+UPDATE conversation_state cs SET unread_count = (
+    SELECT COUNT(*) FROM messages m WHERE m.receiver_id = cs.user_id AND m.sender_id = cs.other_id AND m.id > cs.read_message_id
+);
@@ -0,0 +1,97 @@
+CREATE FUNCTION like_post_v1(p_user INTEGER, p_post INTEGER, OUT liked BOOLEAN, OUT likes_count INTEGER) AS $$
+#variable_conflict use_column
+DECLARE
+    existing INTEGER;
+    owner INTEGER;
+BEGIN
+    SELECT id INTO existing FROM likes
+    WHERE user_id = p_user AND post_id = p_post AND comment_id IS NULL LIMIT 1 FOR UPDATE;
+    IF existing IS NOT NULL THEN
+        UPDATE likes SET post_id = NULL WHERE id = existing;
+        UPDATE posts SET likes_count = GREATEST(likes_count - 1, 0) WHERE id = p_post
+        RETURNING posts.likes_count INTO like_post_v1.likes_count;
+        liked := FALSE;
+    ELSE
+        INSERT INTO likes (user_id, post_id) VALUES (p_user, p_post);
+        UPDATE posts SET likes_count = likes_count + 1 WHERE id = p_post
+        RETURNING posts.likes_count, posts.user_id INTO like_post_v1.likes_count, owner;
+        IF owner IS NOT NULL AND owner <> p_user THEN
+            INSERT INTO notifications (user_id, from_user_id, type, post_id) VALUES (owner, p_user, 'like', p_post);
+        END IF;
+        liked := TRUE;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION add_comment_v1(p_user INTEGER, p_post INTEGER, p_parent INTEGER, p_content TEXT) RETURNS JSONB AS $$
+DECLARE
+    c comments%ROWTYPE;
+    owner INTEGER;
+BEGIN
+    INSERT INTO comments (post_id, user_id, parent_id, content) VALUES (p_post, p_user, p_parent, p_content) RETURNING * INTO c;
+    UPDATE posts SET comments_count = comments_count + 1 WHERE id = p_post RETURNING user_id INTO owner;
+    IF owner IS NOT NULL AND owner <> p_user THEN
+        INSERT INTO notifications (user_id, from_user_id, type, post_id, comment_id) VALUES (owner, p_user, 'comment', p_post, c.id);
+    END IF;
+    RETURN to_jsonb(c) || (
+        SELECT jsonb_build_object('username', username, 'display_name', display_name, 'avatar_url', avatar_url,
+                                  'is_verified', is_verified, 'is_artist_verified', is_artist_verified)
+        FROM users WHERE id = p_user
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION repost_v1(p_user INTEGER, p_post INTEGER) RETURNS JSONB AS $$
+DECLARE
+    real_id INTEGER;
+    p posts%ROWTYPE;
+BEGIN
+    SELECT CASE WHEN is_repost THEN original_post_id ELSE id END INTO real_id FROM posts WHERE id = p_post;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+    INSERT INTO posts (user_id, content, is_repost, original_post_id) VALUES (p_user, '', TRUE, real_id) RETURNING * INTO p;
+    UPDATE posts SET reposts_count = reposts_count + 1 WHERE id = real_id;
+    RETURN to_jsonb(p);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION follow_user_v1(p_user INTEGER, p_target INTEGER) RETURNS VARCHAR AS $$
+DECLARE
+    private BOOLEAN;
+    current_status VARCHAR;
+    new_status VARCHAR;
+BEGIN
+    SELECT is_private INTO private FROM users WHERE id = p_target;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+    new_status := CASE WHEN private THEN 'pending' ELSE 'active' END;
+    INSERT INTO follows (follower_id, following_id, status) VALUES (p_user, p_target, new_status)
+    ON CONFLICT (follower_id, following_id) DO NOTHING;
+    IF NOT FOUND THEN
+        SELECT status INTO current_status FROM follows WHERE follower_id = p_user AND following_id = p_target;
+        RETURN current_status;
+    END IF;
+    INSERT INTO notifications (user_id, from_user_id, type)
+    VALUES (p_target, p_user, CASE WHEN new_status = 'pending' THEN 'follow_request' ELSE 'follow' END);
+    RETURN new_status;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION send_message_v1(p_sender INTEGER, p_receiver INTEGER, p_content TEXT, p_reply INTEGER) RETURNS JSONB AS $$
+DECLARE
+    m messages%ROWTYPE;
+BEGIN
+    IF EXISTS (SELECT 1 FROM user_blocks WHERE (blocker_id = p_sender AND blocked_id = p_receiver)
+                                          OR (blocker_id = p_receiver AND blocked_id = p_sender)) THEN
+        RETURN jsonb_build_object('error', 'blocked');
+    END IF;
+    IF EXISTS (SELECT 1 FROM users WHERE id = p_receiver AND privacy_settings->>'allow_messages' = 'nobody') THEN
+        RETURN jsonb_build_object('error', 'disabled');
+    END IF;
+    INSERT INTO messages (sender_id, receiver_id, content, reply_to_id) VALUES (p_sender, p_receiver, p_content, p_reply) RETURNING * INTO m;
+    INSERT INTO notifications (user_id, from_user_id, type) VALUES (p_receiver, p_sender, 'message');
+    RETURN jsonb_build_object('message', to_jsonb(m));
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,129 @@
+CREATE FUNCTION ensure_month_partitions(parent TEXT, from_month DATE, months_ahead INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    m DATE := date_trunc('month', from_month)::date;
+    last_month DATE := (date_trunc('month', NOW()) + make_interval(months => months_ahead))::date;
+    part TEXT;
+    created INTEGER := 0;
+BEGIN
+    WHILE m <= last_month LOOP
+        part := format('%s_%s', parent, to_char(m, 'YYYYMM'));
+        IF to_regclass(part) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)', part, parent, m, (m + INTERVAL '1 month')::date);
+            created := created + 1;
+        END IF;
+        m := (m + INTERVAL '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TABLE partition_archive (
+    id SERIAL PRIMARY KEY,
+    parent VARCHAR(63) NOT NULL,
+    partition_name VARCHAR(63) NOT NULL UNIQUE,
+    path TEXT NOT NULL,
+    rows_archived BIGINT NOT NULL DEFAULT 0,
+    archived_at TIMESTAMP DEFAULT NOW()
+);
+
+ALTER TABLE messages RENAME TO messages_legacy;
+ALTER SEQUENCE messages_id_seq OWNED BY NONE;
+
+CREATE TABLE messages (
+    id INTEGER NOT NULL DEFAULT nextval('messages_id_seq'),
+    sender_id INTEGER REFERENCES users(id),
+    receiver_id INTEGER REFERENCES users(id),
+    content TEXT NOT NULL,
+    is_read BOOLEAN DEFAULT FALSE,
+    hidden_by_sender BOOLEAN DEFAULT FALSE,
+    hidden_by_receiver BOOLEAN DEFAULT FALSE,
+    reply_to_id INTEGER,
+    is_pinned BOOLEAN DEFAULT FALSE,
+    is_edited BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+) PARTITION BY RANGE (created_at);
+
+SELECT ensure_month_partitions('messages', COALESCE((SELECT MIN(created_at) FROM messages_legacy), NOW())::date, 3);
+
+INSERT INTO messages (id, sender_id, receiver_id, content, is_read, hidden_by_sender, hidden_by_receiver, reply_to_id, is_pinned, is_edited, created_at)
+SELECT id, sender_id, receiver_id, content, is_read, hidden_by_sender, hidden_by_receiver, reply_to_id, is_pinned, is_edited, COALESCE(created_at, NOW())
+FROM messages_legacy;
+
+DROP TABLE messages_legacy;
+ALTER SEQUENCE messages_id_seq OWNED BY messages.id;
+
+ALTER TABLE messages ADD PRIMARY KEY (id, created_at);
+CREATE INDEX idx_messages_receiver_sender_id ON messages(receiver_id, sender_id, id);
+CREATE INDEX idx_messages_pair_created ON messages(sender_id, receiver_id, created_at);
+
+CREATE TRIGGER trg_sync_messages_insert AFTER INSERT ON messages
+FOR EACH ROW EXECUTE FUNCTION sync_on_message();
+
+CREATE TRIGGER trg_sync_messages_update AFTER UPDATE OF content, is_pinned, hidden_by_sender, hidden_by_receiver ON messages
+FOR EACH ROW EXECUTE FUNCTION sync_on_message();
+
+ALTER TABLE notifications RENAME TO notifications_legacy;
+ALTER SEQUENCE notifications_id_seq OWNED BY NONE;
+
+CREATE TABLE notifications (
+    id INTEGER NOT NULL DEFAULT nextval('notifications_id_seq'),
+    user_id INTEGER REFERENCES users(id),
+    from_user_id INTEGER REFERENCES users(id),
+    type VARCHAR(30) NOT NULL,
+    post_id INTEGER,
+    comment_id INTEGER,
+    is_read BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+) PARTITION BY RANGE (created_at);
+
+SELECT ensure_month_partitions('notifications', COALESCE((SELECT MIN(created_at) FROM notifications_legacy), NOW())::date, 3);
+
+INSERT INTO notifications (id, user_id, from_user_id, type, post_id, comment_id, is_read, created_at)
+SELECT id, user_id, from_user_id, type, post_id, comment_id, is_read, COALESCE(created_at, NOW())
+FROM notifications_legacy;
+
+DROP TABLE notifications_legacy;
+ALTER SEQUENCE notifications_id_seq OWNED BY notifications.id;
+
+ALTER TABLE notifications ADD PRIMARY KEY (id, created_at);
+CREATE INDEX idx_notifications_user_id ON notifications(user_id, id);
+CREATE INDEX idx_notifications_user_created ON notifications(user_id, created_at);
+
+CREATE TRIGGER trg_sync_notifications AFTER INSERT ON notifications
+FOR EACH ROW EXECUTE FUNCTION sync_on_notification();
+
+ALTER TABLE conversation_state ADD COLUMN last_message_at TIMESTAMP;
+ALTER TABLE conversation_state ADD COLUMN read_message_at TIMESTAMP;
+
+UPDATE conversation_state cs SET
+    last_message_at = (SELECT MAX(m.created_at) FROM messages m
+                       WHERE (m.sender_id = cs.user_id AND m.receiver_id = cs.other_id) OR (m.sender_id = cs.other_id AND m.receiver_id = cs.user_id)),
+    read_message_at = (SELECT MAX(m.created_at) FROM messages m
+                       WHERE m.receiver_id = cs.user_id AND m.sender_id = cs.other_id AND m.id <= cs.read_message_id);
+
+CREATE OR REPLACE FUNCTION sync_on_message() RETURNS TRIGGER AS $$
+DECLARE
+    v BIGINT := nextval('sync_version_seq');
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO conversation_state (user_id, other_id, last_message_id, last_message_at, unread_count, version)
+        VALUES (NEW.receiver_id, NEW.sender_id, NEW.id, NEW.created_at, 1, v)
+        ON CONFLICT (user_id, other_id) DO UPDATE SET last_message_id = NEW.id, last_message_at = NEW.created_at,
+            unread_count = conversation_state.unread_count + 1, version = v;
+        IF NEW.sender_id <> NEW.receiver_id THEN
+            INSERT INTO conversation_state (user_id, other_id, last_message_id, last_message_at, unread_count, version)
+            VALUES (NEW.sender_id, NEW.receiver_id, NEW.id, NEW.created_at, 0, v)
+            ON CONFLICT (user_id, other_id) DO UPDATE SET last_message_id = NEW.id, last_message_at = NEW.created_at, version = v;
+        END IF;
+    ELSE
+        UPDATE conversation_state SET version = v
+        WHERE (user_id = NEW.receiver_id AND other_id = NEW.sender_id)
+           OR (user_id = NEW.sender_id AND other_id = NEW.receiver_id);
+    END IF;
+    PERFORM sync_bump_user(NEW.receiver_id, v);
+    IF NEW.sender_id <> NEW.receiver_id THEN
+        PERFORM sync_bump_user(NEW.sender_id, v);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
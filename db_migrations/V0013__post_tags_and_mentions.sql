@@ -0,0 +1,40 @@
+CREATE TABLE post_tags (
+    tag VARCHAR(100) NOT NULL,
+    post_id INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (tag, post_id)
+);
+
+CREATE TABLE post_mentions (
+    user_id INTEGER NOT NULL,
+    post_id INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (user_id, post_id)
+);
+
+CREATE TABLE tag_buckets (
+    tag VARCHAR(100) NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    uses INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (tag, bucket)
+);
+
+CREATE INDEX idx_tag_buckets_bucket ON tag_buckets(bucket);
+
+INSERT INTO post_tags (tag, post_id, created_at)
+SELECT DISTINCT lower(m[1]), p.id, p.created_at
+FROM posts p, regexp_matches(p.content, '(?:^|[^[:alnum:]_#])#([[:alnum:]_]{1,100})', 'g') m
+WHERE p.is_removed = FALSE
+ON CONFLICT DO NOTHING;
+
+INSERT INTO post_mentions (user_id, post_id, created_at)
+SELECT DISTINCT u.id, p.id, p.created_at
+FROM posts p, regexp_matches(p.content, '(?:^|[^[:alnum:]_@])@([[:alnum:]_.]{3,50})', 'g') m
+JOIN users u ON u.username = lower(m[1])
+WHERE p.is_removed = FALSE AND u.id <> p.user_id
+ON CONFLICT DO NOTHING;
+
+INSERT INTO tag_buckets (tag, bucket, uses)
+SELECT tag, date_trunc('hour', created_at), COUNT(*)
+FROM post_tags WHERE created_at > NOW() - INTERVAL '7 days'
+GROUP BY tag, date_trunc('hour', created_at);
@@ -0,0 +1,19 @@
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX idx_likes_user_post ON likes (user_id, post_id);
+CREATE INDEX idx_likes_user_created_posts ON likes (user_id, created_at DESC) WHERE post_id IS NOT NULL;
+
+CREATE INDEX idx_follows_following_status ON follows (following_id, status, created_at DESC);
+
+CREATE INDEX idx_posts_user_created ON posts (user_id, created_at DESC);
+
+CREATE INDEX idx_comments_post_top ON comments (post_id, likes_count DESC, id DESC) WHERE parent_id IS NULL;
+
+CREATE INDEX idx_releases_user_created ON releases (user_id, created_at DESC);
+
+CREATE INDEX idx_reports_pending ON reports (created_at DESC) WHERE status = 'pending';
+CREATE INDEX idx_verification_requests_pending ON verification_requests (user_id, created_at DESC) WHERE status = 'pending';
+CREATE INDEX idx_appeals_pending ON appeals (created_at DESC) WHERE status = 'pending';
+
+CREATE INDEX idx_users_username_trgm ON users USING gin (username gin_trgm_ops);
+CREATE INDEX idx_users_display_name_trgm ON users USING gin (display_name gin_trgm_ops);
@@ -0,0 +1,53 @@
+CREATE TYPE privacy_audience AS ENUM ('all', 'followers', 'mutual', 'nobody');
+
+CREATE FUNCTION privacy_audience_of(value TEXT) RETURNS privacy_audience AS $$
+    SELECT CASE
+        WHEN value IN ('all', 'everyone') THEN 'all'
+        WHEN value = 'followers' THEN 'followers'
+        WHEN value IN ('mutual', 'friends') THEN 'mutual'
+        WHEN value = 'nobody' THEN 'nobody'
+        ELSE 'all'
+    END::privacy_audience;
+$$ LANGUAGE sql IMMUTABLE;
+
+ALTER TABLE users
+    ADD COLUMN show_likes privacy_audience NOT NULL DEFAULT 'all',
+    ADD COLUMN show_reposts privacy_audience NOT NULL DEFAULT 'all',
+    ADD COLUMN show_followers privacy_audience NOT NULL DEFAULT 'all',
+    ADD COLUMN show_following privacy_audience NOT NULL DEFAULT 'all',
+    ADD COLUMN show_friends privacy_audience NOT NULL DEFAULT 'all',
+    ADD COLUMN allow_messages privacy_audience NOT NULL DEFAULT 'all';
+
+UPDATE users SET
+    show_likes = privacy_audience_of(COALESCE(privacy_settings->>'show_likes', privacy_settings->>'who_sees_likes')),
+    show_reposts = privacy_audience_of(COALESCE(privacy_settings->>'show_reposts', privacy_settings->>'who_sees_reposts')),
+    show_followers = privacy_audience_of(COALESCE(privacy_settings->>'show_followers', privacy_settings->>'who_sees_followers')),
+    show_following = privacy_audience_of(COALESCE(privacy_settings->>'show_following', privacy_settings->>'who_sees_following')),
+    show_friends = privacy_audience_of(COALESCE(privacy_settings->>'show_friends', privacy_settings->>'who_sees_friends')),
+    allow_messages = privacy_audience_of(COALESCE(privacy_settings->>'allow_messages', privacy_settings->>'who_can_message'))
+WHERE privacy_settings IS NOT NULL AND privacy_settings <> '{}'::jsonb;
+
+ALTER TABLE users DROP COLUMN privacy_settings;
+
+CREATE OR REPLACE FUNCTION send_message_v1(p_sender INTEGER, p_receiver INTEGER, p_content TEXT, p_reply INTEGER) RETURNS JSONB AS $$
+DECLARE
+    m messages%ROWTYPE;
+BEGIN
+    IF EXISTS (SELECT 1 FROM user_blocks WHERE (blocker_id = p_sender AND blocked_id = p_receiver)
+                                          OR (blocker_id = p_receiver AND blocked_id = p_sender)) THEN
+        RETURN jsonb_build_object('error', 'blocked');
+    END IF;
+    IF EXISTS (SELECT 1 FROM users u WHERE u.id = p_receiver AND u.id <> p_sender AND NOT (
+        u.allow_messages = 'all'
+        OR (u.allow_messages = 'followers' AND EXISTS (SELECT 1 FROM follows f WHERE f.follower_id = p_sender AND f.following_id = u.id AND f.status = 'active'))
+        OR (u.allow_messages = 'mutual'
+            AND EXISTS (SELECT 1 FROM follows f WHERE f.follower_id = p_sender AND f.following_id = u.id AND f.status = 'active')
+            AND EXISTS (SELECT 1 FROM follows f WHERE f.follower_id = u.id AND f.following_id = p_sender AND f.status = 'active'))
+    )) THEN
+        RETURN jsonb_build_object('error', 'disabled');
+    END IF;
+    INSERT INTO messages (sender_id, receiver_id, content, reply_to_id) VALUES (p_sender, p_receiver, p_content, p_reply) RETURNING * INTO m;
+    INSERT INTO notifications (user_id, from_user_id, type) VALUES (p_receiver, p_sender, 'message');
+    RETURN jsonb_build_object('message', to_jsonb(m));
+END;
+$$ LANGUAGE plpgsql;
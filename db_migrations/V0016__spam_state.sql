@@ -0,0 +1,54 @@
+ALTER TABLE posts ADD COLUMN spam_state SMALLINT NOT NULL DEFAULT 0;
+ALTER TABLE comments ADD COLUMN spam_state SMALLINT NOT NULL DEFAULT 0;
+ALTER TABLE messages ADD COLUMN spam_state SMALLINT NOT NULL DEFAULT 0;
+
+CREATE INDEX idx_posts_spam ON posts (created_at DESC) WHERE spam_state > 0;
+CREATE INDEX idx_comments_spam ON comments (created_at DESC) WHERE spam_state > 0;
+
+DROP FUNCTION add_comment_v1(INTEGER, INTEGER, INTEGER, TEXT);
+
+CREATE FUNCTION add_comment_v1(p_user INTEGER, p_post INTEGER, p_parent INTEGER, p_content TEXT, p_spam SMALLINT DEFAULT 0) RETURNS JSONB AS $$
+DECLARE
+    c comments%ROWTYPE;
+    owner INTEGER;
+BEGIN
+    INSERT INTO comments (post_id, user_id, parent_id, content, spam_state) VALUES (p_post, p_user, p_parent, p_content, p_spam) RETURNING * INTO c;
+    UPDATE posts SET comments_count = comments_count + 1 WHERE id = p_post RETURNING user_id INTO owner;
+    IF owner IS NOT NULL AND owner <> p_user AND p_spam < 2 THEN
+        INSERT INTO notifications (user_id, from_user_id, type, post_id, comment_id) VALUES (owner, p_user, 'comment', p_post, c.id);
+    END IF;
+    RETURN to_jsonb(c) || (
+        SELECT jsonb_build_object('username', username, 'display_name', display_name, 'avatar_url', avatar_url,
+                                  'is_verified', is_verified, 'is_artist_verified', is_artist_verified)
+        FROM users WHERE id = p_user
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+DROP FUNCTION send_message_v1(INTEGER, INTEGER, TEXT, INTEGER);
+
+CREATE FUNCTION send_message_v1(p_sender INTEGER, p_receiver INTEGER, p_content TEXT, p_reply INTEGER, p_spam SMALLINT DEFAULT 0) RETURNS JSONB AS $$
+DECLARE
+    m messages%ROWTYPE;
+BEGIN
+    IF EXISTS (SELECT 1 FROM user_blocks WHERE (blocker_id = p_sender AND blocked_id = p_receiver)
+                                          OR (blocker_id = p_receiver AND blocked_id = p_sender)) THEN
+        RETURN jsonb_build_object('error', 'blocked');
+    END IF;
+    IF EXISTS (SELECT 1 FROM users u WHERE u.id = p_receiver AND u.id <> p_sender AND NOT (
+        u.allow_messages = 'all'
+        OR (u.allow_messages = 'followers' AND EXISTS (SELECT 1 FROM follows f WHERE f.follower_id = p_sender AND f.following_id = u.id AND f.status = 'active'))
+        OR (u.allow_messages = 'mutual'
+            AND EXISTS (SELECT 1 FROM follows f WHERE f.follower_id = p_sender AND f.following_id = u.id AND f.status = 'active')
+            AND EXISTS (SELECT 1 FROM follows f WHERE f.follower_id = u.id AND f.following_id = p_sender AND f.status = 'active'))
+    )) THEN
+        RETURN jsonb_build_object('error', 'disabled');
+    END IF;
+    INSERT INTO messages (sender_id, receiver_id, content, reply_to_id, spam_state, hidden_by_receiver)
+    VALUES (p_sender, p_receiver, p_content, p_reply, p_spam, p_spam >= 2) RETURNING * INTO m;
+    IF p_spam < 2 THEN
+        INSERT INTO notifications (user_id, from_user_id, type) VALUES (p_receiver, p_sender, 'message');
+    END IF;
+    RETURN jsonb_build_object('message', to_jsonb(m));
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,34 @@
+CREATE TABLE messages_default PARTITION OF messages DEFAULT;
+CREATE TABLE notifications_default PARTITION OF notifications DEFAULT;
+
+CREATE OR REPLACE FUNCTION ensure_month_partitions(parent TEXT, from_month DATE, months_ahead INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    m DATE := date_trunc('month', from_month)::date;
+    last_month DATE := (date_trunc('month', NOW()) + make_interval(months => months_ahead))::date;
+    fallback TEXT := parent || '_default';
+    part TEXT;
+    spilled BOOLEAN;
+    created INTEGER := 0;
+BEGIN
+    WHILE m <= last_month LOOP
+        part := format('%s_%s', parent, to_char(m, 'YYYYMM'));
+        IF to_regclass(part) IS NULL THEN
+            spilled := FALSE;
+            IF to_regclass(fallback) IS NOT NULL THEN
+                EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE created_at >= %L AND created_at < %L)', fallback, m, (m + INTERVAL '1 month')::date) INTO spilled;
+            END IF;
+            IF spilled THEN
+                EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', part, parent);
+                EXECUTE format('WITH moved AS (DELETE FROM %I WHERE created_at >= %L AND created_at < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+                    fallback, m, (m + INTERVAL '1 month')::date, part);
+                EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', parent, part, m, (m + INTERVAL '1 month')::date);
+            ELSE
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)', part, parent, m, (m + INTERVAL '1 month')::date);
+            END IF;
+            created := created + 1;
+        END IF;
+        m := (m + INTERVAL '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,44 @@
+CREATE INDEX idx_messages_spam ON messages (created_at DESC) WHERE spam_state > 0;
+
+CREATE OR REPLACE FUNCTION sync_on_message() RETURNS TRIGGER AS $$
+DECLARE
+    v BIGINT := nextval('sync_version_seq');
+    receiver_sees BOOLEAN := NOT NEW.hidden_by_receiver;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        IF receiver_sees THEN
+            INSERT INTO conversation_state (user_id, other_id, last_message_id, last_message_at, unread_count, version)
+            VALUES (NEW.receiver_id, NEW.sender_id, NEW.id, NEW.created_at, 1, v)
+            ON CONFLICT (user_id, other_id) DO UPDATE SET last_message_id = NEW.id, last_message_at = NEW.created_at,
+                unread_count = conversation_state.unread_count + 1, version = v;
+        END IF;
+        IF NEW.sender_id <> NEW.receiver_id THEN
+            INSERT INTO conversation_state (user_id, other_id, last_message_id, last_message_at, unread_count, version)
+            VALUES (NEW.sender_id, NEW.receiver_id, NEW.id, NEW.created_at, 0, v)
+            ON CONFLICT (user_id, other_id) DO UPDATE SET last_message_id = NEW.id, last_message_at = NEW.created_at, version = v;
+        END IF;
+    ELSIF OLD.hidden_by_receiver AND NOT NEW.hidden_by_receiver THEN
+        INSERT INTO conversation_state (user_id, other_id, last_message_id, last_message_at, unread_count, version)
+        VALUES (NEW.receiver_id, NEW.sender_id, NEW.id, NEW.created_at, 1, v)
+        ON CONFLICT (user_id, other_id) DO UPDATE SET
+            last_message_id = CASE WHEN NEW.created_at >= COALESCE(conversation_state.last_message_at, '-infinity')
+                              THEN NEW.id ELSE conversation_state.last_message_id END,
+            last_message_at = GREATEST(conversation_state.last_message_at, NEW.created_at),
+            unread_count = conversation_state.unread_count + CASE WHEN NEW.id > conversation_state.read_message_id THEN 1 ELSE 0 END,
+            version = v;
+        UPDATE conversation_state SET version = v WHERE user_id = NEW.sender_id AND other_id = NEW.receiver_id;
+    ELSE
+        receiver_sees := NOT (OLD.hidden_by_receiver AND NEW.hidden_by_receiver);
+        UPDATE conversation_state SET version = v
+        WHERE (user_id = NEW.receiver_id AND other_id = NEW.sender_id AND receiver_sees)
+           OR (user_id = NEW.sender_id AND other_id = NEW.receiver_id);
+    END IF;
+    IF receiver_sees THEN
+        PERFORM sync_bump_user(NEW.receiver_id, v);
+    END IF;
+    IF NEW.sender_id <> NEW.receiver_id THEN
+        PERFORM sync_bump_user(NEW.sender_id, v);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,59 @@
+"""Сравнение синхронного handler и асинхронного asgi.handle на чтении профиля
+
+Запуск: DATABASE_URL=... python scripts/bench_async.py <username> [запросов] [параллельность]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'api'))
+
+import asgi
+import index
+
+def event_for(username):
+    return {'httpMethod': 'GET', 'path': '/profile', 'queryStringParameters': {'username': username}, 'headers': {}}
+
+def bench_sync(username, total):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(total):
+        t = time.perf_counter()
+        assert index.handler(event_for(username), None)['statusCode'] == 200
+        latencies.append(time.perf_counter() - t)
+    return time.perf_counter() - started, latencies
+
+async def bench_async(username, total, concurrency):
+    await asgi.startup()
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            t = time.perf_counter()
+            result = await asgi.handle(event_for(username))
+            assert result['statusCode'] == 200
+            latencies.append(time.perf_counter() - t)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    await asgi.shutdown()
+    return elapsed, latencies
+
+def report(name, elapsed, latencies):
+    ms = sorted(l * 1000 for l in latencies)
+    print('%-22s %8.1f req/s   p50 %7.2f ms   p95 %7.2f ms' % (
+        name, len(ms) / elapsed, statistics.median(ms), ms[int(len(ms) * 0.95) - 1]))
+
+def main():
+    username = sys.argv[1]
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    report('sync handler', *bench_sync(username, total))
+    report('async x%d' % concurrency, *asyncio.run(bench_async(username, total, concurrency)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Бенчмарк холодного старта функции API: время импорта и время до первого ответа
+
+Каждый прогон — новый процесс Python. Без DATABASE_URL измеряется только
+health-check; с DATABASE_URL дополнительно первый запрос к БД (/releases).
+
+Запуск: python scripts/bench_coldstart.py [прогонов]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'api')
+
+PROBE = r'''
+import json, os, sys, time
+t0 = time.perf_counter()
+import index
+t1 = time.perf_counter()
+index.handler({'httpMethod': 'GET', 'path': '/'}, None)
+t2 = time.perf_counter()
+result = {'import_ms': (t1 - t0) * 1000, 'first_health_ms': (t2 - t1) * 1000}
+if os.environ.get('DATABASE_URL'):
+    r = index.handler({'httpMethod': 'GET', 'path': '/releases', 'queryStringParameters': {'user_id': '1'}}, None)
+    result['first_db_ms'] = (time.perf_counter() - t2) * 1000
+    result['first_db_status'] = r['statusCode']
+print(json.dumps(result))
+'''
+
+def run_once(env):
+    out = subprocess.run([sys.executable, '-c', PROBE], cwd=API_DIR, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def top_imports(env, limit=10):
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import index'], cwd=API_DIR, env=env, capture_output=True, text=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        parts = line.split(':', 1)[1].split('|')
+        rows.append((int(parts[1]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    env = dict(os.environ)
+    samples = [run_once(env) for _ in range(runs)]
+    for key in ('import_ms', 'first_health_ms', 'first_db_ms'):
+        values = [s[key] for s in samples if key in s]
+        if values:
+            print('%-16s median %8.2f ms   min %8.2f ms   max %8.2f ms' % (key, statistics.median(values), min(values), max(values)))
+    print('\nсамые дорогие импорты (кумулятивно):')
+    for cumulative_us, name in top_imports(env):
+        print('%10.2f ms  %s' % (cumulative_us / 1000, name))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Сравнение обычного и компактного (columns + rows) формата списков: время кодирования и размер ответа
+
+Запуск: python scripts/bench_compact.py [строк] [повторов]
+С DATABASE_URL дополнительно сравнивается выборка очереди жалоб: RealDictCursor с r.*
+против кортежного курсора с REPORT_PROJECTION (время и пик памяти tracemalloc).
+"""
+import datetime
+import gzip
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import psycopg2
+import psycopg2.extras
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'api'))
+os.environ.setdefault('DB_PREWARM', '0')
+
+import index
+
+NOW = datetime.datetime(2026, 1, 1, 12, 0, 0)
+
+def user_row(i):
+    return {'id': i, 'username': 'user_%s' % i, 'display_name': 'Пользователь %s' % i,
+            'avatar_url': 'https://cdn.poehali.dev/files/%032x.jpg' % i, 'is_verified': i % 10 == 0, 'is_artist_verified': False}
+
+def chat_row(i):
+    return {'other_id': i, 'id': 100000 + i, 'content': 'Привет, как дела? %s' % i, 'created_at': NOW, 'sender_id': i,
+            'unread_count': i % 4, 'is_read': i % 3 == 0, 'user': user_row(i)}
+
+def report_row(i):
+    return {'id': i, 'reporter_id': i, 'reported_user_id': i + 1, 'reported_post_id': 5000 + i, 'reason': 'Спам',
+            'status': 'pending', 'created_at': NOW, 'reporter_username': 'user_%s' % i,
+            'reported_username': 'user_%s' % (i + 1), 'post_content': 'Текст поста с жалобой номер %s' % i}
+
+SHAPES = [
+    ('followers', 'users', index.USER_LIST_COLUMNS, user_row),
+    ('chats', 'chats', index.CHAT_COLUMNS, chat_row),
+    ('admin/reports', 'reports', list(index.REPORT_PROJECTION), report_row),
+]
+
+def prepare(key, make, count, table):
+    rows = [make(i) for i in range(count)]
+    if table and key == 'chats':
+        rows = [dict(r.pop('user'), **r) for r in rows]
+    return rows
+
+def bench_encoding(count, repeat):
+    print('%-14s %-8s %10s %10s %10s' % ('список', 'формат', 'p50, мс', 'байт', 'gzip'))
+    for name, key, columns, make in SHAPES:
+        for label, table in (('json', False), ('table', True)):
+            rows = prepare(key, make, count, table)
+            index.request_ctx.table = table
+            timings = []
+            for _ in range(repeat):
+                t = time.perf_counter()
+                body = index.list_resp(key, columns, rows)['body']
+                timings.append((time.perf_counter() - t) * 1000)
+            index.request_ctx.table = False
+            raw = body.encode('utf-8')
+            print('%-14s %-8s %10.2f %10d %10d' % (name, label, statistics.median(timings), len(raw), len(gzip.compress(raw, 6))))
+
+def measure_fetch(fn, repeat):
+    timings, peak = [], 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        t = time.perf_counter()
+        rows = fn()
+        timings.append((time.perf_counter() - t) * 1000)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return len(rows), statistics.median(timings), peak
+
+def bench_fetch(repeat):
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    query = """
+        SELECT %s FROM reports r
+        LEFT JOIN users ru ON r.reporter_id = ru.id
+        LEFT JOIN users tu ON r.reported_user_id = tu.id
+        LEFT JOIN posts p ON r.reported_post_id = p.id
+        ORDER BY r.created_at DESC LIMIT 5000
+    """
+    default = "r.*, ru.username as reporter_username, tu.username as reported_username, p.content as post_content"
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    print('\n%-10s %8s %10s %12s' % ('выборка', 'строк', 'p50, мс', 'пик, КБ'))
+    for label, table in (('dict r.*', False), ('tuple', True)):
+        index.request_ctx.table = table
+        rows, p50, peak = measure_fetch(lambda: index.fetch_listing(cur, index.REPORT_PROJECTION, default, query), repeat)
+        print('%-10s %8d %10.2f %12.1f' % (label, rows, p50, peak / 1024))
+    index.request_ctx.table = False
+    conn.close()
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    bench_encoding(count, repeat)
+    if os.environ.get('DATABASE_URL'):
+        bench_fetch(repeat)
+
+if __name__ == '__main__':
+    main()
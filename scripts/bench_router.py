@@ -0,0 +1,56 @@
+"""Микробенчмарк диспетчеризации: префиксное дерево против линейной цепочки сравнений"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'api'))
+
+from router import Router
+
+RESOURCES = ['posts', 'comments', 'users', 'messages', 'stories', 'admin', 'releases', 'tags', 'media', 'reports']
+ACTIONS = ['like', 'repost', 'delete', 'report', 'pin', 'view', 'share', 'save', 'hide', 'edit']
+
+def build(n):
+    templates = []
+    for i in range(n):
+        resource = RESOURCES[i % len(RESOURCES)]
+        action = ACTIONS[(i // len(RESOURCES)) % len(ACTIONS)]
+        group = i // (len(RESOURCES) * len(ACTIONS))
+        templates.append('/v%s/%s/{id:int}/%s' % (group, resource, action))
+    router = Router()
+    for t in templates:
+        router.add('POST', t, lambda p, b, u: None)
+    return router, templates
+
+def linear_match(templates, path):
+    parts = path.split('/')
+    for t in templates:
+        tparts = t.split('/')
+        if len(tparts) != len(parts):
+            continue
+        params = {}
+        for tp, pp in zip(tparts, parts):
+            if tp.startswith('{'):
+                if not pp.isdigit():
+                    break
+                params['id'] = int(pp)
+            elif tp != pp:
+                break
+        else:
+            return params
+    return None
+
+def main():
+    number = 20000
+    print('%8s %14s %14s' % ('routes', 'trie, мкс', 'linear, мкс'))
+    for n in (10, 100, 300, 1000):
+        router, templates = build(n)
+        path = templates[-1].replace('{id:int}', '12345')
+        assert router.match('POST', path)[1] == {'id': 12345}
+        assert linear_match(templates, path) == {'id': 12345}
+        trie = timeit.timeit(lambda: router.match('POST', path), number=number) / number * 1e6
+        linear = timeit.timeit(lambda: linear_match(templates, path), number=number // 10) / (number // 10) * 1e6
+        print('%8d %14.2f %14.2f' % (n, trie, linear))
+
+if __name__ == '__main__':
+    main()
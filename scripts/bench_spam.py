@@ -0,0 +1,117 @@
+"""Точность и пропускная способность фильтра спама на синтетическом корпусе
+
+Запуск: python scripts/bench_spam.py [обычных текстов] [кампаний] [расхожих фраз]
+
+Обычные тексты собираются из случайных слов словаря. Спам-кампания — один шаблон,
+который рассылают десятки аккаунтов с мелкими правками: замена слов, эмодзи, разные ссылки.
+Отдельно — расхожие фразы (поздравления, благодарности за подписку), которые разные
+люди пишут почти одинаково: это не спам, и задерживать (HELD) их нельзя.
+Спамом считаются все тексты кампании, кроме первых двух: их нельзя отличить
+от обычной записи, не зная продолжения. Метрики считаются по вердиктам FLAGGED и HELD.
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'api'))
+
+import spam
+
+VOCABULARY = (
+    'сегодня вчера завтра утром вечером город музыка концерт альбом трек релиз друзья кофе работа учёба '
+    'фильм сериал книга погода дождь солнце море горы поездка отпуск фото видео новый старый лучший '
+    'слушаю смотрю читаю думаю хочу могу люблю жду вижу иду играю пишу делаю спасибо привет кстати '
+    'очень совсем просто вообще правда наверное конечно точно снова опять уже ещё всегда никогда'
+).split()
+
+TEMPLATES = [
+    'Заработок от {n} рублей в день без вложений пиши в личку {url}',
+    'Бесплатные подписчики и лайки только сегодня переходи по ссылке {url} успей забрать',
+    'Розыгрыш iPhone для всех подписчиков репост и подписка {url} итоги завтра',
+    'Лучшие ставки на спорт с гарантией выигрыша {n} процентов проверено {url}',
+    'Продам аккаунт с {n} подписчиками недорого пишите срочно {url}',
+]
+
+EMOJI = ['🔥', '💰', '✅', '🎁', '👉', '']
+
+PHRASES = [
+    'Спасибо за подписку, очень приятно, заходи ещё',
+    'С днём рождения! Желаю счастья, здоровья и вдохновения',
+    'Привет всем, как ваши дела сегодня, что слушаете',
+    'Отличный трек, слушаю уже который день подряд',
+    'Всех с наступающим Новым годом, пусть всё сбудется',
+    'Спасибо всем за поздравления, вы лучшие, очень тронут',
+]
+
+def ordinary(rng):
+    return ' '.join(rng.choice(VOCABULARY) for _ in range(rng.randint(3, 25)))
+
+def mutate(rng, template):
+    words = template.format(n=rng.randint(1, 99) * 1000, url='https://bit.ly/%06x' % rng.getrandbits(24)).split()
+    for _ in range(rng.randint(0, 2)):
+        words[rng.randrange(len(words))] = rng.choice(VOCABULARY)
+    return ' '.join(words) + ' ' + rng.choice(EMOJI)
+
+def rephrase(rng, phrase):
+    words = phrase.split()
+    if rng.random() < 0.5:
+        words[rng.randrange(len(words))] = rng.choice(VOCABULARY)
+    return ' '.join(words) + rng.choice(['', '!', ' ❤️', ' 🙂'])
+
+def corpus(normal, campaigns, phrases, seed=7):
+    """[(user_id, text, вид, момент)]: обычные записи, расхожие фразы и кампании, перемешанные во времени в пределах часа"""
+    rng = random.Random(seed)
+    users = normal // 5 + 1
+    items = [(rng.randint(1, users), ordinary(rng), 'normal', rng.uniform(0, 3600)) for _ in range(normal)]
+    items += [(rng.randint(1, users), rephrase(rng, rng.choice(PHRASES)), 'phrase', rng.uniform(0, 3600)) for _ in range(phrases)]
+    for c in range(campaigns):
+        template = TEMPLATES[c % len(TEMPLATES)]
+        start = rng.uniform(0, 3000)
+        for i in range(rng.randint(20, 60)):
+            items.append((10 ** 6 + c * 1000 + i, mutate(rng, template), 'spam' if i >= 2 else 'normal', start + i * rng.uniform(1, 10)))
+    items.sort(key=lambda item: item[3])
+    return items
+
+def main():
+    normal = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    campaigns = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+    phrases = int(sys.argv[3]) if len(sys.argv) > 3 else normal // 20
+    items = corpus(normal, campaigns, phrases)
+    spam_filter = spam.SpamFilter()
+    tp = fp = fn = tn = 0
+    held = 0
+    phrase_verdicts = {spam.OK: 0, spam.FLAGGED: 0, spam.HELD: 0}
+    latencies = []
+    started = time.perf_counter()
+    for user_id, text, kind, at in items:
+        t = time.perf_counter()
+        verdict, checked = spam_filter.check(user_id, text, now=at)
+        spam_filter.record(checked)
+        latencies.append((time.perf_counter() - t) * 1e6)
+        flagged = verdict != spam.OK
+        held += verdict == spam.HELD
+        is_spam = kind == 'spam'
+        if kind == 'phrase':
+            phrase_verdicts[verdict] += 1
+        elif flagged and is_spam:
+            tp += 1
+        elif flagged:
+            fp += 1
+        elif is_spam:
+            fn += 1
+        else:
+            tn += 1
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print('текстов: %d (спам %d), вердиктов HELD: %d' % (len(items), tp + fn, held))
+    print('precision: %.3f  recall: %.3f  ложных срабатываний на обычных: %.4f' % (
+        tp / max(tp + fp, 1), tp / max(tp + fn, 1), fp / max(fp + tn, 1)))
+    print('расхожие фразы: %d, FLAGGED %d, HELD %d' % (phrases, phrase_verdicts[spam.FLAGGED], phrase_verdicts[spam.HELD]))
+    print('пропускная способность: %.0f проверок/с  p50 %.1f мкс  p99 %.1f мкс' % (
+        len(items) / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.99)]))
+    print(spam_filter.metrics())
+
+if __name__ == '__main__':
+    main()
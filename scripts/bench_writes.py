@@ -0,0 +1,181 @@
+"""Сравнение старых многошаговых записей и серверных функций *_v1: обращения к БД и задержка
+
+Запуск: DATABASE_URL=... python scripts/bench_writes.py [повторов]
+
+Создаёт двух временных пользователей и пост, в конце удаляет их вместе со всеми записями.
+"""
+import os
+import secrets
+import statistics
+import sys
+import time
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+
+class CountingCursor(psycopg2.extras.RealDictCursor):
+    def execute(self, query, vars=None):
+        self.connection.round_trips += 1
+        if not self.connection.autocommit and self.connection.status == psycopg2.extensions.STATUS_READY:
+            self.connection.round_trips += 1
+        return super().execute(query, vars)
+
+class CountingConnection(psycopg2.extensions.connection):
+    round_trips = 0
+
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault('cursor_factory', CountingCursor)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        if self.status != psycopg2.extensions.STATUS_READY:
+            self.round_trips += 1
+        return super().commit()
+
+def legacy_like(conn, user_id, post_id):
+    cur = conn.cursor()
+    cur.execute("SELECT id FROM likes WHERE user_id = %s AND post_id = %s AND comment_id IS NULL" % (user_id, post_id))
+    existing = cur.fetchone()
+    if existing:
+        cur.execute("UPDATE likes SET post_id = NULL WHERE id = %s" % existing['id'])
+        cur.execute("UPDATE posts SET likes_count = GREATEST(likes_count - 1, 0) WHERE id = %s" % post_id)
+    else:
+        cur.execute("INSERT INTO likes (user_id, post_id) VALUES (%s, %s)" % (user_id, post_id))
+        cur.execute("UPDATE posts SET likes_count = likes_count + 1 WHERE id = %s" % post_id)
+        cur.execute("SELECT user_id FROM posts WHERE id = %s" % post_id)
+        owner = cur.fetchone()
+        if owner and owner['user_id'] != user_id:
+            cur.execute("INSERT INTO notifications (user_id, from_user_id, type, post_id) VALUES (%s, %s, 'like', %s)" % (owner['user_id'], user_id, post_id))
+    conn.commit()
+    cur.execute("SELECT likes_count FROM posts WHERE id = %s" % post_id)
+    cur.fetchone()
+    conn.commit()
+
+def legacy_comment(conn, user_id, post_id):
+    cur = conn.cursor()
+    cur.execute("INSERT INTO comments (post_id, user_id, parent_id, content) VALUES (%s, %s, NULL, 'bench') RETURNING *" % (post_id, user_id))
+    comment = cur.fetchone()
+    cur.execute("UPDATE posts SET comments_count = comments_count + 1 WHERE id = %s" % post_id)
+    cur.execute("SELECT user_id FROM posts WHERE id = %s" % post_id)
+    owner = cur.fetchone()
+    if owner and owner['user_id'] != user_id:
+        cur.execute("INSERT INTO notifications (user_id, from_user_id, type, post_id, comment_id) VALUES (%s, %s, 'comment', %s, %s)" % (owner['user_id'], user_id, post_id, comment['id']))
+    conn.commit()
+    cur.execute("SELECT username, display_name, avatar_url, is_verified, is_artist_verified FROM users WHERE id = %s" % user_id)
+    cur.fetchone()
+    conn.commit()
+
+def legacy_repost(conn, user_id, post_id):
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM posts WHERE id = %s" % post_id)
+    orig = cur.fetchone()
+    real_id = orig['original_post_id'] if orig['is_repost'] else orig['id']
+    cur.execute("INSERT INTO posts (user_id, content, is_repost, original_post_id) VALUES (%s, '', TRUE, %s) RETURNING *" % (user_id, real_id))
+    cur.fetchone()
+    cur.execute("UPDATE posts SET reposts_count = reposts_count + 1 WHERE id = %s" % real_id)
+    conn.commit()
+
+def legacy_follow(conn, user_id, target_id):
+    cur = conn.cursor()
+    cur.execute("SELECT is_private FROM users WHERE id = %s" % target_id)
+    target = cur.fetchone()
+    cur.execute("SELECT id, status FROM follows WHERE follower_id = %s AND following_id = %s" % (user_id, target_id))
+    if cur.fetchone():
+        conn.commit()
+        return
+    status = 'pending' if target['is_private'] else 'active'
+    cur.execute("INSERT INTO follows (follower_id, following_id, status) VALUES (%s, %s, '%s')" % (user_id, target_id, status))
+    cur.execute("INSERT INTO notifications (user_id, from_user_id, type) VALUES (%s, %s, 'follow')" % (target_id, user_id))
+    conn.commit()
+
+def legacy_message(conn, user_id, receiver_id):
+    cur = conn.cursor()
+    cur.execute("SELECT blocked_id FROM user_blocks WHERE blocker_id = %s UNION SELECT blocker_id FROM user_blocks WHERE blocked_id = %s" % (user_id, user_id))
+    cur.fetchall()
+    cur.execute("SELECT allow_messages FROM users WHERE id = %s" % receiver_id)
+    cur.fetchone()
+    cur.execute("INSERT INTO messages (sender_id, receiver_id, content, reply_to_id) VALUES (%s, %s, 'bench', NULL) RETURNING *" % (user_id, receiver_id))
+    cur.fetchone()
+    cur.execute("INSERT INTO notifications (user_id, from_user_id, type) VALUES (%s, %s, 'message')" % (receiver_id, user_id))
+    conn.commit()
+
+def single(query):
+    def run(conn, user_id, target):
+        cur = conn.cursor()
+        cur.execute(query % (user_id, target))
+        cur.fetchone()
+    return run
+
+UNFOLLOW = "DELETE FROM follows WHERE follower_id = %s AND following_id = %s"
+
+CASES = [
+    ('like_post', 'post', legacy_like, single("SELECT * FROM like_post_v1(%s, %s)"), None),
+    ('add_comment', 'post', legacy_comment, single("SELECT add_comment_v1(%s, %s, NULL, 'bench')"), None),
+    ('repost', 'post', legacy_repost, single("SELECT repost_v1(%s, %s)"), None),
+    ('follow_user', 'owner', legacy_follow, single("SELECT follow_user_v1(%s, %s)"), UNFOLLOW),
+    ('send_message', 'owner', legacy_message, single("SELECT send_message_v1(%s, %s, 'bench', NULL)"), None),
+]
+
+def measure(conn, admin, fn, reset, user_id, target, repeat):
+    """Средние обращения к БД и p50/p95 задержки; reset выполняется отдельным соединением вне замера"""
+    counted = 0
+    latencies = []
+    for _ in range(repeat):
+        if reset:
+            admin.cursor().execute(reset % (user_id, target))
+        conn.round_trips = 0
+        t = time.perf_counter()
+        fn(conn, user_id, target)
+        latencies.append((time.perf_counter() - t) * 1000)
+        counted += conn.round_trips
+    return counted / repeat, statistics.median(latencies), sorted(latencies)[int(repeat * 0.95) - 1]
+
+def setup(conn):
+    cur = conn.cursor()
+    suffix = secrets.token_hex(4)
+    ids = []
+    for role in ('writer', 'owner'):
+        cur.execute("INSERT INTO users (username, email, password_hash) VALUES ('bench_%s_%s', 'bench_%s_%s@example.com', '-') RETURNING id" % (
+            role, suffix, role, suffix))
+        ids.append(cur.fetchone()['id'])
+    cur.execute("INSERT INTO posts (user_id, content) VALUES (%s, 'bench') RETURNING id" % ids[1])
+    post_id = cur.fetchone()['id']
+    return ids[0], ids[1], post_id
+
+def cleanup(conn, writer, owner):
+    cur = conn.cursor()
+    users = '%s, %s' % (writer, owner)
+    cur.execute("DELETE FROM notifications WHERE user_id IN (%s) OR from_user_id IN (%s)" % (users, users))
+    cur.execute("DELETE FROM messages WHERE sender_id IN (%s) OR receiver_id IN (%s)" % (users, users))
+    cur.execute("DELETE FROM follows WHERE follower_id IN (%s) OR following_id IN (%s)" % (users, users))
+    cur.execute("DELETE FROM likes WHERE user_id IN (%s)" % users)
+    cur.execute("DELETE FROM comments WHERE user_id IN (%s)" % users)
+    cur.execute("DELETE FROM posts WHERE user_id IN (%s)" % users)
+    cur.execute("DELETE FROM sync_state WHERE user_id IN (%s)" % users)
+    cur.execute("DELETE FROM conversation_state WHERE user_id IN (%s) OR other_id IN (%s)" % (users, users))
+    cur.execute("DELETE FROM users WHERE id IN (%s)" % users)
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    legacy = psycopg2.connect(os.environ['DATABASE_URL'], connection_factory=CountingConnection)
+    fused = psycopg2.connect(os.environ['DATABASE_URL'], connection_factory=CountingConnection)
+    fused.autocommit = True
+    admin = psycopg2.connect(os.environ['DATABASE_URL'], cursor_factory=psycopg2.extras.RealDictCursor)
+    admin.autocommit = True
+    writer, owner, post_id = setup(admin)
+    targets = {'post': post_id, 'owner': owner}
+    try:
+        print('%-14s %-8s %8s %10s %10s' % ('запись', 'вариант', 'обращ.', 'p50, мс', 'p95, мс'))
+        for name, target, before, after, reset in CASES:
+            for label, conn, fn in (('до', legacy, before), ('после', fused, after)):
+                trips, p50, p95 = measure(conn, admin, fn, reset, writer, targets[target], repeat)
+                print('%-14s %-8s %8.1f %10.2f %10.2f' % (name, label, trips, p50, p95))
+    finally:
+        legacy.rollback()
+        cleanup(admin, writer, owner)
+        for conn in (legacy, fused, admin):
+            conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""Массовый импорт/экспорт пользователей, постов и подписок через COPY
+
+Примеры:
+  DATABASE_URL=... python scripts/bulk_data.py import users users.csv
+  DATABASE_URL=... python scripts/bulk_data.py export posts posts.csv
+  DATABASE_URL=... python scripts/bulk_data.py recount
+
+Файлы — CSV с заголовком, колонки в порядке COLUMNS. Прогресс каждой пачки
+(смещение в файле) фиксируется в bulk_progress в той же транзакции, поэтому после
+сбоя повторный запуск продолжает с первой незафиксированной пачки.
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+
+import psycopg2
+
+COLUMNS = {
+    'users': ['id', 'username', 'email', 'password_hash', 'display_name', 'bio', 'avatar_url', 'is_private', 'is_verified', 'is_artist_verified', 'created_at'],
+    'posts': ['id', 'user_id', 'content', 'media_urls', 'is_repost', 'original_post_id', 'views_count', 'created_at'],
+    'follows': ['id', 'follower_id', 'following_id', 'status', 'created_at'],
+}
+
+TRIGGERS = {
+    'follows': ['trg_follows_counts'],
+}
+
+RECOUNTS = [
+    ('posts.likes_count', """
+        WITH c AS (SELECT post_id, COUNT(*) AS cnt FROM likes WHERE post_id IS NOT NULL AND comment_id IS NULL GROUP BY post_id)
+        UPDATE posts p SET likes_count = COALESCE(c.cnt, 0)
+        FROM posts p2 LEFT JOIN c ON c.post_id = p2.id
+        WHERE p.id = p2.id AND p.likes_count IS DISTINCT FROM COALESCE(c.cnt, 0)
+    """),
+    ('posts.comments_count', """
+        WITH c AS (SELECT post_id, COUNT(*) AS cnt FROM comments WHERE is_removed = FALSE GROUP BY post_id)
+        UPDATE posts p SET comments_count = COALESCE(c.cnt, 0)
+        FROM posts p2 LEFT JOIN c ON c.post_id = p2.id
+        WHERE p.id = p2.id AND p.comments_count IS DISTINCT FROM COALESCE(c.cnt, 0)
+    """),
+    ('posts.reposts_count', """
+        WITH c AS (SELECT original_post_id AS post_id, COUNT(*) AS cnt FROM posts WHERE is_repost = TRUE AND original_post_id IS NOT NULL GROUP BY original_post_id)
+        UPDATE posts p SET reposts_count = COALESCE(c.cnt, 0)
+        FROM posts p2 LEFT JOIN c ON c.post_id = p2.id
+        WHERE p.id = p2.id AND p.reposts_count IS DISTINCT FROM COALESCE(c.cnt, 0)
+    """),
+    ('users.followers_count', """
+        WITH c AS (SELECT following_id AS user_id, COUNT(*) AS cnt FROM follows WHERE status = 'active' GROUP BY following_id)
+        UPDATE users u SET followers_count = COALESCE(c.cnt, 0)
+        FROM users u2 LEFT JOIN c ON c.user_id = u2.id
+        WHERE u.id = u2.id AND u.followers_count IS DISTINCT FROM COALESCE(c.cnt, 0)
+    """),
+    ('users.following_count', """
+        WITH c AS (SELECT follower_id AS user_id, COUNT(*) AS cnt FROM follows WHERE status = 'active' GROUP BY follower_id)
+        UPDATE users u SET following_count = COALESCE(c.cnt, 0)
+        FROM users u2 LEFT JOIN c ON c.user_id = u2.id
+        WHERE u.id = u2.id AND u.following_count IS DISTINCT FROM COALESCE(c.cnt, 0)
+    """),
+]
+
+def get_db():
+    return psycopg2.connect(os.environ['DATABASE_URL'])
+
+def load_progress(cur, job):
+    cur.execute("INSERT INTO bulk_progress (job) VALUES ('%s') ON CONFLICT (job) DO NOTHING" % job.replace("'", "''"))
+    cur.execute("SELECT rows_done, last_id, file_offset, finished FROM bulk_progress WHERE job = '%s'" % job.replace("'", "''"))
+    return cur.fetchone()
+
+def save_progress(cur, job, rows_done, last_id, file_offset=0, finished=False):
+    cur.execute("UPDATE bulk_progress SET rows_done = %s, last_id = %s, file_offset = %s, finished = %s, updated_at = NOW() WHERE job = '%s'" % (
+        rows_done, last_id, file_offset, finished, job.replace("'", "''")))
+
+def report(label, rows, started):
+    elapsed = max(time.time() - started, 1e-9)
+    print('%s: %d строк, %.1f с, %.0f строк/с' % (label, rows, elapsed, rows / elapsed), file=sys.stderr)
+
+def read_records(f, limit):
+    """До limit записей CSV байтами как есть: пустая строка в кавычках и NULL различаются только записью в файле,
+    поэтому строки не переписываются. Запись заканчивается строкой, после которой число кавычек чётное —
+    внутри поля COPY удваивает кавычку, а перевод строки оставляет в кавычках"""
+    lines, n, quotes = [], 0, 0
+    while n < limit:
+        line = f.readline()
+        if not line:
+            break
+        if not quotes and not line.strip():
+            continue
+        lines.append(line)
+        quotes += line.count(b'"')
+        if quotes % 2 == 0:
+            quotes = 0
+            n += 1
+    return b''.join(lines), n
+
+def import_table(table, path, chunk_rows):
+    columns = COLUMNS[table]
+    job = 'import:%s:%s' % (table, os.path.abspath(path))
+    conn = get_db()
+    cur = conn.cursor()
+    rows_done, _, file_offset, finished = load_progress(cur, job)
+    conn.commit()
+    if finished:
+        print('%s уже импортирован' % path, file=sys.stderr)
+        return
+    for trigger in TRIGGERS.get(table, []):
+        cur.execute("ALTER TABLE %s DISABLE TRIGGER %s" % (table, trigger))
+    conn.commit()
+    started = time.time()
+    imported = 0
+    try:
+        with open(path, 'rb') as f:
+            header = next(csv.reader([f.readline().decode('utf-8')]), [])
+            if header != columns:
+                raise SystemExit('Ожидались колонки %s' % ','.join(columns))
+            if file_offset:
+                f.seek(file_offset)
+            elif rows_done:
+                read_records(f, rows_done)
+            while True:
+                data, n = read_records(f, chunk_rows)
+                if not n:
+                    break
+                cur.copy_expert("COPY %s (%s) FROM STDIN WITH (FORMAT csv)" % (table, ', '.join(columns)), io.BytesIO(data))
+                rows_done += n
+                imported += n
+                file_offset = f.tell()
+                save_progress(cur, job, rows_done, 0, file_offset)
+                conn.commit()
+                report('%s +%d' % (table, n), imported, started)
+        cur.execute("SELECT setval('%s_id_seq', COALESCE((SELECT MAX(id) FROM %s), 1))" % (table, table))
+        save_progress(cur, job, rows_done, 0, file_offset, finished=True)
+        conn.commit()
+    finally:
+        conn.rollback()
+        for trigger in TRIGGERS.get(table, []):
+            cur.execute("ALTER TABLE %s ENABLE TRIGGER %s" % (table, trigger))
+        conn.commit()
+        conn.close()
+    report('импорт %s завершён' % table, imported, started)
+    if TRIGGERS.get(table):
+        print('Триггеры %s были отключены на время загрузки — запустите recount' % table, file=sys.stderr)
+
+def export_table(table, path, chunk_rows):
+    columns = COLUMNS[table]
+    job = 'export:%s:%s' % (table, os.path.abspath(path))
+    conn = get_db()
+    cur = conn.cursor()
+    rows_done, last_id, file_offset, finished = load_progress(cur, job)
+    conn.commit()
+    if finished:
+        print('%s уже выгружен' % path, file=sys.stderr)
+        return
+    if not rows_done:
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerow(columns)
+    started = time.time()
+    exported = 0
+    with open(path, 'r+', newline='', encoding='utf-8') as f:
+        if rows_done:
+            f.truncate(file_offset)
+        f.seek(0, os.SEEK_END)
+        while True:
+            buf = io.StringIO()
+            cur.copy_expert("COPY (SELECT %s FROM %s WHERE id > %s ORDER BY id LIMIT %s) TO STDOUT WITH (FORMAT csv)" % (
+                ', '.join(columns), table, last_id, chunk_rows), buf)
+            data = buf.getvalue()
+            if not data:
+                break
+            rows = list(csv.reader(io.StringIO(data)))
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            last_id = int(rows[-1][0])
+            rows_done += len(rows)
+            exported += len(rows)
+            save_progress(cur, job, rows_done, last_id, f.tell())
+            conn.commit()
+            report('%s +%d' % (table, len(rows)), exported, started)
+    save_progress(cur, job, rows_done, last_id, finished=True)
+    conn.commit()
+    conn.close()
+    report('экспорт %s завершён' % table, exported, started)
+
+def recount():
+    conn = get_db()
+    cur = conn.cursor()
+    for name, sql in RECOUNTS:
+        started = time.time()
+        cur.execute(sql)
+        conn.commit()
+        report('пересчёт %s (изменено)' % name, cur.rowcount, started)
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    for command in ('import', 'export'):
+        p = sub.add_parser(command)
+        p.add_argument('table', choices=sorted(COLUMNS))
+        p.add_argument('path')
+        p.add_argument('--chunk-rows', type=int, default=50000)
+    sub.add_parser('recount')
+    args = parser.parse_args()
+    if args.command == 'import':
+        import_table(args.table, args.path, args.chunk_rows)
+    elif args.command == 'export':
+        export_table(args.table, args.path, args.chunk_rows)
+    else:
+        recount()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,353 @@
+"""Регрессии планов запросов API: EXPLAIN (ANALYZE, BUFFERS) для SQL каждого маршрута
+
+Запуск (только на отдельной пустой базе с применёнными миграциями):
+  DATABASE_URL=... python scripts/plan_check.py seed [масштаб]
+  DATABASE_URL=... python scripts/plan_check.py check
+  DATABASE_URL=... python scripts/plan_check.py record
+
+seed заполняет базу синтетическими данными (масштаб 1 — 10 тыс. пользователей,
+~1 млн лайков) и делает ANALYZE. check прогоняет маршруты из ROUTES через
+index.handler, перехватывает каждый запрос и объясняет его отдельно в
+откатываемой транзакции. Проверка падает (код 1), если в плане есть Seq Scan
+по таблице больше SEQ_SCAN_MIN_ROWS строк, или стоимость выросла больше чем
+в COST_TOLERANCE раз относительно plan_baseline.json. record перезаписывает базовую линию.
+Все записи маршрутов откатываются: commit() перехваченного соединения ничего не делает.
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'api'))
+os.environ.setdefault('DB_PREWARM', '0')
+
+import index
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plan_baseline.json')
+SEQ_SCAN_MIN_ROWS = 10000
+COST_TOLERANCE = 1.25
+
+ALLOWED_SEQ_SCANS = {
+    ('GET /admin/stats', 'posts'),
+    ('GET /admin/stats', 'users'),
+}
+
+SEED = [
+    "SELECT setseed(0.42)",
+    "SELECT ensure_month_partitions('messages', (NOW() - INTERVAL '6 months')::date, 3)",
+    "SELECT ensure_month_partitions('notifications', (NOW() - INTERVAL '6 months')::date, 3)",
+    """INSERT INTO users (username, email, password_hash, display_name, is_private)
+       SELECT 'plan_' || i, 'plan_' || i || '@example.com', '-', 'Plan ' || i, random() < 0.1
+       FROM generate_series(1, {users}) i""",
+    """INSERT INTO posts (user_id, content, likes_count, comments_count, created_at)
+       SELECT {hot}, 'post ' || i || ' #tag' || (i %% 300) || CASE WHEN i %% 7 = 0 THEN ' @plan_' || (1 + i %% 50) ELSE '' END,
+              (random() * 100)::int, (random() * 20)::int, NOW() - random() * INTERVAL '120 days'
+       FROM generate_series(1, {users} * 20) i""",
+    """INSERT INTO posts (user_id, content, is_repost, original_post_id, created_at)
+       SELECT {any}, '', TRUE, {post}, NOW() - random() * INTERVAL '120 days'
+       FROM generate_series(1, {users} * 2) i""",
+    """INSERT INTO follows (follower_id, following_id, status, created_at)
+       SELECT {any}, {hot}, CASE WHEN random() < 0.05 THEN 'pending' ELSE 'active' END, NOW() - random() * INTERVAL '365 days'
+       FROM generate_series(1, {users} * 40) i
+       ON CONFLICT DO NOTHING""",
+    """INSERT INTO likes (user_id, post_id, created_at)
+       SELECT {any}, {post}, NOW() - random() * INTERVAL '120 days'
+       FROM generate_series(1, {users} * 100) i""",
+    """INSERT INTO comments (post_id, user_id, parent_id, content, likes_count, created_at)
+       SELECT {post}, {any}, NULL, 'comment ' || i, (random() * 50)::int, NOW() - random() * INTERVAL '120 days'
+       FROM generate_series(1, {users} * 20) i""",
+    """INSERT INTO comments (post_id, user_id, parent_id, content, created_at)
+       SELECT c.post_id, {any}, c.id, 'reply', c.created_at + random() * INTERVAL '1 day'
+       FROM comments c, generate_series(1, 2) WHERE c.parent_id IS NULL AND c.id %% 5 = 0""",
+    """INSERT INTO likes (user_id, comment_id, created_at)
+       SELECT {any}, c.id, c.created_at FROM comments c WHERE c.id %% 3 = 0""",
+    """INSERT INTO messages (sender_id, receiver_id, content, created_at)
+       SELECT {hot}, {any}, 'message ' || i, NOW() - random() * INTERVAL '120 days'
+       FROM generate_series(1, {users} * 20) i""",
+    """INSERT INTO notifications (user_id, from_user_id, type, post_id, created_at)
+       SELECT {hot}, {any}, 'like', {post}, NOW() - random() * INTERVAL '120 days'
+       FROM generate_series(1, {users} * 40) i""",
+    """INSERT INTO stories (user_id, media_url, created_at, expires_at)
+       SELECT {any}, 'https://example.com/s.jpg', t, t + INTERVAL '24 hours'
+       FROM (SELECT NOW() - random() * INTERVAL '30 days' AS t FROM generate_series(1, {users} * 2)) s""",
+    """INSERT INTO reports (reporter_id, reported_post_id, reason, status, created_at)
+       SELECT {any}, {post}, 'spam', CASE WHEN random() < 0.1 THEN 'pending' ELSE 'resolved' END, NOW() - random() * INTERVAL '365 days'
+       FROM generate_series(1, {users} * 2) i""",
+    """INSERT INTO verification_requests (user_id, status, created_at)
+       SELECT {any}, CASE WHEN random() < 0.1 THEN 'pending' ELSE 'approved' END, NOW() - random() * INTERVAL '365 days'
+       FROM generate_series(1, {users}) i""",
+    """INSERT INTO appeals (user_id, reason, status, created_at)
+       SELECT {any}, 'appeal', CASE WHEN random() < 0.1 THEN 'pending' ELSE 'rejected' END, NOW() - random() * INTERVAL '365 days'
+       FROM generate_series(1, {users}) i""",
+    """INSERT INTO releases (user_id, title, artist, created_at)
+       SELECT {hot}, 'release ' || i, 'artist', NOW() - random() * INTERVAL '365 days'
+       FROM generate_series(1, {users}) i""",
+    """INSERT INTO post_tags (tag, post_id, created_at)
+       SELECT 'tag' || (id %% 300), id, created_at FROM posts WHERE is_repost = FALSE
+       ON CONFLICT DO NOTHING""",
+    """INSERT INTO post_mentions (user_id, post_id, created_at)
+       SELECT u.id, p.id, p.created_at FROM posts p JOIN users u ON u.username = 'plan_' || (1 + p.id %% 50)
+       WHERE p.id %% 7 = 0 AND p.is_repost = FALSE
+       ON CONFLICT DO NOTHING""",
+    """INSERT INTO tag_buckets (tag, bucket, uses)
+       SELECT tag, date_trunc('hour', created_at), COUNT(*) FROM post_tags
+       WHERE created_at > NOW() - INTERVAL '7 days' GROUP BY 1, 2
+       ON CONFLICT DO NOTHING""",
+    "ANALYZE",
+]
+
+ROUTES = [
+    ('GET', '/feed', {}),
+    ('GET', '/feed', {'mode': 'ranked'}),
+    ('GET', '/posts/{post}', {}),
+    ('GET', '/posts/{post}/comments', {}),
+    ('GET', '/posts/{post}/comments', {'sort': 'top'}),
+    ('GET', '/comments/replies', {'post_id': '{post}', 'parent_id': '{comment}'}),
+    ('GET', '/users/{username}/profile', {}),
+    ('GET', '/users/{username}/followers', {}),
+    ('GET', '/users/{username}/following', {}),
+    ('GET', '/users/{username}/friends', {}),
+    ('GET', '/users/{username}/likes', {}),
+    ('GET', '/users/{username}/reposts', {}),
+    ('GET', '/users/{username}/releases', {}),
+    ('GET', '/users/search', {'q': 'plan_12'}),
+    ('GET', '/messages/{other}', {}),
+    ('GET', '/messages/chats', {}),
+    ('GET', '/notifications', {}),
+    ('GET', '/stories', {}),
+    ('GET', '/follow-requests', {}),
+    ('GET', '/tags/{tag}', {}),
+    ('GET', '/tags/trending', {}),
+    ('GET', '/mentions', {}),
+    ('GET', '/sync/state', {}),
+    ('GET', '/admin/reports', {}),
+    ('GET', '/admin/verifications', {}),
+    ('GET', '/admin/appeals', {}),
+    ('GET', '/admin/stats', {}),
+    ('POST', '/posts/create', {'content': 'plan check #{tag} @plan_2'}),
+    ('POST', '/posts/{post}/like', {}),
+    ('POST', '/posts/{post}/comment', {'content': 'plan check'}),
+    ('POST', '/users/{other_username}/follow', {}),
+    ('POST', '/messages/send', {'receiver_id': '{other}', 'content': 'plan check'}),
+    ('POST', '/messages/read', {'user_id': '{other}'}),
+    ('POST', '/notifications/read-all', {}),
+    ('POST', '/verification/request', {}),
+]
+
+CONTEXT = """
+    WITH hot AS (SELECT following_id AS id FROM follows GROUP BY 1 ORDER BY COUNT(*) DESC LIMIT 1),
+    post AS (SELECT post_id AS id FROM comments WHERE parent_id IS NULL GROUP BY 1 ORDER BY COUNT(*) DESC LIMIT 1)
+    SELECT u.id AS viewer, u.username,
+        (SELECT receiver_id FROM messages WHERE sender_id = u.id GROUP BY 1 ORDER BY COUNT(*) DESC LIMIT 1) AS other,
+        (SELECT id FROM post) AS post,
+        (SELECT parent_id FROM comments WHERE post_id = (SELECT id FROM post) AND parent_id IS NOT NULL
+         GROUP BY 1 ORDER BY COUNT(*) DESC LIMIT 1) AS comment,
+        (SELECT tag FROM post_tags GROUP BY 1 ORDER BY COUNT(*) DESC LIMIT 1) AS tag,
+        (SELECT id FROM users WHERE is_admin = TRUE LIMIT 1) AS admin
+    FROM users u JOIN hot ON hot.id = u.id
+"""
+
+class RecordingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        self.connection.log.append(query if vars is None else self.mogrify(query, vars).decode())
+        return super().execute(query, vars)
+
+class RecordingConnection(psycopg2.extensions.connection):
+    """Записывает все запросы маршрута; commit и autocommit игнорируются, close откатывает"""
+    log = None
+
+    @property
+    def autocommit(self):
+        return False
+
+    @autocommit.setter
+    def autocommit(self, value):
+        pass
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.pop('cursor_factory', None) or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = type('Recording' + factory.__name__, (RecordingCursor, factory), {})
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        if not self.closed:
+            self.rollback()
+        super().close()
+
+def seed(conn, scale):
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM users")
+    if cur.fetchone()[0] > 1:
+        sys.exit('База не пустая — seed запускается только на отдельной базе')
+    cur.execute("SELECT COALESCE(MAX(id), 0) FROM users")
+    base = cur.fetchone()[0]
+    users = 10000 * scale
+    fill = {
+        'users': users,
+        'any': '%s + 1 + floor(random() * %s)::int' % (base, users),
+        'hot': '%s + 1 + floor(power(random(), 3) * %s)::int' % (base, users),
+        'post': '1 + floor(power(random(), 2) * %s)::int' % (users * 20),
+    }
+    for statement in SEED:
+        t = time.perf_counter()
+        cur.execute(statement.format(**fill).replace('%%', '%'))
+        conn.commit()
+        print('%7.1f с  %s' % (time.perf_counter() - t, ' '.join(statement.split())[:90]))
+
+def fill_route(value, ctx):
+    if isinstance(value, dict):
+        return {k: fill_route(v, ctx) for k, v in value.items()}
+    return value.format(**ctx)
+
+def capture(ctx):
+    """Прогоняет ROUTES через handler и возвращает [(маршрут, запрос)] в порядке выполнения"""
+    index.limiter = index.RateLimiter({})
+    captured = []
+
+    def recording_db():
+        conn = psycopg2.connect(index.CONFIG['database_url'], connection_factory=RecordingConnection)
+        conn.log = log
+        return conn
+
+    index.get_db = recording_db
+    for method, template, payload in ROUTES:
+        user_id = ctx['admin'] if template.startswith('/admin/') else ctx['viewer']
+        index.tokens['plan-check'] = user_id
+        index.reads.cache.clear()
+        index.trending_cache.clear()
+        index.user_cards.entries.clear()
+        path = template.format(**ctx)
+        payload = fill_route(payload, ctx)
+        event = {'httpMethod': method, 'path': path, 'headers': {'X-Authorization': 'plan-check'}}
+        if method == 'GET':
+            event['queryStringParameters'] = payload
+        else:
+            event['body'] = json.dumps(payload)
+        log = []
+        result = index.handler(event, None)
+        label = '%s %s' % (method, template)
+        if result['statusCode'] >= 400:
+            print('! %s -> %s %s' % (label, result['statusCode'], result['body'][:200]))
+        captured.extend((label, q) for q in log)
+    return captured
+
+def fingerprint(query):
+    query = re.sub(r"'(?:[^']|'')*'", "?", query)
+    query = re.sub(r"\b\d+(\.\d+)?\b", "?", query)
+    return ' '.join(query.split())
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child)
+
+def explain(conn, query):
+    cur = conn.cursor()
+    try:
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query)
+        return cur.fetchone()[0][0]
+    finally:
+        conn.rollback()
+
+def relation_sizes(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT relname, reltuples FROM pg_class WHERE relkind IN ('r', 'p')")
+    sizes = dict(cur.fetchall())
+    conn.rollback()
+    return sizes
+
+def suggest_index(node):
+    """Черновик индекса по колонкам из равенств фильтра Seq Scan; порядок колонок стоит проверить вручную"""
+    condition = re.sub(r"::\w+(?: varying| with(?:out)? time zone)?(?:\[\])?", "", node.get('Filter', ''))
+    condition = condition.replace('(', ' ').replace(')', ' ')
+    columns = []
+    for column in re.findall(r"(\w+)\s+(?:=\s|IS NULL|IS NOT NULL)", condition):
+        if column not in columns and column.upper() not in ('AND', 'OR', 'NOT', 'ANY'):
+            columns.append(column)
+    if not columns:
+        return None
+    relation = re.sub(r'_\d{6}$', '', node['Relation Name'])
+    return 'CREATE INDEX idx_%s_%s ON %s (%s);' % (relation, '_'.join(columns), relation, ', '.join(columns))
+
+def check(conn, captured, baseline):
+    sizes = relation_sizes(conn)
+    results, failures, suggestions = {}, [], []
+    for label, query in captured:
+        if not re.match(r"\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b", query, re.I):
+            continue
+        text = fingerprint(query)
+        key = '%s %s' % (label, hashlib.sha1(text.encode()).hexdigest()[:10])
+        if key in results:
+            continue
+        try:
+            plan = explain(conn, query)
+        except psycopg2.Error as e:
+            failures.append('%s: ошибка EXPLAIN: %s' % (key, str(e).strip()))
+            continue
+        top = plan['Plan']
+        results[key] = {'sql': text[:300], 'cost': top['Total Cost']}
+        buffers = top.get('Shared Hit Blocks', 0) + top.get('Shared Read Blocks', 0)
+        print('%-60s cost %10.1f  %8.2f мс  %7d буф.' % (key[:60], top['Total Cost'], plan['Execution Time'], buffers))
+        for node in plan_nodes(top):
+            relation = node.get('Relation Name')
+            if node['Node Type'] != 'Seq Scan' or (label, re.sub(r'_\d{6}$', '', relation)) in ALLOWED_SEQ_SCANS:
+                continue
+            if sizes.get(relation, 0) >= SEQ_SCAN_MIN_ROWS:
+                failures.append('%s: Seq Scan по %s (%d строк), фильтр: %s' % (key, relation, sizes[relation], node.get('Filter', '—')))
+                suggestion = suggest_index(node)
+                if suggestion and suggestion not in suggestions:
+                    suggestions.append(suggestion)
+        before = baseline.get(key)
+        if before and top['Total Cost'] > before['cost'] * COST_TOLERANCE:
+            failures.append('%s: стоимость %.1f против %.1f в базовой линии' % (key, top['Total Cost'], before['cost']))
+    return results, failures, suggestions
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('seed', 'check', 'record'):
+        sys.exit(__doc__)
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    if sys.argv[1] == 'seed':
+        seed(conn, int(sys.argv[2]) if len(sys.argv) > 2 else 1)
+        return
+    index.CONFIG['database_url'] = os.environ['DATABASE_URL']
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.execute(CONTEXT)
+    ctx = cur.fetchone()
+    conn.rollback()
+    if not ctx:
+        sys.exit('Нет данных — сначала запустите seed')
+    ctx = dict(ctx)
+    cur.execute("SELECT username FROM users WHERE id = %s" % ctx['other'])
+    ctx['other_username'] = cur.fetchone()['username']
+    conn.rollback()
+    baseline = {}
+    if sys.argv[1] == 'check' and os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+    results, failures, suggestions = check(conn, capture(ctx), baseline)
+    conn.close()
+    if sys.argv[1] == 'record':
+        with open(BASELINE, 'w') as f:
+            json.dump(results, f, ensure_ascii=False, indent=1, sort_keys=True)
+        print('Базовая линия записана: %s запросов' % len(results))
+    if failures:
+        print('\nРегрессии планов:')
+        for line in failures:
+            print('  ' + line)
+    if suggestions:
+        print('\nИндексы для новой миграции:')
+        for line in suggestions:
+            print('  ' + line)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
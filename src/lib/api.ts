@@ -13,6 +13,15 @@ export function setAuth(token: string, userId: string) {
   localStorage.setItem("buzzy_user_id", userId);
 }
 
+let lastWriteToken: string | null = null;
+
+function rememberWrite(res: Response) {
+  const token = res.headers.get("X-Write-Token");
+  if (token) {
+    lastWriteToken = token;
+  }
+}
+
 export function clearAuth() {
   localStorage.removeItem("buzzy_token");
   localStorage.removeItem("buzzy_user_id");
@@ -26,6 +35,9 @@ export async function apiGet<T = unknown>(path: string): Promise<T> {
   if (token) {
     headers["Authorization"] = `Bearer ${token}`;
   }
+  if (lastWriteToken) {
+    headers["X-Read-After"] = lastWriteToken;
+  }
   const res = await fetch(`${API_URL}${path}`, { method: "GET", headers });
   if (!res.ok) {
     const err = await res.json().catch(() => ({ error: "Network error" }));
@@ -51,9 +63,28 @@ export async function apiPost<T = unknown>(path: string, body?: Record<string, u
     const err = await res.json().catch(() => ({ error: "Network error" }));
     throw new Error(err.error || err.detail || err.message || `Error ${res.status}`);
   }
+  rememberWrite(res);
   return res.json();
 }
 
+export interface BatchRequest {
+  id?: string;
+  method?: "GET" | "POST";
+  path: string;
+  body?: Record<string, unknown>;
+}
+
+export interface BatchResponse<T = unknown> {
+  id?: string;
+  status: number;
+  body: T;
+}
+
+export async function apiBatch(requests: BatchRequest[], parallel = false): Promise<BatchResponse[]> {
+  const data = await apiPost<{ responses: BatchResponse[] }>("/batch", { requests, parallel });
+  return data.responses;
+}
+
 export async function apiUpload<T = unknown>(path: string, formData: FormData): Promise<T> {
   const token = getToken();
   const headers: Record<string, string> = {};
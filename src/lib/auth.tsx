@@ -26,12 +26,12 @@ interface User {
   following_count: number;
   posts_count: number;
   privacy: {
-    who_sees_likes: string;
-    who_sees_reposts: string;
-    who_sees_followers: string;
-    who_sees_following: string;
-    who_sees_friends: string;
-    who_can_message: string;
+    show_likes: string;
+    show_reposts: string;
+    show_followers: string;
+    show_following: string;
+    show_friends: string;
+    allow_messages: string;
   };
   created_at: string;
 }
@@ -8,7 +8,7 @@ import { Tabs, TabsList, TabsTrigger, TabsContent } from "@/components/ui/tabs";
 import { Badge } from "@/components/ui/badge";
 import Icon from "@/components/ui/icon";
 import { useAuth } from "@/lib/auth";
-import { apiGet, apiPost, apiUpload } from "@/lib/api";
+import { apiBatch, apiPost, apiUpload, type BatchResponse } from "@/lib/api";
 import { toast } from "sonner";
 import { formatDate } from "@/lib/format";
 
@@ -74,12 +74,20 @@ export default function Admin() {
 
   const loadData = async () => {
     try {
-      const [statsData, reportsData, verifData, appealsData] = await Promise.all([
-        apiGet("/admin/stats").catch(() => null),
-        apiGet("/admin/reports").catch(() => ({ reports: [] })),
-        apiGet("/admin/verifications").catch(() => ({ verifications: [] })),
-        apiGet("/admin/appeals").catch(() => ({ appeals: [] })),
-      ]);
+      const [statsRes, reportsRes, verifRes, appealsRes] = await apiBatch(
+        [
+          { path: "/admin/stats" },
+          { path: "/admin/reports" },
+          { path: "/admin/verifications" },
+          { path: "/admin/appeals" },
+        ],
+        true,
+      );
+      const ok = (r: BatchResponse, fallback: unknown) => (r.status === 200 ? r.body : fallback);
+      const statsData = ok(statsRes, null);
+      const reportsData = ok(reportsRes, { reports: [] });
+      const verifData = ok(verifRes, { verifications: [] });
+      const appealsData = ok(appealsRes, { appeals: [] });
       if (statsData) setStats(statsData);
       setReports(reportsData.reports || reportsData || []);
       setVerifications(verifData.verifications || verifData || []);
@@ -50,6 +50,7 @@ export default function Chat() {
   const [pinnedMessages, setPinnedMessages] = useState<Message[]>([]);
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const intervalRef = useRef<ReturnType<typeof setInterval> | null>(null);
+  const syncVersionRef = useRef<number | null>(null);
 
   const fetchMessages = async () => {
     try {
@@ -64,15 +65,30 @@ export default function Chat() {
     }
   };
 
+  // Cheap version probe: full messages are refetched only when the conversation changed
+  const checkForUpdates = async () => {
+    try {
+      const since = syncVersionRef.current ?? 0;
+      const data = await apiGet(`/sync/state?user_id=${userId}&since=${since}`);
+      const changed = syncVersionRef.current !== null && (data.conversations || []).length > 0;
+      syncVersionRef.current = data.version ?? since;
+      if (changed) fetchMessages();
+    } catch {
+      // silent
+    }
+  };
+
   useEffect(() => {
     if (!userId) return;
+    syncVersionRef.current = null;
     fetchMessages();
+    checkForUpdates();
 
     // Mark as read
     apiPost("/messages/read", { user_id: userId }).catch(() => {});
 
     // Poll for new messages
-    intervalRef.current = setInterval(fetchMessages, 5000);
+    intervalRef.current = setInterval(checkForUpdates, 5000);
     return () => {
       if (intervalRef.current) clearInterval(intervalRef.current);
     };
@@ -87,6 +87,7 @@ export default function Notifications() {
       case "follow": return "UserPlus";
       case "repost": return "Repeat2";
       case "message": return "Mail";
+      case "mention": return "AtSign";
       default: return "Bell";
     }
   };
@@ -98,6 +99,7 @@ export default function Notifications() {
       case "follow": return "подписался(ась) на вас";
       case "repost": return "сделал(а) репост";
       case "message": return "отправил(а) вам сообщение";
+      case "mention": return "упомянул(а) вас в посте";
       default: return n.text || "уведомление";
     }
   };
@@ -36,12 +36,12 @@ export default function Settings() {
 
   // Privacy settings
   const [privacy, setPrivacy] = useState(user?.privacy || {
-    who_sees_likes: "everyone",
-    who_sees_reposts: "everyone",
-    who_sees_followers: "everyone",
-    who_sees_following: "everyone",
-    who_sees_friends: "everyone",
-    who_can_message: "everyone",
+    show_likes: "all",
+    show_reposts: "all",
+    show_followers: "all",
+    show_following: "all",
+    show_friends: "all",
+    allow_messages: "all",
   });
 
   const handleThemeChange = (theme: ThemeKey) => {
@@ -92,8 +92,9 @@ export default function Settings() {
   };
 
   const privacyOptions = [
-    { value: "everyone", label: "Все" },
+    { value: "all", label: "Все" },
     { value: "followers", label: "Подписчики" },
+    { value: "mutual", label: "Друзья" },
     { value: "nobody", label: "Никто" },
   ];
 
@@ -151,17 +152,17 @@ export default function Settings() {
           </CardHeader>
           <CardContent className="space-y-4">
             {[
-              { key: "who_sees_likes", label: "Кто видит лайки" },
-              { key: "who_sees_reposts", label: "Кто видит репосты" },
-              { key: "who_sees_followers", label: "Кто видит подписчиков" },
-              { key: "who_sees_following", label: "Кто видит подписки" },
-              { key: "who_sees_friends", label: "Кто видит друзей" },
-              { key: "who_can_message", label: "Кто может писать" },
+              { key: "show_likes", label: "Кто видит лайки" },
+              { key: "show_reposts", label: "Кто видит репосты" },
+              { key: "show_followers", label: "Кто видит подписчиков" },
+              { key: "show_following", label: "Кто видит подписки" },
+              { key: "show_friends", label: "Кто видит друзей" },
+              { key: "allow_messages", label: "Кто может писать" },
             ].map(({ key, label }) => (
               <div key={key} className="flex items-center justify-between">
                 <span className="text-sm">{label}</span>
                 <Select
-                  value={(privacy as Record<string, string>)[key] || "everyone"}
+                  value={(privacy as Record<string, string>)[key] || "all"}
                   onValueChange={(v) => handlePrivacyChange(key, v)}
                 >
                   <SelectTrigger className="w-[140px] h-8">